@@ -1,19 +1,75 @@
+import asyncio
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo.read_concern import ReadConcern
+from pymongo.read_preferences import SecondaryPreferred
 from .settings import settings
+from .utils.mongo_monitoring import command_listener, pool_stats
+from .utils.metrics import command_metrics
 
 _client: AsyncIOMotorClient | None = None
 _db: AsyncIOMotorDatabase | None = None
+_handles: dict[str, AsyncIOMotorDatabase] = {}
+
+def _client_options() -> dict:
+    options = {
+        "maxPoolSize": settings.mongodb_max_pool_size,
+        "minPoolSize": settings.mongodb_min_pool_size,
+        "serverSelectionTimeoutMS": settings.mongodb_server_selection_timeout_ms,
+        "connectTimeoutMS": settings.mongodb_connect_timeout_ms,
+        "socketTimeoutMS": settings.mongodb_socket_timeout_ms or None,
+        "maxIdleTimeMS": settings.mongodb_max_idle_time_ms or None,
+        "event_listeners": [pool_stats],
+    }
+    if settings.metrics_enabled:
+        options["event_listeners"].append(command_metrics)
+    if settings.request_profiling:
+        options["event_listeners"].append(command_listener)
+    if settings.mongodb_compressors:
+        # Negotiated with the server; pymongo skips codecs whose package is missing
+        options["compressors"] = settings.mongodb_compressors
+    return options
 
 async def get_db() -> AsyncIOMotorDatabase:
     global _client, _db
     if _db is None:
-        _client = AsyncIOMotorClient(settings.mongodb_uri)
+        _client = AsyncIOMotorClient(settings.mongodb_uri, **_client_options())
         _db = _client[settings.mongodb_db]
     return _db
 
+def _secondary_handle(name: str, max_staleness: int) -> AsyncIOMotorDatabase:
+    # Handles share the client and its pool; only the read routing differs.
+    # Writes through them still go to the primary.
+    if name not in _handles:
+        _handles[name] = _client.get_database(
+            settings.mongodb_db,
+            read_preference=SecondaryPreferred(max_staleness=max_staleness),
+            read_concern=ReadConcern("local"),
+        )
+    return _handles[name]
+
+async def get_analytics_db() -> AsyncIOMotorDatabase:
+    """Dashboards: may lag the primary by up to MONGODB_ANALYTICS_MAX_STALENESS seconds."""
+    await get_db()
+    return _secondary_handle("analytics", settings.mongodb_analytics_max_staleness)
+
+async def get_search_db() -> AsyncIOMotorDatabase:
+    """Public listing search; read-your-writes paths keep using get_db (primary)."""
+    await get_db()
+    return _secondary_handle("search", settings.mongodb_search_max_staleness)
+
+async def warm_up_pool() -> None:
+    """Open connections before traffic arrives instead of on the first requests.
+
+    Concurrent pings each need their own connection, so the pool grows to
+    MONGODB_MIN_POOL_SIZE right away; minPoolSize then keeps it there.
+    """
+    db = await get_db()
+    await asyncio.gather(*(db.command("ping") for _ in range(max(1, settings.mongodb_min_pool_size))))
+
 async def close_db():
     global _client, _db
     if _client is not None:
         _client.close()
         _client = None
         _db = None
+        _handles.clear()
@@ -1,8 +1,22 @@
-from fastapi import FastAPI
+import asyncio
+import hmac
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from .db import get_db, close_db
-from .routers import listings, auth, profiles, matching, favorites, reports, upload, analytics, connections, notifications
+from pymongo.errors import OperationFailure
+from .db import get_db, close_db, warm_up_pool
+from .utils.mongo_monitoring import pool_stats
+from .routers import listings, auth, profiles, matching, favorites, reports, upload, analytics, connections, notifications, profiling
 from .settings import settings
+from .utils.analytics_snapshots import run_snapshot_refresher
+from .utils.daily_stats import run_rollup_scheduler
+from .utils import passwords, uploads, verification
+from .utils.request_profiling import RequestProfilingMiddleware
+from .utils import metrics
+from .utils.loop_watchdog import LoopWatchdog, WatchdogMiddleware
+from .utils.profiler import ProfilerMiddleware
+from .migrations import check_schema
+from .security import check_secret
 
 app = FastAPI(title="Trọ hub")
 app.add_middleware(
@@ -11,31 +25,56 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Lets browser devtools show Server-Timing on cross-origin calls
+    expose_headers=["Server-Timing"] if settings.request_profiling else [],
 )
+app.add_middleware(ProfilerMiddleware)
+if settings.request_profiling:
+    app.add_middleware(RequestProfilingMiddleware)
+if settings.metrics_enabled:
+    app.add_middleware(metrics.MetricsMiddleware)
+if settings.loop_watchdog:
+    app.add_middleware(WatchdogMiddleware)
 
 @app.on_event("startup")
 async def startup():
+    check_secret()
     db = await get_db()
+    await warm_up_pool()
     
-    await db.listings.create_index([("location", "2dsphere")])
-    
+    await check_schema(db)
     try:
-        await db.listings.drop_index("title_text_desc_text")
-    except Exception:
-        pass
-    await db.listings.create_index([("title", "text"), ("desc", "text"), ("address", "text")])
-    
-    await db.users.create_index("email", unique=True)
-    await db.profiles.create_index([("user_id", 1)], unique=True)
-    await db.profiles.create_index([("budget", 1)])
-    await db.favorites.create_index([("user_id", 1), ("listing_id", 1)], unique=True)
-    await db.reports.create_index([("listing_id", 1)])
-    await db.connections.create_index([("from_user_id", 1), ("listing_id", 1)], unique=True)
-    await db.connections.create_index([("to_user_id", 1)])
-    await db.notifications.create_index([("user_id", 1), ("read", 1)])
+        await verification.sync_ttl(db)
+    except OperationFailure as e:
+        print(f"[auth] Could not update the verification token TTL index: {e}")
+
+    app.state.background_tasks = []
+    if settings.loop_watchdog:
+        app.state.loop_watchdog = LoopWatchdog(settings.loop_watchdog_threshold_ms)
+        app.state.loop_watchdog.start()
+    if settings.metrics_enabled:
+        if not settings.metrics_token:
+            print("[metrics] METRICS_TOKEN is empty; /metrics is open to anyone who can reach this port")
+        app.state.background_tasks.append(asyncio.create_task(
+            metrics.run_loop_lag_monitor(settings.loop_lag_interval)
+        ))
+    if settings.analytics_refresh_interval > 0:
+        app.state.background_tasks.append(asyncio.create_task(
+            run_snapshot_refresher(db, analytics.SNAPSHOT_BUILDERS, settings.analytics_refresh_interval)
+        ))
+    if settings.daily_rollup_interval > 0:
+        app.state.background_tasks.append(asyncio.create_task(
+            run_rollup_scheduler(db, settings.daily_rollup_interval)
+        ))
 
 @app.on_event("shutdown")
 async def shutdown():
+    for task in getattr(app.state, "background_tasks", []):
+        task.cancel()
+    if getattr(app.state, "loop_watchdog", None):
+        app.state.loop_watchdog.stop()
+    passwords.shutdown()
+    uploads.shutdown()
     await close_db()
 
 app.include_router(listings.router)
@@ -48,7 +87,19 @@ app.include_router(upload.router)
 app.include_router(analytics.router)
 app.include_router(connections.router)
 app.include_router(notifications.router)
+app.include_router(profiling.router)
 
 @app.get("/healthz")
 async def healthz():
-    return {"ok": True}
+    health = {"ok": True, "password_hashing": passwords.stats(), "mongo_pool": pool_stats.stats()}
+    if getattr(app.state, "loop_watchdog", None):
+        health["loop_blocked"] = app.state.loop_watchdog.stats()
+    return health
+
+if settings.metrics_enabled:
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics_endpoint(authorization: str = Header("")):
+        expected = f"Bearer {settings.metrics_token}".encode()
+        if settings.metrics_token and not hmac.compare_digest(authorization.encode(), expected):
+            raise HTTPException(401, "Thiếu hoặc sai metrics token", headers={"WWW-Authenticate": "Bearer"})
+        return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,242 @@
+"""Versioned schema/index migrations.
+
+Applied steps are recorded in the `_migrations` collection ({_id: version,
+name, applied_at, duration_ms}) next to a lease document ({_id: "lock"}) that
+makes sure only one process applies them. Run before starting the app:
+
+    python -m app.migrations            # apply pending steps
+    python -m app.migrations --status   # list applied/pending steps
+"""
+import argparse
+import asyncio
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, List, Tuple
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError, OperationFailure
+from .db import get_db, close_db
+from .settings import settings
+from .utils import verification
+
+Migration = Tuple[int, str, Callable[..., Awaitable[None]]]
+
+LOCK_ID = "lock"
+
+
+async def _create_index(collection, keys, **kwargs) -> None:
+    # background is a no-op on MongoDB >= 4.2 (builds only lock at start and end) but keeps older servers online
+    await collection.create_index(keys, background=True, **kwargs)
+
+
+async def _base_indexes(db) -> None:
+    await _create_index(db.listings, [("location", "2dsphere")])
+    try:
+        await db.listings.drop_index("title_text_desc_text")
+    except OperationFailure:
+        pass
+    await _create_index(db.listings, [("title", "text"), ("desc", "text"), ("address", "text")])
+    await _create_index(db.users, "email", unique=True)
+    await _create_index(db.profiles, [("user_id", 1)], unique=True)
+    await _create_index(db.profiles, [("budget", 1)])
+    await _create_index(db.favorites, [("user_id", 1), ("listing_id", 1)], unique=True)
+    await _create_index(db.reports, [("listing_id", 1)])
+    await _create_index(db.connections, [("from_user_id", 1), ("listing_id", 1)], unique=True)
+    await _create_index(db.connections, [("to_user_id", 1)])
+    await _create_index(db.notifications, [("user_id", 1), ("read", 1)])
+
+
+async def _analytics_indexes(db) -> None:
+    await _create_index(db.listings, [("verified_at", 1)])
+    await _create_index(db.listings, [("status", 1), ("verification_status", 1), ("geohash", 1), ("price", 1)])
+    await _create_index(db.listings, [("updated_at", 1)])
+    await _create_index(db.listing_daily_stats, [("dimension", 1), ("key", 1), ("day", 1)])
+    await _create_index(db.listing_daily_stats, [("dimension", 1), ("day", 1)])
+
+
+async def _auth_and_media_indexes(db) -> None:
+    await _create_index(db.rate_limits, [("expires_at", 1)], expireAfterSeconds=0)
+    await verification.ensure_indexes(db)
+    await _create_index(db.media, [("url", 1)])
+
+
+async def _list_sort_indexes(db) -> None:
+    # Equality prefix + sort key, so paged lists walk the index instead of sorting in memory
+    await _create_index(db.listings, [("owner_id", 1), ("_id", -1)])
+    await _create_index(db.favorites, [("user_id", 1), ("_id", -1)])
+    await _create_index(db.connections, [("from_user_id", 1), ("created_at", -1)])
+    await _create_index(db.connections, [("to_user_id", 1), ("created_at", -1)])
+    await _create_index(db.connections, [("listing_id", 1), ("created_at", -1)])
+    await _create_index(db.notifications, [("user_id", 1), ("created_at", -1)])
+    await _create_index(db.reports, [("status", 1), ("created_at", -1)])
+
+
+async def backfill_favorite_counts(db) -> None:
+    """Set listings.favorite_count from the favorites collection (add/remove keep it current afterwards)."""
+    ops = []
+    async for doc in db.favorites.aggregate([{"$group": {"_id": "$listing_id", "count": {"$sum": 1}}}]):
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"favorite_count": doc["count"]}}))
+        if len(ops) >= 1000:
+            await db.listings.bulk_write(ops, ordered=False)
+            ops = []
+    if ops:
+        await db.listings.bulk_write(ops, ordered=False)
+
+
+async def _snapshot_expiry(db) -> None:
+    # Heatmap snapshots from before `cell`/`expires_at` existed would never expire; they rebuild on demand
+    await db.analytics_snapshots.delete_many({"name": "heatmap"})
+    await _create_index(db.analytics_snapshots, [("expires_at", 1)], expireAfterSeconds=0)
+    await _create_index(db.analytics_snapshots, [("cell", 1)])
+
+
+async def _user_state_indexes(db) -> None:
+    # /listings/user-state: the caller's OPEN reports among one page of listings
+    await _create_index(db.reports, [("reporter_id", 1), ("listing_id", 1), ("status", 1)])
+
+
+# Append only; never renumber or edit a step that may have run somewhere
+MIGRATIONS: List[Migration] = [
+    (1, "base indexes", _base_indexes),
+    (2, "analytics indexes", _analytics_indexes),
+    (3, "auth and media indexes", _auth_and_media_indexes),
+    (4, "list sort indexes", _list_sort_indexes),
+    (5, "favorite counts", backfill_favorite_counts),
+    (6, "analytics snapshot expiry", _snapshot_expiry),
+    (7, "user state indexes", _user_state_indexes),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+async def current_version(db) -> int:
+    doc = await db._migrations.find_one({"_id": {"$type": "number"}}, sort=[("_id", -1)])
+    return doc["_id"] if doc else 0
+
+
+async def _acquire_lock(db, owner: str) -> bool:
+    now = datetime.utcnow()
+    try:
+        # Matches only an expired lease; with no lease the upsert inserts one,
+        # and with a live lease it collides on _id
+        await db._migrations.update_one(
+            {"_id": LOCK_ID, "expires_at": {"$lt": now}},
+            {"$set": {"owner": owner, "expires_at": now + timedelta(seconds=settings.migration_lock_ttl)}},
+            upsert=True,
+        )
+        return True
+    except DuplicateKeyError:
+        return False
+
+
+async def _renew_lock(db, owner: str) -> bool:
+    """Push our lease's expiry forward; False once another process has taken it over."""
+    result = await db._migrations.update_one(
+        {"_id": LOCK_ID, "owner": owner},
+        {"$set": {"expires_at": datetime.utcnow() + timedelta(seconds=settings.migration_lock_ttl)}},
+    )
+    return result.matched_count == 1
+
+
+class LockLost(RuntimeError):
+    pass
+
+
+async def _run_step(db, owner: str, step: Callable[..., Awaitable[None]]) -> None:
+    """Run one step, renewing the lease every third of its TTL until it finishes.
+
+    An index build or backfill can outlast MIGRATION_LOCK_TTL; without the
+    renewals a parallel runner would take the expired lease and apply steps
+    concurrently.
+    """
+    task = asyncio.ensure_future(step(db))
+    interval = settings.migration_lock_ttl / 3
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=interval)
+        if done:
+            return task.result()
+        if not await _renew_lock(db, owner):
+            task.cancel()
+            raise LockLost("migration lock was taken over while a step was running")
+
+
+async def _release_lock(db, owner: str) -> None:
+    await db._migrations.delete_one({"_id": LOCK_ID, "owner": owner})
+
+
+async def migrate(db, wait: float = 0) -> int:
+    """Apply pending migrations under the leader lock; returns how many were applied.
+
+    When another process holds the lock, poll for up to `wait` seconds and
+    return 0 if it is still busy. The lease is renewed before and during each
+    step; raises LockLost, without applying further steps, if it was lost.
+    """
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    deadline = time.monotonic() + wait
+    while not await _acquire_lock(db, owner):
+        if time.monotonic() >= deadline:
+            return 0
+        await asyncio.sleep(1)
+
+    applied = 0
+    try:
+        version = await current_version(db)
+        for number, name, step in MIGRATIONS:
+            if number <= version:
+                continue
+            if not await _renew_lock(db, owner):
+                raise LockLost("migration lock expired before the next step")
+            print(f"[migrations] Applying {number}: {name}")
+            started = time.perf_counter()
+            await _run_step(db, owner, step)
+            await db._migrations.insert_one({
+                "_id": number,
+                "name": name,
+                "applied_at": datetime.utcnow(),
+                "duration_ms": round((time.perf_counter() - started) * 1000),
+            })
+            applied += 1
+    finally:
+        await _release_lock(db, owner)
+    return applied
+
+
+async def check_schema(db) -> int:
+    """Startup check: one read, unless MIGRATE_ON_STARTUP asks for the (locked) runner."""
+    version = await current_version(db)
+    if version < LATEST_VERSION and settings.migrate_on_startup:
+        await migrate(db, wait=settings.migration_lock_ttl)
+        version = await current_version(db)
+    if version < LATEST_VERSION:
+        print(f"[migrations] Schema is at version {version}, code expects {LATEST_VERSION}; run `python -m app.migrations`")
+    elif version > LATEST_VERSION:
+        print(f"[migrations] Schema version {version} is newer than this code ({LATEST_VERSION})")
+    return version
+
+
+async def _status(db) -> None:
+    applied = {doc["_id"]: doc async for doc in db._migrations.find({"_id": {"$type": "number"}})}
+    for number, name, _ in MIGRATIONS:
+        doc = applied.get(number)
+        state = f"applied {doc['applied_at'].isoformat()} ({doc.get('duration_ms', 0)} ms)" if doc else "pending"
+        print(f"{number:>4}  {name:<30} {state}")
+
+
+async def _main(args: argparse.Namespace) -> None:
+    db = await get_db()
+    try:
+        if args.status:
+            await _status(db)
+            return
+        applied = await migrate(db, wait=args.wait)
+        print(f"[migrations] {applied} applied, schema at version {await current_version(db)}")
+    finally:
+        await close_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply schema and index migrations")
+    parser.add_argument("--status", action="store_true", help="list applied and pending migrations")
+    parser.add_argument("--wait", type=float, default=600, help="seconds to wait for another runner's lock")
+    asyncio.run(_main(parser.parse_args()))
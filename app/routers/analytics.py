@@ -1,12 +1,36 @@
-from fastapi import APIRouter, Depends
-from typing import Any, Dict, List
-from bson import ObjectId
-from ..db import get_db
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import Any, Dict, List, Optional, Tuple
+from datetime import date, datetime, timedelta
+from ..db import get_analytics_db, get_db
+from ..security import CurrentUser, get_optional_user
+from ..utils.analytics_snapshots import get_snapshot, get_fresh_snapshot
+from ..utils.daily_stats import DISTRICT_EXPR, DIMENSIONS, local_today, query_timeseries
+from ..utils import geohash
+from ..settings import settings
+import asyncio
+import math
 
 router = APIRouter(prefix="/analytics", tags=["analytics"])
 
-@router.get("/overview", summary="Get overview statistics of all listings")
-async def get_overview_analytics(db = Depends(get_db)):
+OVERVIEW_PRICE_BOUNDARIES = [0, 1000000, 2000000, 3000000, 4000000, 5000000, 10000000, 50000000]
+OVERVIEW_AREA_BOUNDARIES = [0, 15, 20, 25, 30, 40, 50, 100]
+TRENDS_PRICE_BOUNDARIES = [0, 1000000, 2000000, 3000000, 4000000, 5000000, 10000000]
+TRENDS_AREA_BOUNDARIES = [0, 15, 20, 25, 30, 40, 50]
+
+AMENITY_LABELS = {
+    "ac": "Điều hòa",
+    "wifi": "Wifi",
+    "parking": "Chỗ để xe",
+    "water_heater": "Nóng lạnh",
+    "kitchen": "Bếp",
+    "washing_machine": "Máy giặt",
+    "fridge": "Tủ lạnh",
+    "security": "An ninh 24/7",
+    "private_room": "Phòng riêng",
+    "balcony": "Ban công"
+}
+
+async def _build_overview_analytics(db) -> Dict[str, Any]:
     """
     Get comprehensive analytics including:
     - Total listings, active, rented, hidden
@@ -46,7 +70,7 @@ async def get_overview_analytics(db = Depends(get_db)):
         {"$match": {"status": "ACTIVE", "verification_status": "VERIFIED"}},
         {"$bucket": {
             "groupBy": "$price",
-            "boundaries": [0, 1000000, 2000000, 3000000, 4000000, 5000000, 10000000, 50000000],
+            "boundaries": OVERVIEW_PRICE_BOUNDARIES,
             "default": "50000000+",
             "output": {"count": {"$sum": 1}}
         }}
@@ -57,7 +81,7 @@ async def get_overview_analytics(db = Depends(get_db)):
         {"$match": {"status": "ACTIVE", "verification_status": "VERIFIED"}},
         {"$bucket": {
             "groupBy": "$area",
-            "boundaries": [0, 15, 20, 25, 30, 40, 50, 100],
+            "boundaries": OVERVIEW_AREA_BOUNDARIES,
             "default": "100+",
             "output": {"count": {"$sum": 1}}
         }}
@@ -98,8 +122,7 @@ async def get_overview_analytics(db = Depends(get_db)):
         "verification_status": verification_status
     }
 
-@router.get("/by-location", summary="Get listings distribution by location/area")
-async def get_location_analytics(db = Depends(get_db)):
+async def _build_location_analytics(db) -> Dict[str, Any]:
     """
     Get analytics grouped by address (district/ward level)
     Returns areas with most listings
@@ -111,23 +134,7 @@ async def get_location_analytics(db = Depends(get_db)):
             "verification_status": "VERIFIED",
             "address": {"$exists": True, "$ne": ""}
         }},
-        {"$addFields": {
-            "address_parts": {"$split": ["$address", ", "]},
-        }},
-        {"$addFields": {
-            "district": {
-                "$cond": {
-                    "if": {"$gte": [{"$size": "$address_parts"}, 2]},
-                    "then": {
-                        "$arrayElemAt": [
-                            "$address_parts",
-                            {"$subtract": [{"$size": "$address_parts"}, 2]}
-                        ]
-                    },
-                    "else": {"$arrayElemAt": ["$address_parts", 0]}
-                }
-            }
-        }},
+        {"$addFields": {"district": DISTRICT_EXPR}},
         {"$group": {
             "_id": "$district",
             "count": {"$sum": 1},
@@ -157,104 +164,116 @@ async def get_location_analytics(db = Depends(get_db)):
         ]
     }
 
-@router.get("/by-price-range", summary="Get detailed price range analytics")
-async def get_price_range_analytics(db = Depends(get_db)):
+DEFAULT_PRICE_BOUNDARIES = [0, 1000000, 2000000, 3000000, 4000000, 5000000, 10000000, 100000000]
+DEFAULT_AREA_BOUNDARIES = [0, 15, 20, 25, 30, 40, 50, 1000]
+MAX_BOUNDARIES = 50
+
+def parse_boundaries(raw: Optional[str]) -> Optional[List[float]]:
+    """Parse a comma-separated, strictly increasing list of bucket boundaries."""
+    if not raw:
+        return None
+    try:
+        values = [float(x) for x in raw.split(",") if x.strip()]
+    except ValueError:
+        raise HTTPException(400, "Mốc phân khoảng phải là số, cách nhau bởi dấu phẩy")
+    # float() also accepts nan and inf, which $bucket rejects and JSON cannot carry
+    if not all(math.isfinite(v) for v in values):
+        raise HTTPException(400, "Mốc phân khoảng phải là số, cách nhau bởi dấu phẩy")
+    if len(values) < 2 or len(values) > MAX_BOUNDARIES:
+        raise HTTPException(400, f"Cần từ 2 đến {MAX_BOUNDARIES} mốc phân khoảng")
+    if any(hi <= lo for lo, hi in zip(values, values[1:])):
+        raise HTTPException(400, "Mốc phân khoảng phải tăng dần")
+    return [int(v) if v.is_integer() else v for v in values]
+
+def _bucket_label(lo: float, hi: float, first: bool, open_ended: bool, scale: float, unit: str) -> str:
+    fmt = lambda v: f"{v / scale:g}"
+    if first and lo == 0:
+        return f"Dưới {fmt(hi)}{unit}"
+    if open_ended:
+        return f"Trên {fmt(lo)}{unit}"
+    return f"{fmt(lo)}-{fmt(hi)}{unit}"
+
+async def _bucket_breakdown(db, field: str, boundaries: List[float], avg_field: str, open_ended: bool) -> Tuple[List[Dict[str, Any]], int]:
+    """Count and average `avg_field` per [lo, hi) bucket of `field` in one $bucket pass.
+
+    Also returns how many listings fell outside the boundaries (or have no `field`).
+    """
+    pipeline = [
+        {"$match": {"status": "ACTIVE", "verification_status": "VERIFIED"}},
+        {"$bucket": {
+            "groupBy": f"${field}",
+            "boundaries": boundaries,
+            "default": "other",
+            "output": {"count": {"$sum": 1}, "avg": {"$avg": f"${avg_field}"}}
+        }}
+    ]
+    buckets = {doc["_id"]: doc async for doc in db.listings.aggregate(pipeline)}
+    counts = [buckets.get(lo, {}).get("count", 0) for lo in boundaries[:-1]]
+    avgs = [buckets.get(lo, {}).get("avg") or 0 for lo in boundaries[:-1]]
+    return _bucket_rows(boundaries, counts, avgs, open_ended), buckets.get("other", {}).get("count", 0)
+
+def _bucket_rows(boundaries: List[float], counts: List[int], avgs: List[float], open_ended: bool) -> List[Dict[str, Any]]:
+    """`open_ended` labels the last bucket "above lo"; only the built-in sets end at a catch-all bound."""
+    return [
+        {
+            "min": lo,
+            "max": hi,
+            "first": i == 0,
+            "open": open_ended and i == len(boundaries) - 2,
+            "count": int(counts[i]),
+            "avg": float(avgs[i])
+        }
+        for i, (lo, hi) in enumerate(zip(boundaries, boundaries[1:]))
+    ]
+
+async def _build_price_range_analytics(db, boundaries: Optional[List[float]] = None) -> Dict[str, Any]:
     """
     Get detailed breakdown of listings by price ranges
     """
     
-    price_ranges = [
-        {"label": "Dưới 1 triệu", "min": 0, "max": 1000000},
-        {"label": "1-2 triệu", "min": 1000000, "max": 2000000},
-        {"label": "2-3 triệu", "min": 2000000, "max": 3000000},
-        {"label": "3-4 triệu", "min": 3000000, "max": 4000000},
-        {"label": "4-5 triệu", "min": 4000000, "max": 5000000},
-        {"label": "5-10 triệu", "min": 5000000, "max": 10000000},
-        {"label": "Trên 10 triệu", "min": 10000000, "max": 100000000}
-    ]
-    
-    results = []
-    for range_def in price_ranges:
-        count = await db.listings.count_documents({
-            "status": "ACTIVE",
-            "verification_status": "VERIFIED",
-            "price": {"$gte": range_def["min"], "$lt": range_def["max"]}
-        })
-        
-        avg_pipeline = [
-            {"$match": {
-                "status": "ACTIVE",
-                "verification_status": "VERIFIED",
-                "price": {"$gte": range_def["min"], "$lt": range_def["max"]}
-            }},
-            {"$group": {
-                "_id": None,
-                "avg_area": {"$avg": "$area"}
-            }}
-        ]
-        avg_result = await db.listings.aggregate(avg_pipeline).to_list(length=1)
-        avg_area = round(avg_result[0]["avg_area"], 2) if avg_result else 0
-        
-        results.append({
-            "label": range_def["label"],
-            "min_price": range_def["min"],
-            "max_price": range_def["max"],
-            "count": count,
-            "avg_area": avg_area
-        })
-    
-    return {"price_ranges": results}
+    buckets, other = await _bucket_breakdown(db, "price", boundaries or DEFAULT_PRICE_BOUNDARIES, "area", boundaries is None)
+    return _price_ranges_payload(buckets, other)
 
-@router.get("/by-area-range", summary="Get detailed area range analytics")
-async def get_area_range_analytics(db = Depends(get_db)):
+def _price_ranges_payload(buckets: List[Dict[str, Any]], other: int) -> Dict[str, Any]:
+    return {
+        "price_ranges": [
+            {
+                "label": _bucket_label(b["min"], b["max"], b["first"], b["open"], 1000000, " triệu"),
+                "min_price": b["min"],
+                "max_price": b["max"],
+                "count": b["count"],
+                "avg_area": round(b["avg"], 2)
+            }
+            for b in buckets
+        ],
+        # listings outside the boundaries (e.g. above the last one) or without a value
+        "other_count": other
+    }
+
+async def _build_area_range_analytics(db, boundaries: Optional[List[float]] = None) -> Dict[str, Any]:
     """
     Get detailed breakdown of listings by area ranges
     """
     
-    area_ranges = [
-        {"label": "Dưới 15m²", "min": 0, "max": 15},
-        {"label": "15-20m²", "min": 15, "max": 20},
-        {"label": "20-25m²", "min": 20, "max": 25},
-        {"label": "25-30m²", "min": 25, "max": 30},
-        {"label": "30-40m²", "min": 30, "max": 40},
-        {"label": "40-50m²", "min": 40, "max": 50},
-        {"label": "Trên 50m²", "min": 50, "max": 1000}
-    ]
-    
-    results = []
-    for range_def in area_ranges:
-        count = await db.listings.count_documents({
-            "status": "ACTIVE",
-            "verification_status": "VERIFIED",
-            "area": {"$gte": range_def["min"], "$lt": range_def["max"]}
-        })
-        
-        avg_pipeline = [
-            {"$match": {
-                "status": "ACTIVE",
-                "verification_status": "VERIFIED",
-                "area": {"$gte": range_def["min"], "$lt": range_def["max"]}
-            }},
-            {"$group": {
-                "_id": None,
-                "avg_price": {"$avg": "$price"}
-            }}
-        ]
-        avg_result = await db.listings.aggregate(avg_pipeline).to_list(length=1)
-        avg_price = round(avg_result[0]["avg_price"], 0) if avg_result else 0
-        
-        results.append({
-            "label": range_def["label"],
-            "min_area": range_def["min"],
-            "max_area": range_def["max"],
-            "count": count,
-            "avg_price": avg_price
-        })
-    
-    return {"area_ranges": results}
+    buckets, other = await _bucket_breakdown(db, "area", boundaries or DEFAULT_AREA_BOUNDARIES, "price", boundaries is None)
+    return _area_ranges_payload(buckets, other)
 
-@router.get("/amenities-stats", summary="Get detailed amenities statistics")
-async def get_amenities_stats(db = Depends(get_db)):
+def _area_ranges_payload(buckets: List[Dict[str, Any]], other: int) -> Dict[str, Any]:
+    return {
+        "area_ranges": [
+            {
+                "label": _bucket_label(b["min"], b["max"], b["first"], b["open"], 1, "m²"),
+                "min_area": b["min"],
+                "max_area": b["max"],
+                "count": b["count"],
+                "avg_price": round(b["avg"], 0)
+            }
+            for b in buckets
+        ],
+        "other_count": other
+    }
+
+async def _build_amenities_stats(db) -> Dict[str, Any]:
     """
     Get comprehensive statistics about amenities usage
     """
@@ -273,24 +292,12 @@ async def get_amenities_stats(db = Depends(get_db)):
     
     amenities_data = [doc async for doc in db.listings.aggregate(amenities_pipeline)]
     
-    amenities_labels = {
-        "ac": "Điều hòa",
-        "wifi": "Wifi",
-        "parking": "Chỗ để xe",
-        "water_heater": "Nóng lạnh",
-        "kitchen": "Bếp",
-        "washing_machine": "Máy giặt",
-        "fridge": "Tủ lạnh",
-        "security": "An ninh 24/7",
-        "private_room": "Phòng riêng",
-        "balcony": "Ban công"
-    }
     
     return {
         "amenities": [
             {
                 "key": doc["_id"],
-                "label": amenities_labels.get(doc["_id"], doc["_id"]),
+                "label": AMENITY_LABELS.get(doc["_id"], doc["_id"]),
                 "count": doc["count"],
                 "avg_price": round(doc["avg_price"], 0),
                 "avg_area": round(doc["avg_area"], 2)
@@ -299,28 +306,28 @@ async def get_amenities_stats(db = Depends(get_db)):
         ]
     }
 
-@router.get("/rules-stats", summary="Get statistics about listing rules")
-async def get_rules_stats(db = Depends(get_db)):
+async def _build_rules_stats(db) -> Dict[str, Any]:
     """
     Get statistics about common rules (pet, smoke, cook, visitor)
     """
     
     rules_keys = ["pet", "smoke", "cook", "visitor"]
-    results = {}
+    group: Dict[str, Any] = {"_id": None}
+    for rule_key in rules_keys:
+        group[f"{rule_key}_allowed"] = {"$sum": {"$cond": [{"$eq": [f"$rules.{rule_key}", True]}, 1, 0]}}
+        group[f"{rule_key}_not_allowed"] = {"$sum": {"$cond": [{"$eq": [f"$rules.{rule_key}", False]}, 1, 0]}}
+    
+    rules_pipeline = [
+        {"$match": {"status": "ACTIVE", "verification_status": "VERIFIED"}},
+        {"$group": group}
+    ]
+    counts = await db.listings.aggregate(rules_pipeline).to_list(length=1)
+    counts = counts[0] if counts else {}
     
+    results = {}
     for rule_key in rules_keys:
-        allowed_count = await db.listings.count_documents({
-            "status": "ACTIVE",
-            "verification_status": "VERIFIED",
-            f"rules.{rule_key}": True
-        })
-        
-        not_allowed_count = await db.listings.count_documents({
-            "status": "ACTIVE",
-            "verification_status": "VERIFIED",
-            f"rules.{rule_key}": False
-        })
-        
+        allowed_count = counts.get(f"{rule_key}_allowed", 0)
+        not_allowed_count = counts.get(f"{rule_key}_not_allowed", 0)
         results[rule_key] = {
             "allowed": allowed_count,
             "not_allowed": not_allowed_count,
@@ -329,8 +336,7 @@ async def get_rules_stats(db = Depends(get_db)):
     
     return {"rules_stats": results}
 
-@router.get("/trends", summary="Get trending insights and recommendations")
-async def get_trends(db = Depends(get_db)):
+async def _build_trends(db) -> Dict[str, Any]:
     """
     Get trending insights like most popular price range, area, amenities combinations
     """
@@ -339,7 +345,7 @@ async def get_trends(db = Depends(get_db)):
         {"$match": {"status": "ACTIVE", "verification_status": "VERIFIED"}},
         {"$bucket": {
             "groupBy": "$price",
-            "boundaries": [0, 1000000, 2000000, 3000000, 4000000, 5000000, 10000000],
+            "boundaries": TRENDS_PRICE_BOUNDARIES,
             "default": "10000000+",
             "output": {"count": {"$sum": 1}}
         }},
@@ -352,7 +358,7 @@ async def get_trends(db = Depends(get_db)):
         {"$match": {"status": "ACTIVE", "verification_status": "VERIFIED"}},
         {"$bucket": {
             "groupBy": "$area",
-            "boundaries": [0, 15, 20, 25, 30, 40, 50],
+            "boundaries": TRENDS_AREA_BOUNDARIES,
             "default": "50+",
             "output": {"count": {"$sum": 1}}
         }},
@@ -368,3 +374,187 @@ async def get_trends(db = Depends(get_db)):
         "most_common_area_range": most_common_area[0] if most_common_area else None,
         "total_active_listings": total_active
     }
+
+SNAPSHOT_BUILDERS = {
+    "overview": _build_overview_analytics,
+    "by-location": _build_location_analytics,
+    "by-price-range": _build_price_range_analytics,
+    "by-area-range": _build_area_range_analytics,
+    "amenities-stats": _build_amenities_stats,
+    "rules-stats": _build_rules_stats,
+    "trends": _build_trends,
+}
+
+async def _serve_snapshot(name: str, db, fresh: bool, current_user: Optional[CurrentUser]) -> Dict[str, Any]:
+    if fresh:
+        if current_user is None:
+            raise HTTPException(401, "Thiếu access token", headers={"WWW-Authenticate": "Bearer"})
+        if not current_user.is_admin:
+            raise HTTPException(403, "Chỉ admin mới có quyền làm mới thống kê")
+    
+    builder = SNAPSHOT_BUILDERS[name]
+    if fresh:
+        # Recompute from the primary; the default handle may read a lagging secondary
+        return await get_fresh_snapshot(await get_db(), name, builder)
+    # With ANALYTICS_REFRESH_INTERVAL=0 no refresher runs, so dirty snapshots are rebuilt on read like lazy ones
+    lazy = settings.analytics_refresh_interval <= 0
+    return await get_snapshot(db, name, builder, lazy=lazy, primary=await get_db())
+
+_FRESH_QUERY = Query(False, description="admin only: recompute instead of serving the snapshot")
+
+@router.get("/overview", summary="Get overview statistics of all listings")
+async def get_overview_analytics(fresh: bool = _FRESH_QUERY, db = Depends(get_analytics_db), current_user: Optional[CurrentUser] = Depends(get_optional_user)):
+    return await _serve_snapshot("overview", db, fresh, current_user)
+
+@router.get("/by-location", summary="Get listings distribution by location/area")
+async def get_location_analytics(fresh: bool = _FRESH_QUERY, db = Depends(get_analytics_db), current_user: Optional[CurrentUser] = Depends(get_optional_user)):
+    return await _serve_snapshot("by-location", db, fresh, current_user)
+
+_BOUNDARIES_QUERY = Query(None, description="comma-separated bucket boundaries, e.g. 0,2000000,4000000,8000000")
+
+@router.get("/by-price-range", summary="Get detailed price range analytics")
+async def get_price_range_analytics(
+    boundaries: Optional[str] = _BOUNDARIES_QUERY,
+    fresh: bool = _FRESH_QUERY,
+    db = Depends(get_analytics_db),
+    current_user: Optional[CurrentUser] = Depends(get_optional_user)
+):
+    custom = parse_boundaries(boundaries)
+    if custom is not None:
+        # Custom histograms are a single $bucket pass, computed live rather than snapshotted
+        return {**await _build_price_range_analytics(db, custom), "generated_at": datetime.utcnow().isoformat()}
+    return await _serve_snapshot("by-price-range", db, fresh, current_user)
+
+@router.get("/by-area-range", summary="Get detailed area range analytics")
+async def get_area_range_analytics(
+    boundaries: Optional[str] = _BOUNDARIES_QUERY,
+    fresh: bool = _FRESH_QUERY,
+    db = Depends(get_analytics_db),
+    current_user: Optional[CurrentUser] = Depends(get_optional_user)
+):
+    custom = parse_boundaries(boundaries)
+    if custom is not None:
+        return {**await _build_area_range_analytics(db, custom), "generated_at": datetime.utcnow().isoformat()}
+    return await _serve_snapshot("by-area-range", db, fresh, current_user)
+
+@router.get("/amenities-stats", summary="Get detailed amenities statistics")
+async def get_amenities_stats(fresh: bool = _FRESH_QUERY, db = Depends(get_analytics_db), current_user: Optional[CurrentUser] = Depends(get_optional_user)):
+    return await _serve_snapshot("amenities-stats", db, fresh, current_user)
+
+@router.get("/rules-stats", summary="Get statistics about listing rules")
+async def get_rules_stats(fresh: bool = _FRESH_QUERY, db = Depends(get_analytics_db), current_user: Optional[CurrentUser] = Depends(get_optional_user)):
+    return await _serve_snapshot("rules-stats", db, fresh, current_user)
+
+@router.get("/trends", summary="Get trending insights and recommendations")
+async def get_trends(fresh: bool = _FRESH_QUERY, db = Depends(get_analytics_db), current_user: Optional[CurrentUser] = Depends(get_optional_user)):
+    return await _serve_snapshot("trends", db, fresh, current_user)
+
+@router.get("/timeseries", summary="Get daily listing statistics over time")
+async def get_timeseries(
+    dimension: str = Query("all", description="all, district or price_bucket"),
+    key: Optional[str] = Query(None, description="district name or price bucket, e.g. 1000000-2000000"),
+    start: Optional[date] = Query(None, description="first day (YYYY-MM-DD), defaults to one year before end"),
+    end: Optional[date] = Query(None, description="last day (YYYY-MM-DD), defaults to today"),
+    db = Depends(get_analytics_db)
+):
+    """
+    Daily new listings, verified listings, median price and median price per m²,
+    read from the listing_daily_stats rollup
+    """
+    if dimension not in DIMENSIONS:
+        raise HTTPException(400, "dimension phải là all, district hoặc price_bucket")
+    end = end or local_today()
+    start = start or end - timedelta(days=365)
+    if start > end:
+        raise HTTPException(400, "start phải trước end")
+    if (end - start).days > 3 * 366:
+        raise HTTPException(400, "Khoảng thời gian tối đa là 3 năm")
+    
+    points = await query_timeseries(db, dimension, start, end, key)
+    return {
+        "dimension": dimension,
+        "key": key,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "points": points
+    }
+
+MAX_HEATMAP_PRECISION = 8
+MAX_HEATMAP_PREFIXES = 32
+
+async def _build_heatmap_cells(db, prefix: str, precision: int) -> Dict[str, Any]:
+    """Count and average price per geohash cell at `precision` inside one `prefix` cell"""
+    pipeline = [
+        {"$match": {
+            "status": "ACTIVE",
+            "verification_status": "VERIFIED",
+            # "{" sorts right after "z", the last geohash character
+            "geohash": {"$gte": prefix, "$lt": prefix + "{"}
+        }},
+        {"$group": {
+            "_id": {"$substrCP": ["$geohash", 0, precision]},
+            "count": {"$sum": 1},
+            "avg_price": {"$avg": "$price"}
+        }}
+    ]
+    cells = [
+        {"geohash": doc["_id"], "count": doc["count"], "avg_price": round(doc["avg_price"] or 0, 0)}
+        async for doc in db.listings.aggregate(pipeline)
+    ]
+    return {"cells": cells}
+
+def _parse_bbox(raw: str):
+    try:
+        min_lng, min_lat, max_lng, max_lat = (float(x) for x in raw.split(","))
+    except ValueError:
+        raise HTTPException(400, "bbox phải có dạng min_lng,min_lat,max_lng,max_lat")
+    if not (-180 <= min_lng < max_lng <= 180 and -90 <= min_lat < max_lat <= 90):
+        raise HTTPException(400, "bbox không hợp lệ")
+    return min_lng, min_lat, max_lng, max_lat
+
+@router.get("/heatmap", summary="Get listing density and average price per geohash cell")
+async def get_heatmap(
+    bbox: str = Query(..., description="min_lng,min_lat,max_lng,max_lat"),
+    precision: int = Query(6, ge=1, le=MAX_HEATMAP_PRECISION, description="geohash length of the returned cells"),
+    db = Depends(get_analytics_db)
+):
+    """
+    Group active listings by their stored geohash. The box is covered by a few
+    coarser prefix cells, each cached as a lazy snapshot per (prefix, precision)
+    """
+    box = _parse_bbox(bbox)
+    
+    prefix_precision = max(1, precision - 2)
+    while prefix_precision > 1 and geohash.cover_count(box, prefix_precision) > MAX_HEATMAP_PREFIXES:
+        prefix_precision -= 1
+    prefixes = geohash.cover(box, prefix_precision)
+    if len(prefixes) > MAX_HEATMAP_PREFIXES:
+        raise HTTPException(400, "bbox quá lớn")
+    
+    primary = await get_db()
+    snapshots = await asyncio.gather(*(
+        get_snapshot(
+            db, "heatmap", _build_heatmap_cells, {"prefix": prefix, "precision": precision},
+            lazy=True, primary=primary, cell=prefix, ttl=settings.heatmap_snapshot_ttl
+        )
+        for prefix in prefixes
+    ))
+    
+    cells = []
+    for snap in snapshots:
+        for cell in snap["cells"]:
+            if not geohash.intersects(cell["geohash"], box):
+                continue
+            min_lng, min_lat, max_lng, max_lat = geohash.bounds(cell["geohash"])
+            cells.append({
+                **cell,
+                "center": [(min_lng + max_lng) / 2, (min_lat + max_lat) / 2],
+                "bbox": [min_lng, min_lat, max_lng, max_lat]
+            })
+    
+    generated = [s["generated_at"] for s in snapshots if s.get("generated_at")]
+    return {
+        "precision": precision,
+        "cells": cells,
+        "generated_at": min(generated) if generated else None
+    }
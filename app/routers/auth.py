@@ -1,12 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException, Header
-import bcrypt
+from fastapi import APIRouter, Depends, HTTPException, Request
 import re
-import secrets
-from datetime import datetime
 from bson import ObjectId
 from ..db import get_db
-from ..schemas import UserIn, LoginIn, UserOut
+from ..security import CurrentUser, get_current_user, issue_tokens, decode_token
+from ..schemas import UserIn, LoginIn, UserOut, LoginOut, RefreshIn, TokenOut
 from ..utils.email import send_email
+from ..utils.passwords import hash_password, verify_password, needs_rehash
+from ..utils import rate_limit
+from ..utils.verification import consume_verification_token, issue_verification_token, seconds_until_resend
 from ..settings import settings
 
 router = APIRouter(prefix="/auth", tags=["auth"])
@@ -19,9 +20,15 @@ def is_valid_phone(phone: str) -> bool:
     pattern = r'^[0-9]{10,11}$'
     return re.match(pattern, phone.strip()) is not None
 
+async def _throttle(db, scope: str, identity: str, limit: int):
+    retry_after = await rate_limit.hit(db, scope, identity, limit, settings.rate_limit_window)
+    if retry_after:
+        raise HTTPException(429, detail="Quá nhiều yêu cầu, vui lòng thử lại sau", headers={"Retry-After": str(retry_after)})
+
 @router.post("/register", response_model=UserOut)
-async def register(payload: UserIn, db = Depends(get_db)):
+async def register(payload: UserIn, request: Request, db = Depends(get_db)):
     """Register a new user account"""
+    await _throttle(db, "register-ip", rate_limit.client_ip(request), settings.register_limit_per_ip)
     email = payload.email.strip().lower()
     
     if not email:
@@ -46,7 +53,7 @@ async def register(payload: UserIn, db = Depends(get_db)):
     if existed:
         raise HTTPException(409, detail="Email này đã được đăng ký. Vui lòng đăng nhập.")
     
-    pwd_hash = bcrypt.hashpw(payload.password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    pwd_hash = await hash_password(payload.password)
     doc = {
         "email": email,
         "name": payload.name.strip(),
@@ -67,19 +74,18 @@ async def register(payload: UserIn, db = Depends(get_db)):
 
 
 @router.post("/send-verification")
-async def send_verification_email(db = Depends(get_db), x_user_id: str | None = Header(None)):
-    if not x_user_id or not ObjectId.is_valid(x_user_id):
-        raise HTTPException(401, "Thiếu hoặc không hợp lệ X-User-Id")
-
-    user = await db.users.find_one({"_id": ObjectId(x_user_id)})
+async def send_verification_email(db = Depends(get_db), current_user: CurrentUser = Depends(get_current_user)):
+    user = await db.users.find_one({"_id": ObjectId(current_user.id)})
     if not user:
         raise HTTPException(404, "Không tìm thấy người dùng")
     if user.get("is_verified"):
         return {"sent": False, "message": "Tài khoản đã được xác thực"}
 
-    token = secrets.token_urlsafe(32)
-    now_iso = datetime.utcnow().isoformat()
-    await db.users.update_one({"_id": ObjectId(x_user_id)}, {"$set": {"verification_token": token, "verification_sent_at": now_iso}})
+    retry_after = await seconds_until_resend(db, user["_id"])
+    if retry_after:
+        raise HTTPException(429, "Vui lòng đợi trước khi gửi lại email xác thực", headers={"Retry-After": str(retry_after)})
+
+    token = await issue_verification_token(db, user["_id"])
 
     verify_url = f"{settings.frontend_url.rstrip('/')}/auth/verify?token={token}"
     subject = "Xác thực email - Trọ Hub"
@@ -93,15 +99,15 @@ async def send_verification_email(db = Depends(get_db), x_user_id: str | None =
 async def verify_token(token: str, db = Depends(get_db)):
     if not token:
         raise HTTPException(400, "Token không hợp lệ")
-    user = await db.users.find_one({"verification_token": token})
-    if not user:
+    user_id = await consume_verification_token(db, token)
+    if not user_id:
         raise HTTPException(404, "Token không hợp lệ hoặc đã hết hạn")
 
-    await db.users.update_one({"_id": user["_id"]}, {"$set": {"is_verified": True}, "$unset": {"verification_token": ""}})
+    await db.users.update_one({"_id": user_id}, {"$set": {"is_verified": True}})
     return {"verified": True, "message": "Email đã được xác thực"}
 
-@router.post("/login", response_model=UserOut)
-async def login(payload: LoginIn, db = Depends(get_db)):
+@router.post("/login", response_model=LoginOut)
+async def login(payload: LoginIn, request: Request, db = Depends(get_db)):
     """Login with email and password"""
     email = payload.email.strip().lower()
     
@@ -111,6 +117,10 @@ async def login(payload: LoginIn, db = Depends(get_db)):
     if not payload.password:
         raise HTTPException(400, detail="Mật khẩu không được để trống")
     
+    # Throttle before the user lookup and bcrypt so a stuffing burst costs almost nothing
+    await _throttle(db, "login-ip", rate_limit.client_ip(request), settings.login_limit_per_ip)
+    await _throttle(db, "login-email", email, settings.login_limit_per_email)
+    
     
     user = await db.users.find_one({"email": email})
     if not user:
@@ -119,14 +129,42 @@ async def login(payload: LoginIn, db = Depends(get_db)):
     if not user.get("password_hash"):
         raise HTTPException(401, detail="Tài khoản chưa thiết lập mật khẩu")
     
-    if not bcrypt.checkpw(payload.password.encode('utf-8'), user["password_hash"].encode('utf-8')):
+    if not await verify_password(payload.password, user["password_hash"]):
         raise HTTPException(401, detail="Mật khẩu không chính xác")
     
-    return UserOut(
+    if needs_rehash(user["password_hash"]):
+        # BCRYPT_ROUNDS changed since this hash was made; upgrade it while we have the password
+        new_hash = await hash_password(payload.password)
+        await db.users.update_one(
+            {"_id": user["_id"], "password_hash": user["password_hash"]},
+            {"$set": {"password_hash": new_hash}}
+        )
+    
+    return LoginOut(
         _id=str(user["_id"]),
         email=user["email"],
         name=user.get("name", ""),
         phone=user.get("phone", ""),
         role=user.get("role", "USER"),
-        is_verified=user.get("is_verified", False)
+        is_verified=user.get("is_verified", False),
+        **issue_tokens(user)
     )
+
+@router.post("/refresh", response_model=TokenOut)
+async def refresh_tokens(payload: RefreshIn, db = Depends(get_db)):
+    """Exchange a refresh token for a new pair carrying the user's current role and verification"""
+    claims = decode_token(payload.refresh_token, "refresh")
+    if claims is None or not ObjectId.is_valid(claims.get("sub", "")):
+        raise HTTPException(401, "Refresh token không hợp lệ hoặc đã hết hạn")
+    
+    user = await db.users.find_one({"_id": ObjectId(claims["sub"])})
+    if not user or user.get("token_version", 0) != claims.get("tv"):
+        raise HTTPException(401, "Refresh token đã bị thu hồi")
+    
+    return TokenOut(**issue_tokens(user))
+
+@router.post("/logout")
+async def logout(db = Depends(get_db), current_user: CurrentUser = Depends(get_current_user)):
+    """Revoke every refresh token of the user; access tokens lapse at their expiry"""
+    await db.users.update_one({"_id": ObjectId(current_user.id)}, {"$inc": {"token_version": 1}})
+    return {"ok": True}
@@ -1,8 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException, Header, Query
-from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
 from bson import ObjectId
 from datetime import datetime
 from ..db import get_db
+from ..security import CurrentUser, get_current_user
 from ..utils.email import send_email
 from ..settings import settings
 
@@ -16,15 +16,10 @@ async def create_connection(
     listing_id: str,
     message: str = "",
     db = Depends(get_db),
-    x_user_id: Optional[str] = Header(None)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
-    if not x_user_id or not _oid_ok(x_user_id):
-        raise HTTPException(401, "Thiếu hoặc không hợp lệ X-User-Id")
     # require verified user
-    from_user = await db.users.find_one({"_id": ObjectId(x_user_id)})
-    if not from_user:
-        raise HTTPException(401, "Không tìm thấy người dùng")
-    if not from_user.get("is_verified"):
+    if not current_user.is_verified:
         raise HTTPException(403, "Bạn cần xác thực email trước khi gửi yêu cầu kết nối")
     if not _oid_ok(listing_id):
         raise HTTPException(400, "ID tin đăng không hợp lệ")
@@ -35,18 +30,18 @@ async def create_connection(
     
     to_user_id = listing["owner_id"]
     
-    if str(to_user_id) == x_user_id:
+    if str(to_user_id) == current_user.id:
         raise HTTPException(400, "Không thể kết nối với chính mình")
     
     existing = await db.connections.find_one({
-        "from_user_id": ObjectId(x_user_id),
+        "from_user_id": ObjectId(current_user.id),
         "listing_id": ObjectId(listing_id)
     })
     if existing:
         raise HTTPException(400, "Bạn đã gửi yêu cầu kết nối cho tin đăng này")
     
     doc = {
-        "from_user_id": ObjectId(x_user_id),
+        "from_user_id": ObjectId(current_user.id),
         "to_user_id": to_user_id,
         "listing_id": ObjectId(listing_id),
         "message": message,
@@ -56,7 +51,7 @@ async def create_connection(
     }
     res = await db.connections.insert_one(doc)
     
-    from_user = await db.users.find_one({"_id": ObjectId(x_user_id)})
+    from_user = await db.users.find_one({"_id": ObjectId(current_user.id)})
     from_name = from_user.get("name", "Người dùng") if from_user else "Người dùng"
     
     notification = {
@@ -67,7 +62,7 @@ async def create_connection(
         "metadata": {
             "connection_id": str(res.inserted_id),
             "listing_id": listing_id,
-            "from_user_id": x_user_id
+            "from_user_id": current_user.id
         },
         "read": False,
         "created_at": datetime.utcnow()
@@ -94,13 +89,11 @@ async def get_outgoing_connections(
     page: int = 1,
     limit: int = 20,
     db = Depends(get_db),
-    x_user_id: Optional[str] = Header(None)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
-    if not x_user_id or not _oid_ok(x_user_id):
-        raise HTTPException(401, "Thiếu hoặc không hợp lệ X-User-Id")
     
     skip = (page - 1) * limit
-    cursor = db.connections.find({"from_user_id": ObjectId(x_user_id)}).sort("created_at", -1).skip(skip).limit(limit)
+    cursor = db.connections.find({"from_user_id": ObjectId(current_user.id)}).sort("created_at", -1).skip(skip).limit(limit)
     
     items = []
     async for doc in cursor:
@@ -118,7 +111,8 @@ async def get_outgoing_connections(
                 "_id": str(listing["_id"]),
                 "title": listing.get("title", ""),
                 "price": listing.get("price", 0),
-                "images": listing.get("images", [])
+                "images": listing.get("images", []),
+                "thumbnail": listing.get("thumbnail")
             } if listing else None,
             "to_user": {
                 "name": to_user.get("name", ""),
@@ -128,7 +122,7 @@ async def get_outgoing_connections(
         }
         items.append(item)
     
-    total = await db.connections.count_documents({"from_user_id": ObjectId(x_user_id)})
+    total = await db.connections.count_documents({"from_user_id": ObjectId(current_user.id)})
     return {"items": items, "total": total, "page": page, "limit": limit}
 
 @router.get("/incoming")
@@ -136,13 +130,11 @@ async def get_incoming_connections(
     page: int = 1,
     limit: int = 20,
     db = Depends(get_db),
-    x_user_id: Optional[str] = Header(None)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
-    if not x_user_id or not _oid_ok(x_user_id):
-        raise HTTPException(401, "Thiếu hoặc không hợp lệ X-User-Id")
     
     skip = (page - 1) * limit
-    cursor = db.connections.find({"to_user_id": ObjectId(x_user_id)}).sort("created_at", -1).skip(skip).limit(limit)
+    cursor = db.connections.find({"to_user_id": ObjectId(current_user.id)}).sort("created_at", -1).skip(skip).limit(limit)
     
     items = []
     async for doc in cursor:
@@ -160,7 +152,8 @@ async def get_incoming_connections(
                 "_id": str(listing["_id"]),
                 "title": listing.get("title", ""),
                 "price": listing.get("price", 0),
-                "images": listing.get("images", [])
+                "images": listing.get("images", []),
+                "thumbnail": listing.get("thumbnail")
             } if listing else None,
             "from_user": {
                 "name": from_user.get("name", ""),
@@ -170,7 +163,7 @@ async def get_incoming_connections(
         }
         items.append(item)
     
-    total = await db.connections.count_documents({"to_user_id": ObjectId(x_user_id)})
+    total = await db.connections.count_documents({"to_user_id": ObjectId(current_user.id)})
     return {"items": items, "total": total, "page": page, "limit": limit}
 
 @router.patch("/{connection_id}")
@@ -178,10 +171,8 @@ async def update_connection_status(
     connection_id: str,
     status: str = Query(..., description="ACCEPTED or REJECTED"),
     db = Depends(get_db),
-    x_user_id: Optional[str] = Header(None)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
-    if not x_user_id or not _oid_ok(x_user_id):
-        raise HTTPException(401, "Thiếu hoặc không hợp lệ X-User-Id")
     if not _oid_ok(connection_id):
         raise HTTPException(400, "ID kết nối không hợp lệ")
     if status not in ["ACCEPTED", "REJECTED"]:
@@ -189,7 +180,7 @@ async def update_connection_status(
     
     conn = await db.connections.find_one({
         "_id": ObjectId(connection_id),
-        "to_user_id": ObjectId(x_user_id)
+        "to_user_id": ObjectId(current_user.id)
     })
     if not conn:
         raise HTTPException(404, "Không tìm thấy yêu cầu kết nối")
@@ -202,7 +193,7 @@ async def update_connection_status(
         {"$set": {"status": status, "updated_at": datetime.utcnow()}}
     )
     
-    to_user = await db.users.find_one({"_id": ObjectId(x_user_id)})
+    to_user = await db.users.find_one({"_id": ObjectId(current_user.id)})
     to_name = to_user.get("name", "Chủ phòng") if to_user else "Chủ phòng"
     listing = await db.listings.find_one({"_id": conn["listing_id"]})
     listing_title = listing.get("title", "") if listing else ""
@@ -216,7 +207,7 @@ async def update_connection_status(
             "metadata": {
                 "connection_id": connection_id,
                 "listing_id": str(conn["listing_id"]),
-                "to_user_id": x_user_id
+                "to_user_id": current_user.id
             },
             "read": False,
             "created_at": datetime.utcnow()
@@ -251,15 +242,13 @@ async def update_connection_status(
 async def check_connection(
     listing_id: str,
     db = Depends(get_db),
-    x_user_id: Optional[str] = Header(None)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
-    if not x_user_id or not _oid_ok(x_user_id):
-        raise HTTPException(401, "Thiếu hoặc không hợp lệ X-User-Id")
     if not _oid_ok(listing_id):
         raise HTTPException(400, "ID tin đăng không hợp lệ")
     
     conn = await db.connections.find_one({
-        "from_user_id": ObjectId(x_user_id),
+        "from_user_id": ObjectId(current_user.id),
         "listing_id": ObjectId(listing_id)
     })
     
@@ -291,10 +280,8 @@ async def get_connections_by_listing(
     page: int = 1,
     limit: int = 20,
     db = Depends(get_db),
-    x_user_id: Optional[str] = Header(None)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
-    if not x_user_id or not _oid_ok(x_user_id):
-        raise HTTPException(401, "Thiếu hoặc không hợp lệ X-User-Id")
     if not _oid_ok(listing_id):
         raise HTTPException(400, "ID tin đăng không hợp lệ")
     
@@ -302,7 +289,7 @@ async def get_connections_by_listing(
     if not listing:
         raise HTTPException(404, "Không tìm thấy tin đăng")
     
-    if str(listing["owner_id"]) != x_user_id:
+    if str(listing["owner_id"]) != current_user.id:
         raise HTTPException(403, "Bạn không có quyền xem yêu cầu kết nối của tin đăng này")
     
     skip = (page - 1) * limit
@@ -1,32 +1,52 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, Header
-from typing import Any, List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import Any, List
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
 from ..db import get_db
-from ..schemas import FavoriteIn, FavoriteOut, ListingPreviewOut
+from ..security import CurrentUser, get_current_user
+from ..schemas import FavoriteCheckIn, FavoriteIn, FavoriteOut, ListingPreviewOut
 
 router = APIRouter(prefix="/favorites", tags=["favorites"])
 
 @router.post("", status_code=201)
-async def add_favorite(payload: FavoriteIn, db = Depends(get_db), x_user_id: Optional[str] = Header(None)):
-    if not x_user_id or not ObjectId.is_valid(x_user_id):
-        raise HTTPException(401, "Thiếu hoặc không hợp lệ X-User-Id")
+async def add_favorite(payload: FavoriteIn, db = Depends(get_db), current_user: CurrentUser = Depends(get_current_user)):
     listing_id = payload.listing_id
     if not listing_id or not ObjectId.is_valid(listing_id):
         raise HTTPException(400, "listing_id không hợp lệ")
-    await db.favorites.update_one(
-        {"user_id": ObjectId(x_user_id), "listing_id": ObjectId(listing_id)},
-        {"$set": {"user_id": ObjectId(x_user_id), "listing_id": ObjectId(listing_id)}},
-        upsert=True
-    )
+    try:
+        res = await db.favorites.update_one(
+            {"user_id": ObjectId(current_user.id), "listing_id": ObjectId(listing_id)},
+            {"$set": {"user_id": ObjectId(current_user.id), "listing_id": ObjectId(listing_id)}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # A concurrent request inserted the same favorite first
+        return {"ok": True}
+    # Only a real insert counts; re-favoriting matches the existing document
+    if res.upserted_id is not None:
+        await db.listings.update_one({"_id": ObjectId(listing_id)}, {"$inc": {"favorite_count": 1}})
     return {"ok": True}
 
+@router.post("/check")
+async def check_favorites(payload: FavoriteCheckIn, db = Depends(get_db), current_user: CurrentUser = Depends(get_current_user)):
+    """Which of the given listings the user has favorited (one query on the user_id+listing_id index)"""
+    ids = []
+    for listing_id in payload.listing_ids:
+        if not ObjectId.is_valid(listing_id):
+            raise HTTPException(400, "listing_id không hợp lệ")
+        ids.append(ObjectId(listing_id))
+    cur = db.favorites.find(
+        {"user_id": ObjectId(current_user.id), "listing_id": {"$in": ids}},
+        {"_id": 0, "listing_id": 1}
+    )
+    favorited = [str(f["listing_id"]) async for f in cur]
+    return {"favorited": favorited}
+
 @router.get("", response_model=dict)
-async def list_favorites(db = Depends(get_db), x_user_id: Optional[str] = Header(None), page: int = 1, limit: int = 20):
+async def list_favorites(db = Depends(get_db), current_user: CurrentUser = Depends(get_current_user), page: int = 1, limit: int = 20):
     """List user's favorites with listing previews"""
-    if not x_user_id or not ObjectId.is_valid(x_user_id):
-        raise HTTPException(401, "Thiếu hoặc không hợp lệ X-User-Id")
     skip = max(0, (page-1)*min(limit,100))
-    cur = db.favorites.find({"user_id": ObjectId(x_user_id)}).skip(skip).limit(min(limit,100)).sort([("_id",-1)])
+    cur = db.favorites.find({"user_id": ObjectId(current_user.id)}).skip(skip).limit(min(limit,100)).sort([("_id",-1)])
     items = []
     async for f in cur:
         favorite_out = FavoriteOut(
@@ -44,22 +64,24 @@ async def list_favorites(db = Depends(get_db), x_user_id: Optional[str] = Header
                 price=listing.get("price", 0),
                 area=listing.get("area", 0),
                 images=listing.get("images", []),
+                thumbnail=listing.get("thumbnail"),
                 location=listing.get("location", {"type": "Point", "coordinates": [0, 0]}),
                 status=listing.get("status", "ACTIVE"),
-                owner_id=str(listing.get("owner_id", ""))
+                owner_id=str(listing.get("owner_id", "")),
+                favorite_count=listing.get("favorite_count", 0)
             )
         else:
             favorite_out.listing = None
             
         items.append(favorite_out.model_dump(by_alias=True))
-    total = await db.favorites.count_documents({"user_id": ObjectId(x_user_id)})
+    total = await db.favorites.count_documents({"user_id": ObjectId(current_user.id)})
     return {"items": items, "page": page, "limit": min(limit,100), "total": total}
 
 @router.delete("")
-async def remove_favorite(listing_id: str, db = Depends(get_db), x_user_id: Optional[str] = Header(None)):
-    if not x_user_id or not ObjectId.is_valid(x_user_id):
-        raise HTTPException(401, "Thiếu hoặc không hợp lệ X-User-Id")
+async def remove_favorite(listing_id: str, db = Depends(get_db), current_user: CurrentUser = Depends(get_current_user)):
     if not ObjectId.is_valid(listing_id):
         raise HTTPException(400, "listing_id không hợp lệ")
-    await db.favorites.delete_one({"user_id": ObjectId(x_user_id), "listing_id": ObjectId(listing_id)})
+    res = await db.favorites.delete_one({"user_id": ObjectId(current_user.id), "listing_id": ObjectId(listing_id)})
+    if res.deleted_count:
+        await db.listings.update_one({"_id": ObjectId(listing_id)}, {"$inc": {"favorite_count": -1}})
     return {"ok": True}
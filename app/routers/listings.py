@@ -1,14 +1,26 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, Header
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Query
 from typing import Any, List, Optional
 from bson import ObjectId
 from datetime import datetime
+from pymongo import UpdateOne
 import httpx
-from ..db import get_db
-from ..schemas import ListingIn, ListingPatch, ListingOut
+from ..db import get_db, get_search_db
+from ..security import CurrentUser, get_current_user, get_optional_user
+from ..schemas import ListingIn, ListingPatch, ListingOut, ListingUserStateIn
 from ..utils.pagination import build_pagination
+from ..utils.analytics_snapshots import mark_analytics_dirty
+from ..utils import geohash
+from ..utils.media import thumbnail_for
 
 router = APIRouter(prefix="/listings", tags=["listings"])
 
+def location_geohash(location: Optional[dict]) -> Optional[str]:
+    coords = (location or {}).get("coordinates") or []
+    if len(coords) != 2:
+        return None
+    return geohash.encode(coords[0], coords[1])
+
 def shorten_address(full_address: str) -> str:
     if not full_address:
         return ""
@@ -43,25 +55,26 @@ async def reverse_geocode(lng: float, lat: float) -> str:
     return f"{lat:.4f}, {lng:.4f}"
 
 @router.post("", status_code=201, response_model=ListingOut)
-async def create_listing(payload: ListingIn, db = Depends(get_db), x_user_id: Optional[str] = Header(None)):
-    if not x_user_id or not ObjectId.is_valid(x_user_id):
-        raise HTTPException(401, "Thiếu hoặc không hợp lệ X-User-Id")
-    user = await db.users.find_one({"_id": ObjectId(x_user_id)})
-    if not user:
-        raise HTTPException(401, "Không tìm thấy người dùng")
-    if not user.get("is_verified"):
+async def create_listing(payload: ListingIn, db = Depends(get_db), current_user: CurrentUser = Depends(get_current_user)):
+    if not current_user.is_verified:
         raise HTTPException(403, "Bạn cần xác thực email trước khi đăng tin")
     doc = payload.model_dump()
-    doc["owner_id"] = ObjectId(x_user_id)
+    doc["owner_id"] = ObjectId(current_user.id)
     doc["verification_status"] = "PENDING"
     doc["verified_by"] = None
     doc["verified_at"] = None
+    doc["created_at"] = datetime.utcnow()
+    doc["updated_at"] = doc["created_at"]
+    doc["geohash"] = location_geohash(doc.get("location"))
+    doc["thumbnail"] = await thumbnail_for(db, doc.get("images"))
+    doc["favorite_count"] = 0
     
     if not doc.get("address") and doc.get("location", {}).get("coordinates"):
         coords = doc["location"]["coordinates"]
         doc["address"] = await reverse_geocode(coords[0], coords[1])
     
     res = await db.listings.insert_one(doc)
+    await mark_analytics_dirty(db, [doc["geohash"]])
     saved = await db.listings.find_one({"_id": res.inserted_id})
     
     return ListingOut(
@@ -74,13 +87,15 @@ async def create_listing(payload: ListingIn, db = Depends(get_db), x_user_id: Op
         amenities=saved.get("amenities", []),
         rules=saved.get("rules", {}),
         images=saved.get("images", []),
+        thumbnail=saved.get("thumbnail"),
         video=saved.get("video"),
         status=saved.get("status", "ACTIVE"),
         location=saved.get("location"),
         address=saved.get("address"),
         verification_status=saved.get("verification_status", "PENDING"),
         verified_by=str(saved["verified_by"]) if saved.get("verified_by") else None,
-        verified_at=saved.get("verified_at")
+        verified_at=saved.get("verified_at"),
+        favorite_count=saved.get("favorite_count", 0)
     )
 
 @router.get("", summary="Query listings with filters and geo search")
@@ -102,21 +117,15 @@ async def list_listings(
     exclude_own: Optional[bool] = Query(False, description="exclude current user's listings"),
     page: int = 1,
     limit: int = 20,
-    db = Depends(get_db),
-    x_user_id: Optional[str] = Header(None),
+    db = Depends(get_search_db),
+    current_user: Optional[CurrentUser] = Depends(get_optional_user),
 ):
     filters: dict[str, Any] = {"status": {"$ne": "HIDDEN"}}
     
-    is_admin = False
-    if x_user_id and ObjectId.is_valid(x_user_id):
-        user = await db.users.find_one({"_id": ObjectId(x_user_id)})
-        if user and user.get("role") == "ADMIN":
-            is_admin = True
-        
-        if exclude_own:
-            filters["owner_id"] = {"$ne": ObjectId(x_user_id)}
+    if current_user and exclude_own:
+        filters["owner_id"] = {"$ne": ObjectId(current_user.id)}
     
-    if not is_admin:
+    if not (current_user and current_user.is_admin):
         filters["verification_status"] = "VERIFIED"
     
     if q:
@@ -206,12 +215,10 @@ async def get_my_listings(
     page: int = 1,
     limit: int = 20,
     db = Depends(get_db),
-    x_user_id: Optional[str] = Header(None)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
-    if not x_user_id or not ObjectId.is_valid(x_user_id):
-        raise HTTPException(401, "Thiếu hoặc không hợp lệ X-User-Id")
     
-    filters = {"owner_id": ObjectId(x_user_id)}
+    filters = {"owner_id": ObjectId(current_user.id)}
     pag = build_pagination(page, limit)
     
     cursor = db.listings.find(filters).sort([("_id", -1)]).skip(pag["skip"]).limit(pag["limit"])
@@ -227,6 +234,50 @@ async def get_my_listings(
     total = await db.listings.count_documents(filters)
     return {"items": items, "page": pag["page"], "limit": pag["limit"], "total": total}
 
+@router.post("/user-state", summary="Current user's connection, favorite and report state for a page of listings")
+async def get_listings_user_state(
+    payload: ListingUserStateIn,
+    db = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    ids = []
+    for listing_id in payload.listing_ids:
+        if not ObjectId.is_valid(listing_id):
+            raise HTTPException(400, "ID tin đăng không hợp lệ")
+        ids.append(ObjectId(listing_id))
+    user_id = ObjectId(current_user.id)
+
+    # One indexed $in query per collection, run concurrently
+    connections, favorites, reports = await asyncio.gather(
+        db.connections.find(
+            {"from_user_id": user_id, "listing_id": {"$in": ids}},
+            {"listing_id": 1, "status": 1}
+        ).to_list(length=None),
+        db.favorites.find(
+            {"user_id": user_id, "listing_id": {"$in": ids}},
+            {"_id": 0, "listing_id": 1}
+        ).to_list(length=None),
+        db.reports.find(
+            {"reporter_id": user_id, "listing_id": {"$in": ids}, "status": "OPEN"},
+            {"_id": 0, "listing_id": 1}
+        ).to_list(length=None),
+    )
+    by_listing = {doc["listing_id"]: doc for doc in connections}
+    favorited = {doc["listing_id"] for doc in favorites}
+    reported = {doc["listing_id"] for doc in reports}
+
+    states = {}
+    for oid in ids:
+        conn = by_listing.get(oid)
+        states[str(oid)] = {
+            "connected": conn is not None,
+            "connection_status": conn["status"] if conn else None,
+            "connection_id": str(conn["_id"]) if conn else None,
+            "favorited": oid in favorited,
+            "reported": oid in reported,
+        }
+    return {"states": states}
+
 @router.get("/{listing_id}")
 async def get_listing(listing_id: str, db = Depends(get_db)):
     if not ObjectId.is_valid(listing_id):
@@ -251,19 +302,28 @@ async def get_listing(listing_id: str, db = Depends(get_db)):
     return doc
 
 @router.patch("/{listing_id}")
-async def patch_listing(listing_id: str, payload: ListingPatch, db = Depends(get_db), x_user_id: Optional[str] = Header(None)):
+async def patch_listing(listing_id: str, payload: ListingPatch, db = Depends(get_db), current_user: CurrentUser = Depends(get_current_user)):
     if not ObjectId.is_valid(listing_id):
         raise HTTPException(400, "ID tin đăng không hợp lệ")
     update = {"$set": {k: v for k, v in payload.model_dump(exclude_none=True).items()}}
     if not update["$set"]:
         return {"updated": False}
-    if not x_user_id or not ObjectId.is_valid(x_user_id):
-        raise HTTPException(401, "Thiếu hoặc không hợp lệ X-User-Id")
+    old_geohash = None
+    if "location" in update["$set"]:
+        update["$set"]["geohash"] = location_geohash(update["$set"]["location"])
+        # The listing leaves its old cell, so that cell's heatmap snapshots are stale too
+        old = await db.listings.find_one({"_id": ObjectId(listing_id)}, {"geohash": 1})
+        old_geohash = (old or {}).get("geohash")
+    if "images" in update["$set"]:
+        update["$set"]["thumbnail"] = await thumbnail_for(db, update["$set"]["images"])
+    update["$set"]["updated_at"] = datetime.utcnow()
     
-    res = await db.listings.update_one({"_id": ObjectId(listing_id), "owner_id": ObjectId(x_user_id)}, update)
+    res = await db.listings.update_one({"_id": ObjectId(listing_id), "owner_id": ObjectId(current_user.id)}, update)
     if res.matched_count == 0:
         raise HTTPException(404, "Không tìm thấy tin đăng")
     doc = await db.listings.find_one({"_id": ObjectId(listing_id)})
+    if res.modified_count:
+        await mark_analytics_dirty(db, [old_geohash, doc.get("geohash")])
     doc["_id"] = str(doc["_id"])
     doc["owner_id"] = str(doc["owner_id"])
     if doc.get("verified_by"):
@@ -271,12 +331,15 @@ async def patch_listing(listing_id: str, payload: ListingPatch, db = Depends(get
     return doc
 
 @router.delete("/{listing_id}", status_code=204)
-async def delete_listing(listing_id: str, db = Depends(get_db), x_user_id: Optional[str] = Header(None)):
+async def delete_listing(listing_id: str, db = Depends(get_db), current_user: CurrentUser = Depends(get_current_user)):
     if not ObjectId.is_valid(listing_id):
         raise HTTPException(400, "ID tin đăng không hợp lệ")
-    if not x_user_id or not ObjectId.is_valid(x_user_id):
-        raise HTTPException(401, "Thiếu hoặc không hợp lệ X-User-Id")
-    await db.listings.delete_one({"_id": ObjectId(listing_id), "owner_id": ObjectId(x_user_id)})
+    deleted = await db.listings.find_one_and_delete(
+        {"_id": ObjectId(listing_id), "owner_id": ObjectId(current_user.id)},
+        {"geohash": 1}
+    )
+    if deleted:
+        await mark_analytics_dirty(db, [deleted.get("geohash")])
     return
 
 @router.post("/{listing_id}/verify", summary="Admin verify listing")
@@ -284,13 +347,10 @@ async def verify_listing(
     listing_id: str,
     status: str = Query(..., description="VERIFIED or REJECTED"),
     db = Depends(get_db),
-    x_user_id: Optional[str] = Header(None)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
-    if not x_user_id or not ObjectId.is_valid(x_user_id):
-        raise HTTPException(401, "Thiếu hoặc không hợp lệ X-User-Id")
     
-    admin = await db.users.find_one({"_id": ObjectId(x_user_id)})
-    if not admin or admin.get("role") != "ADMIN":
+    if not current_user.is_admin:
         raise HTTPException(403, "Chỉ admin mới có quyền xác thực tin đăng")
     
     if not ObjectId.is_valid(listing_id):
@@ -306,12 +366,14 @@ async def verify_listing(
     update = {
         "$set": {
             "verification_status": status,
-            "verified_by": ObjectId(x_user_id),
-            "verified_at": datetime.utcnow().isoformat()
+            "verified_by": ObjectId(current_user.id),
+            "verified_at": datetime.utcnow().isoformat(),
+            "updated_at": datetime.utcnow()
         }
     }
     
     await db.listings.update_one({"_id": ObjectId(listing_id)}, update)
+    await mark_analytics_dirty(db, [listing.get("geohash")])
     
     updated = await db.listings.find_one({"_id": ObjectId(listing_id)})
     updated["_id"] = str(updated["_id"])
@@ -324,13 +386,10 @@ async def verify_listing(
 @router.post("/migrate-addresses", summary="Backfill addresses for existing listings")
 async def migrate_addresses(
     db = Depends(get_db),
-    x_user_id: Optional[str] = Header(None)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
-    if not x_user_id or not ObjectId.is_valid(x_user_id):
-        raise HTTPException(401, "Thiếu hoặc không hợp lệ X-User-Id")
     
-    admin = await db.users.find_one({"_id": ObjectId(x_user_id)})
-    if not admin or admin.get("role") != "ADMIN":
+    if not current_user.is_admin:
         raise HTTPException(403, "Chỉ admin mới có quyền thực hiện migration")
     
     cursor = db.listings.find({"$or": [{"address": None}, {"address": {"$exists": False}}]})
@@ -345,13 +404,43 @@ async def migrate_addresses(
                 address = await reverse_geocode(lng, lat)
                 await db.listings.update_one(
                     {"_id": listing["_id"]},
-                    {"$set": {"address": address}}
+                    {"$set": {"address": address, "updated_at": datetime.utcnow()}}
                 )
                 updated_count += 1
         except Exception as e:
             errors.append({"id": str(listing["_id"]), "error": str(e)})
     
+    if updated_count:
+        # Addresses feed by-location but not the geohash cells
+        await mark_analytics_dirty(db, [])
+    
     return {
         "updated": updated_count,
         "errors": errors
     }
+
+@router.post("/migrate-geohash", summary="Backfill geohash cells for existing listings")
+async def migrate_geohash(
+    db = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    
+    if not current_user.is_admin:
+        raise HTTPException(403, "Chỉ admin mới có quyền thực hiện migration")
+    
+    cursor = db.listings.find({"geohash": {"$exists": False}}, {"location": 1})
+    ops = []
+    updated_count = 0
+    async for listing in cursor:
+        cell = location_geohash(listing.get("location"))
+        ops.append(UpdateOne({"_id": listing["_id"]}, {"$set": {"geohash": cell, "updated_at": datetime.utcnow()}}))
+        if len(ops) >= 1000:
+            updated_count += (await db.listings.bulk_write(ops, ordered=False)).modified_count
+            ops = []
+    if ops:
+        updated_count += (await db.listings.bulk_write(ops, ordered=False)).modified_count
+    
+    if updated_count:
+        await mark_analytics_dirty(db)
+    
+    return {"updated": updated_count}
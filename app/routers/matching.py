@@ -1,15 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, Header
-from typing import Any, List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import Any, List
 from math import sqrt
 from bson import ObjectId
 from ..db import get_db
+from ..security import CurrentUser, get_current_user
 from ..schemas import ProfilePreviewOut
 
 router = APIRouter(prefix="/matching", tags=["matching"])
 
-def _oid_ok(x: str) -> bool:
-    return ObjectId.is_valid(x)
-
 def _distance_km(a: list[float] | None, b: list[float] | None) -> float | None:
     if not a or not b: return None
     
@@ -27,13 +25,11 @@ def _distance_km(a: list[float] | None, b: list[float] | None) -> float | None:
 async def match_rooms(
     top_k: int = 10,
     db = Depends(get_db),
-    x_user_id: Optional[str] = Header(None)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """Match user profile with available room listings based on budget and location"""
-    if not x_user_id or not _oid_ok(x_user_id):
-        raise HTTPException(401, "Thiếu hoặc không hợp lệ X-User-Id")
     
-    me = await db.profiles.find_one({"user_id": ObjectId(x_user_id)})
+    me = await db.profiles.find_one({"user_id": ObjectId(current_user.id)})
     if not me: 
         raise HTTPException(400, "Bạn cần tạo hồ sơ của mình trước")
     
@@ -92,6 +88,7 @@ async def match_rooms(
             "area": listing.get("area", 0),
             "amenities": listing.get("amenities", []),
             "images": listing.get("images", []),
+            "thumbnail": listing.get("thumbnail"),
             "location": listing.get("location"),
             "owner_id": str(listing["owner_id"]),
             "owner_name": owner_name,
@@ -113,12 +110,10 @@ async def match_rooms(
 async def match_roommates(
     top_k: int = 10,
     db = Depends(get_db),
-    x_user_id: Optional[str] = Header(None)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """Match roommates based on budget, habits, and location (DEPRECATED - use /rooms instead)"""
-    if not x_user_id or not _oid_ok(x_user_id):
-        raise HTTPException(401, "Thiếu hoặc không hợp lệ X-User-Id")
-    me = await db.profiles.find_one({"user_id": ObjectId(x_user_id)})
+    me = await db.profiles.find_one({"user_id": ObjectId(current_user.id)})
     if not me: raise HTTPException(400, "Bạn cần tạo hồ sơ của mình trước")
     
     return {"items": [], "message": "This endpoint is deprecated. Use /matching/rooms instead"}
@@ -1,8 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException, Header
-from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException
 from bson import ObjectId
 from datetime import datetime
 from ..db import get_db
+from ..security import CurrentUser, get_current_user
 
 router = APIRouter(prefix="/notifications", tags=["notifications"])
 
@@ -15,12 +15,10 @@ async def get_notifications(
     limit: int = 20,
     unread_only: bool = False,
     db = Depends(get_db),
-    x_user_id: Optional[str] = Header(None)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
-    if not x_user_id or not _oid_ok(x_user_id):
-        raise HTTPException(401, "Thiếu hoặc không hợp lệ X-User-Id")
     
-    filters = {"user_id": ObjectId(x_user_id)}
+    filters = {"user_id": ObjectId(current_user.id)}
     if unread_only:
         filters["read"] = False
     
@@ -41,7 +39,7 @@ async def get_notifications(
     
     total = await db.notifications.count_documents(filters)
     unread_count = await db.notifications.count_documents({
-        "user_id": ObjectId(x_user_id),
+        "user_id": ObjectId(current_user.id),
         "read": False
     })
     
@@ -56,13 +54,11 @@ async def get_notifications(
 @router.get("/unread-count")
 async def get_unread_count(
     db = Depends(get_db),
-    x_user_id: Optional[str] = Header(None)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
-    if not x_user_id or not _oid_ok(x_user_id):
-        raise HTTPException(401, "Thiếu hoặc không hợp lệ X-User-Id")
     
     count = await db.notifications.count_documents({
-        "user_id": ObjectId(x_user_id),
+        "user_id": ObjectId(current_user.id),
         "read": False
     })
     return {"count": count}
@@ -71,15 +67,13 @@ async def get_unread_count(
 async def mark_as_read(
     notification_id: str,
     db = Depends(get_db),
-    x_user_id: Optional[str] = Header(None)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
-    if not x_user_id or not _oid_ok(x_user_id):
-        raise HTTPException(401, "Thiếu hoặc không hợp lệ X-User-Id")
     if not _oid_ok(notification_id):
         raise HTTPException(400, "ID thông báo không hợp lệ")
     
     res = await db.notifications.update_one(
-        {"_id": ObjectId(notification_id), "user_id": ObjectId(x_user_id)},
+        {"_id": ObjectId(notification_id), "user_id": ObjectId(current_user.id)},
         {"$set": {"read": True}}
     )
     if res.matched_count == 0:
@@ -90,13 +84,11 @@ async def mark_as_read(
 @router.patch("/read-all")
 async def mark_all_as_read(
     db = Depends(get_db),
-    x_user_id: Optional[str] = Header(None)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
-    if not x_user_id or not _oid_ok(x_user_id):
-        raise HTTPException(401, "Thiếu hoặc không hợp lệ X-User-Id")
     
     await db.notifications.update_many(
-        {"user_id": ObjectId(x_user_id), "read": False},
+        {"user_id": ObjectId(current_user.id), "read": False},
         {"$set": {"read": True}}
     )
     return {"success": True}
@@ -105,16 +97,14 @@ async def mark_all_as_read(
 async def delete_notification(
     notification_id: str,
     db = Depends(get_db),
-    x_user_id: Optional[str] = Header(None)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
-    if not x_user_id or not _oid_ok(x_user_id):
-        raise HTTPException(401, "Thiếu hoặc không hợp lệ X-User-Id")
     if not _oid_ok(notification_id):
         raise HTTPException(400, "ID thông báo không hợp lệ")
     
     res = await db.notifications.delete_one({
         "_id": ObjectId(notification_id),
-        "user_id": ObjectId(x_user_id)
+        "user_id": ObjectId(current_user.id)
     })
     if res.deleted_count == 0:
         raise HTTPException(404, "Không tìm thấy thông báo")
@@ -1,7 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, Header
+from fastapi import APIRouter, Depends, HTTPException, Query
 from typing import Optional, Any, List
 from bson import ObjectId
 from ..db import get_db
+from ..security import CurrentUser, get_current_user, get_optional_user
 from ..schemas import ProfileIn, ProfileOut
 
 router = APIRouter(prefix="/profiles", tags=["profiles"])
@@ -12,19 +13,17 @@ def _oid(x: str) -> ObjectId:
     return ObjectId(x)
 
 @router.get("/me", response_model=ProfileOut)
-async def get_my_profile(db = Depends(get_db), x_user_id: Optional[str] = Header(None)):
+async def get_my_profile(db = Depends(get_db), current_user: CurrentUser = Depends(get_current_user)):
     """Get current user's profile with user info"""
-    if not x_user_id or not ObjectId.is_valid(x_user_id):
-        raise HTTPException(401, "Thiếu hoặc không hợp lệ X-User-Id")
     
-    user = await db.users.find_one({"_id": ObjectId(x_user_id)})
+    user = await db.users.find_one({"_id": ObjectId(current_user.id)})
     if not user:
         raise HTTPException(404, "Không tìm thấy người dùng")
     
-    prof = await db.profiles.find_one({"user_id": ObjectId(x_user_id)})
+    prof = await db.profiles.find_one({"user_id": ObjectId(current_user.id)})
     if not prof:
         default_prof = {
-            "user_id": ObjectId(x_user_id),
+            "user_id": ObjectId(current_user.id),
             "bio": "",
             "budget": 0,
             "desiredAreas": [],
@@ -57,10 +56,8 @@ async def get_my_profile(db = Depends(get_db), x_user_id: Optional[str] = Header
     )
 
 @router.put("/me", response_model=ProfileOut)
-async def upsert_my_profile(payload: ProfileIn, db = Depends(get_db), x_user_id: Optional[str] = Header(None)):
+async def upsert_my_profile(payload: ProfileIn, db = Depends(get_db), current_user: CurrentUser = Depends(get_current_user)):
     """Update or create current user's profile"""
-    if not x_user_id or not ObjectId.is_valid(x_user_id):
-        raise HTTPException(401, "Thiếu hoặc không hợp lệ X-User-Id")
     
     # Update user fields if provided
     user_update = {}
@@ -68,17 +65,17 @@ async def upsert_my_profile(payload: ProfileIn, db = Depends(get_db), x_user_id:
         user_update["name"] = payload.full_name
     if payload.email is not None:
         # Check if email already exists for another user
-        existing_user = await db.users.find_one({"email": payload.email, "_id": {"$ne": ObjectId(x_user_id)}})
+        existing_user = await db.users.find_one({"email": payload.email, "_id": {"$ne": ObjectId(current_user.id)}})
         if existing_user:
             raise HTTPException(400, "Email đã được sử dụng bởi tài khoản khác")
         user_update["email"] = payload.email
     
     if user_update:
-        await db.users.update_one({"_id": ObjectId(x_user_id)}, {"$set": user_update})
+        await db.users.update_one({"_id": ObjectId(current_user.id)}, {"$set": user_update})
     
     # Update profile fields
     doc = {
-        "user_id": ObjectId(x_user_id),
+        "user_id": ObjectId(current_user.id),
         "bio": payload.bio,
         "budget": float(payload.budget) if payload.budget is not None else 0,
         "desiredAreas": payload.desiredAreas,
@@ -89,11 +86,11 @@ async def upsert_my_profile(payload: ProfileIn, db = Depends(get_db), x_user_id:
         "location": payload.location.model_dump() if payload.location else None,
         "avatar": payload.avatar,
     }
-    await db.profiles.update_one({"user_id": ObjectId(x_user_id)}, {"$set": doc}, upsert=True)
+    await db.profiles.update_one({"user_id": ObjectId(current_user.id)}, {"$set": doc}, upsert=True)
     
     # Fetch updated user and profile data
-    user = await db.users.find_one({"_id": ObjectId(x_user_id)})
-    prof = await db.profiles.find_one({"user_id": ObjectId(x_user_id)})
+    user = await db.users.find_one({"_id": ObjectId(current_user.id)})
+    prof = await db.profiles.find_one({"user_id": ObjectId(current_user.id)})
     
     return ProfileOut(
         _id=str(prof["_id"]),
@@ -141,7 +138,7 @@ async def search_profiles(
 async def get_profile_by_user_id(
     user_id: str,
     db = Depends(get_db),
-    x_user_id: Optional[str] = Header(None)
+    current_user: Optional[CurrentUser] = Depends(get_optional_user)
 ):
     if not ObjectId.is_valid(user_id):
         raise HTTPException(400, "User ID không hợp lệ")
@@ -152,14 +149,14 @@ async def get_profile_by_user_id(
     
     prof = await db.profiles.find_one({"user_id": ObjectId(user_id)})
     
-    is_own_profile = x_user_id and x_user_id == user_id
+    is_own_profile = current_user is not None and current_user.id == user_id
     has_accepted_connection = False
     
-    if x_user_id and ObjectId.is_valid(x_user_id) and not is_own_profile:
+    if current_user and not is_own_profile:
         conn = await db.connections.find_one({
             "$or": [
-                {"from_user_id": ObjectId(x_user_id), "to_user_id": ObjectId(user_id), "status": "ACCEPTED"},
-                {"from_user_id": ObjectId(user_id), "to_user_id": ObjectId(x_user_id), "status": "ACCEPTED"}
+                {"from_user_id": ObjectId(current_user.id), "to_user_id": ObjectId(user_id), "status": "ACCEPTED"},
+                {"from_user_id": ObjectId(user_id), "to_user_id": ObjectId(current_user.id), "status": "ACCEPTED"}
             ]
         })
         has_accepted_connection = conn is not None
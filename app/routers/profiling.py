@@ -0,0 +1,46 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import JSONResponse, PlainTextResponse
+from typing import Optional
+from datetime import datetime
+from ..security import CurrentUser, get_current_user
+from ..settings import settings
+from ..utils import profiler
+
+router = APIRouter(prefix="/admin/profile", tags=["admin"])
+
+@router.post("", summary="Sample this worker's CPU for N seconds or the next N requests to a route")
+async def run_profile(
+    seconds: float = Query(10, gt=0, description="how long to sample; with route, the time limit"),
+    route: Optional[str] = Query(None, description="route template, e.g. /listings/{listing_id}"),
+    method: Optional[str] = Query(None, description="only requests with this HTTP method"),
+    requests: int = Query(10, ge=1, le=10000, description="with route: stop after this many requests"),
+    format: str = Query("collapsed", description="collapsed or speedscope"),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    if not current_user.is_admin:
+        raise HTTPException(403, "Chỉ admin mới có quyền chạy profiler")
+    if format not in ("collapsed", "speedscope"):
+        raise HTTPException(400, "format phải là collapsed hoặc speedscope")
+    if seconds > settings.profiler_max_seconds:
+        raise HTTPException(400, f"seconds tối đa là {settings.profiler_max_seconds}")
+    if profiler.busy():
+        raise HTTPException(409, "Profiler đang chạy trên worker này")
+
+    session = await profiler.profile(
+        settings.profiler_interval_ms / 1000,
+        seconds,
+        route=route,
+        method=method,
+        requests=requests if route else 0,
+    )
+    name = f"{route or 'all threads'} {datetime.utcnow().isoformat(timespec='seconds')}"
+    headers = {
+        "X-Profile-Samples": str(sum(session.samples.values())),
+        "X-Profile-Seconds": f"{session.duration:.2f}",
+    }
+    if route:
+        headers["X-Profile-Requests"] = str(session.completed)
+    if format == "speedscope":
+        headers["Content-Disposition"] = 'attachment; filename="profile.speedscope.json"'
+        return JSONResponse(profiler.to_speedscope(session, name), headers=headers)
+    return PlainTextResponse(profiler.to_collapsed(session), headers=headers)
@@ -1,9 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, Header, Query
+from fastapi import APIRouter, Depends, HTTPException, Query
 from typing import Optional
 from bson import ObjectId
 from datetime import datetime
 from ..db import get_db
+from ..security import CurrentUser, get_current_user
 from ..schemas import ReportIn
+from ..utils.analytics_snapshots import mark_analytics_dirty
 
 router = APIRouter(prefix="/reports", tags=["reports"])
 
@@ -11,14 +13,8 @@ def _oid_ok(x: str) -> bool:
     return ObjectId.is_valid(x)
 
 @router.post("", status_code=201)
-async def report_listing(payload: ReportIn, db = Depends(get_db), x_user_id: Optional[str] = Header(None)):
-    if not x_user_id or not _oid_ok(x_user_id):
-        raise HTTPException(401, "Thiếu hoặc không hợp lệ X-User-Id")
-    
-    user = await db.users.find_one({"_id": ObjectId(x_user_id)})
-    if not user:
-        raise HTTPException(401, "Không tìm thấy người dùng")
-    if not user.get("is_verified"):
+async def report_listing(payload: ReportIn, db = Depends(get_db), current_user: CurrentUser = Depends(get_current_user)):
+    if not current_user.is_verified:
         raise HTTPException(403, "Bạn cần xác thực email trước khi báo cáo")
     
     listing_id = payload.listing_id
@@ -34,7 +30,7 @@ async def report_listing(payload: ReportIn, db = Depends(get_db), x_user_id: Opt
     
     existing = await db.reports.find_one({
         "listing_id": ObjectId(listing_id),
-        "reporter_id": ObjectId(x_user_id),
+        "reporter_id": ObjectId(current_user.id),
         "status": "OPEN"
     })
     if existing:
@@ -42,7 +38,7 @@ async def report_listing(payload: ReportIn, db = Depends(get_db), x_user_id: Opt
     
     doc = {
         "listing_id": ObjectId(listing_id),
-        "reporter_id": ObjectId(x_user_id),
+        "reporter_id": ObjectId(current_user.id),
         "reason": reason,
         "status": "OPEN",
         "created_at": datetime.utcnow()
@@ -56,13 +52,10 @@ async def list_reports(
     page: int = 1,
     limit: int = 20,
     db = Depends(get_db),
-    x_user_id: Optional[str] = Header(None)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
-    if not x_user_id or not _oid_ok(x_user_id):
-        raise HTTPException(401, "Thiếu hoặc không hợp lệ X-User-Id")
     
-    admin = await db.users.find_one({"_id": ObjectId(x_user_id)})
-    if not admin or admin.get("role") != "ADMIN":
+    if not current_user.is_admin:
         raise HTTPException(403, "Chỉ admin mới có quyền xem báo cáo")
     
     filters = {}
@@ -83,6 +76,7 @@ async def list_reports(
                 "_id": str(listing["_id"]),
                 "title": listing.get("title", ""),
                 "images": listing.get("images", []),
+                "thumbnail": listing.get("thumbnail"),
                 "price": listing.get("price", 0),
                 "owner_id": str(listing.get("owner_id", ""))
             }
@@ -117,13 +111,10 @@ async def resolve_report(
     report_id: str,
     action: str = Query(..., description="delete_listing or dismiss"),
     db = Depends(get_db),
-    x_user_id: Optional[str] = Header(None)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
-    if not x_user_id or not _oid_ok(x_user_id):
-        raise HTTPException(401, "Thiếu hoặc không hợp lệ X-User-Id")
     
-    admin = await db.users.find_one({"_id": ObjectId(x_user_id)})
-    if not admin or admin.get("role") != "ADMIN":
+    if not current_user.is_admin:
         raise HTTPException(403, "Chỉ admin mới có quyền xử lý báo cáo")
     
     if not _oid_ok(report_id):
@@ -134,17 +125,19 @@ async def resolve_report(
         raise HTTPException(404, "Không tìm thấy báo cáo")
     
     if action == "delete_listing":
-        await db.listings.delete_one({"_id": report["listing_id"]})
+        deleted = await db.listings.find_one_and_delete({"_id": report["listing_id"]}, {"geohash": 1})
+        if deleted:
+            await mark_analytics_dirty(db, [deleted.get("geohash")])
         await db.reports.update_many(
             {"listing_id": report["listing_id"]},
-            {"$set": {"status": "RESOLVED", "resolved_at": datetime.utcnow(), "resolved_by": ObjectId(x_user_id)}}
+            {"$set": {"status": "RESOLVED", "resolved_at": datetime.utcnow(), "resolved_by": ObjectId(current_user.id)}}
         )
         return {"ok": True, "message": "Đã xóa tin đăng và đóng tất cả báo cáo liên quan"}
     
     elif action == "dismiss":
         await db.reports.update_one(
             {"_id": ObjectId(report_id)},
-            {"$set": {"status": "DISMISSED", "resolved_at": datetime.utcnow(), "resolved_by": ObjectId(x_user_id)}}
+            {"$set": {"status": "DISMISSED", "resolved_at": datetime.utcnow(), "resolved_by": ObjectId(current_user.id)}}
         )
         return {"ok": True, "message": "Đã bỏ qua báo cáo"}
     
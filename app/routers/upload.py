@@ -1,8 +1,19 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from typing import List
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
+from typing import Any, Dict, List
+import asyncio
+import secrets
 import cloudinary
-import cloudinary.uploader
+from PIL import UnidentifiedImageError
+from ..db import get_db
+from ..security import CurrentUser, get_current_user
+from ..schemas import UploadConfirmIn
 from ..settings import settings
+from ..utils.images import ImageTooLarge, content_hash, prepare_image
+from ..utils.media import find_media, record_media
+from ..utils.uploads import (
+    LISTING_FOLDER, FileTooLarge, delivery_url, run_blocking, sign_upload,
+    thumbnail_transformation, upload_image, verify_upload_response,
+)
 
 router = APIRouter(prefix="/upload", tags=["upload"])
 
@@ -12,33 +23,92 @@ cloudinary.config(
     api_secret=settings.cloudinary_api_secret
 )
 
+def _too_large_message() -> str:
+    return f"Ảnh vượt quá {settings.upload_max_bytes // (1024 * 1024)} MB"
+
+async def _upload_one(file: UploadFile, db, owner_id: str) -> Dict[str, Any]:
+    if not file.content_type or not file.content_type.startswith("image/"):
+        return {"filename": file.filename, "error": "File không phải là ảnh"}
+    
+    if file.size is not None and file.size > settings.upload_max_bytes:
+        return {"filename": file.filename, "error": _too_large_message()}
+    
+    try:
+        # file.size is whatever the client declared; the hash pass enforces the cap on the bytes actually received
+        digest = await run_blocking(content_hash, file.file, settings.upload_max_bytes)
+        existing = await find_media(db, owner_id, digest)
+        if existing:
+            return {"filename": file.filename, "url": existing["url"], "thumbnail_url": existing.get("thumbnail_url"), "deduplicated": True}
+        
+        prepared = await run_blocking(prepare_image, file.file)
+        try:
+            # Streamed from temp files in chunks rather than read into memory
+            image, thumbnail = await asyncio.gather(
+                upload_image(
+                    prepared["image"],
+                    filename=file.filename,
+                    folder=LISTING_FOLDER,
+                    quality="auto",
+                    fetch_format="auto"
+                ),
+                upload_image(prepared["thumbnail"], folder=f"{LISTING_FOLDER}/thumbs"),
+            )
+        finally:
+            prepared["image"].close()
+        media = await record_media(db, owner_id, digest, image["secure_url"], thumbnail["secure_url"], prepared["width"], prepared["height"])
+        return {"filename": file.filename, "url": media["url"], "thumbnail_url": media.get("thumbnail_url"), "deduplicated": False}
+    except UnidentifiedImageError:
+        return {"filename": file.filename, "error": "Không đọc được nội dung ảnh"}
+    except FileTooLarge:
+        return {"filename": file.filename, "error": _too_large_message()}
+    except ImageTooLarge:
+        return {"filename": file.filename, "error": f"Ảnh vượt quá {settings.image_max_pixels // 1_000_000} megapixel"}
+    except asyncio.TimeoutError:
+        return {"filename": file.filename, "error": "Hết thời gian tải ảnh"}
+    except Exception as e:
+        return {"filename": file.filename, "error": f"Lỗi tải ảnh: {str(e)}"}
+
 @router.post("/images")
-async def upload_images(files: List[UploadFile] = File(...)):
+async def upload_images(files: List[UploadFile] = File(...), db = Depends(get_db), current_user: CurrentUser = Depends(get_current_user)):
     if not settings.cloudinary_cloud_name:
         raise HTTPException(400, "Cloudinary chưa được cấu hình")
     
     if len(files) > 10:
         raise HTTPException(400, "Tối đa 10 ảnh mỗi lần tải")
     
-    uploaded_urls = []
+    # Files upload concurrently; one failure is reported in its own result instead of aborting the batch
+    results = await asyncio.gather(*(_upload_one(file, db, current_user.id) for file in files))
     
-    for file in files:
-        
-        if not file.content_type or not file.content_type.startswith("image/"):
-            raise HTTPException(400, f"File {file.filename} không phải là ảnh")
-        
-        
-        try:
-            contents = await file.read()
-            result = cloudinary.uploader.upload(
-                contents,
-                folder="roommate-listings",
-                resource_type="image",
-                quality="auto",
-                fetch_format="auto"
-            )
-            uploaded_urls.append(result["secure_url"])
-        except Exception as e:
-            raise HTTPException(500, f"Lỗi tải ảnh {file.filename}: {str(e)}")
+    return {
+        "urls": [r["url"] for r in results if "url" in r],
+        "results": results,
+    }
+
+@router.post("/sign")
+async def sign_direct_upload(current_user: CurrentUser = Depends(get_current_user)):
+    """Signed parameters for uploading one image straight to Cloudinary"""
+    if not settings.cloudinary_cloud_name or not settings.cloudinary_api_secret:
+        raise HTTPException(400, "Cloudinary chưa được cấu hình")
+    
+    # The public_id is part of the signature, so the client can only write to this slot
+    public_id = f"{LISTING_FOLDER}/{current_user.id}/{secrets.token_hex(12)}"
+    return sign_upload(public_id)
+
+@router.post("/confirm")
+async def confirm_direct_upload(payload: UploadConfirmIn, db = Depends(get_db), current_user: CurrentUser = Depends(get_current_user)):
+    """Record an asset uploaded with /upload/sign, from Cloudinary's signed response"""
+    if not settings.cloudinary_api_secret:
+        raise HTTPException(400, "Cloudinary chưa được cấu hình")
+    if not payload.public_id.startswith(f"{LISTING_FOLDER}/{current_user.id}/"):
+        raise HTTPException(403, "Ảnh không thuộc về người dùng này")
+    if not verify_upload_response(payload.public_id, payload.version, payload.signature):
+        raise HTTPException(400, "Chữ ký phản hồi Cloudinary không hợp lệ")
     
-    return {"urls": uploaded_urls}
+    media = await record_media(
+        db,
+        current_user.id,
+        f"cloudinary:{payload.public_id}",
+        delivery_url(payload.public_id, payload.version),
+        delivery_url(payload.public_id, payload.version, thumbnail_transformation()),
+    )
+    return {"url": media["url"], "thumbnail_url": media.get("thumbnail_url")}
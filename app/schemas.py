@@ -44,8 +44,10 @@ class Listing(ListingIn):
 class ListingOut(ListingIn):
     id: str = Field(alias="_id")
     owner_id: str
+    thumbnail: Optional[str] = None
     verified_by: Optional[str] = None
     verified_at: Optional[str] = None
+    favorite_count: int = 0
 
 class ListingPreviewOut(BaseModel):
     """Lightweight listing DTO for previews in favorites, search results, etc."""
@@ -55,13 +57,18 @@ class ListingPreviewOut(BaseModel):
     price: float = 0
     area: float = 0
     images: List[str] = []
+    thumbnail: Optional[str] = None
     location: Location
     address: Optional[str] = None
     status: str = "ACTIVE"
     owner_id: str
+    favorite_count: int = 0
     
     model_config = ConfigDict(populate_by_name=True)
 
+class ListingUserStateIn(BaseModel):
+    listing_ids: List[str] = Field(..., max_length=100, description="Up to 100 listing IDs, e.g. one page of results")
+
 class ListingPatch(BaseModel):
     title: Optional[str] = None
     desc: Optional[str] = None
@@ -94,8 +101,7 @@ class User(BaseModel):
     role: Literal["USER", "ADMIN"] = "USER"
     password_hash: str
     is_verified: bool = False
-    verification_token: Optional[str] = None
-    verification_sent_at: Optional[str] = None
+    token_version: int = 0
 
     model_config = ConfigDict(populate_by_name=True, arbitrary_types_allowed=True, json_encoders={ObjectId: str})
 
@@ -107,11 +113,34 @@ class UserOut(BaseModel):
     role: str = "USER"
     is_verified: bool = False
 
+class LoginOut(UserOut):
+    access_token: str
+    refresh_token: str
+    token_type: str = "bearer"
+    expires_in: int
+
+class RefreshIn(BaseModel):
+    refresh_token: str
+
+class TokenOut(BaseModel):
+    access_token: str
+    refresh_token: str
+    token_type: str = "bearer"
+    expires_in: int
+
 # Review models removed
 
+class UploadConfirmIn(BaseModel):
+    public_id: str
+    version: int
+    signature: str
+
 class FavoriteIn(BaseModel):
     listing_id: str = Field(..., description="ID of the listing to favorite")
 
+class FavoriteCheckIn(BaseModel):
+    listing_ids: List[str] = Field(..., max_length=100, description="Up to 100 listing IDs to check")
+
 class FavoriteOut(BaseModel):
     id: str = Field(alias="_id")
     user_id: str
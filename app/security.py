@@ -0,0 +1,133 @@
+import base64
+import hashlib
+import hmac
+import json
+import secrets
+import time
+from typing import Any, Dict, Optional
+from fastapi import Header, HTTPException
+from pydantic import BaseModel
+from .settings import settings
+
+_fallback_secret: Optional[bytes] = None
+# Values that ship in examples/docs; anyone can mint tokens signed with them
+_PLACEHOLDER_SECRETS = {"change-me", "changeme", "change_me", "secret", "your_secret", "your-secret"}
+MIN_SECRET_BYTES = 32
+
+
+class CurrentUser(BaseModel):
+    """Identity claims carried by a verified access token."""
+    id: str
+    role: str = "USER"
+    is_verified: bool = False
+
+    @property
+    def is_admin(self) -> bool:
+        return self.role == "ADMIN"
+
+
+def check_secret() -> None:
+    """Refuse a guessable AUTH_SECRET; called at startup so a bad deploy fails instead of serving forgeable tokens."""
+    secret = settings.auth_secret
+    if secret and (secret.strip().lower() in _PLACEHOLDER_SECRETS or len(secret.encode("utf-8")) < MIN_SECRET_BYTES):
+        raise RuntimeError(
+            f"AUTH_SECRET is a placeholder or shorter than {MIN_SECRET_BYTES} bytes; "
+            "generate one with: python -c \"import secrets; print(secrets.token_urlsafe(48))\""
+        )
+
+
+def _secret() -> bytes:
+    global _fallback_secret
+    if settings.auth_secret:
+        check_secret()
+        return settings.auth_secret.encode("utf-8")
+    if _fallback_secret is None:
+        print("[auth] AUTH_SECRET is not set; using a random per-process key. Tokens will not survive restarts or work across workers.")
+        _fallback_secret = secrets.token_bytes(32)
+    return _fallback_secret
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _sign(payload: str) -> str:
+    return _b64encode(hmac.new(_secret(), payload.encode("ascii"), hashlib.sha256).digest())
+
+
+def sign_token(claims: Dict[str, Any], ttl: int) -> str:
+    now = int(time.time())
+    payload = _b64encode(json.dumps({**claims, "iat": now, "exp": now + ttl}, separators=(",", ":")).encode("utf-8"))
+    return f"{payload}.{_sign(payload)}"
+
+
+def decode_token(token: str, token_type: str) -> Optional[Dict[str, Any]]:
+    """Return the claims of a well-signed, unexpired token of `token_type`, else None."""
+    # Our tokens are base64url; anything else would make the ascii encode or compare_digest raise
+    if not token.isascii():
+        return None
+    try:
+        payload, signature = token.split(".")
+    except ValueError:
+        return None
+    if not hmac.compare_digest(signature, _sign(payload)):
+        return None
+    try:
+        claims = json.loads(_b64decode(payload))
+    except ValueError:
+        return None
+    if claims.get("typ") != token_type or claims.get("exp", 0) < time.time():
+        return None
+    return claims
+
+
+def issue_tokens(user: Dict[str, Any]) -> Dict[str, Any]:
+    """Access + refresh pair for a user document. `tv` ties refresh tokens to users.token_version."""
+    claims = {
+        "sub": str(user["_id"]),
+        "role": user.get("role", "USER"),
+        "ver": bool(user.get("is_verified", False)),
+        "tv": user.get("token_version", 0),
+    }
+    return {
+        "access_token": sign_token({**claims, "typ": "access"}, settings.access_token_ttl),
+        "refresh_token": sign_token({**claims, "typ": "refresh"}, settings.refresh_token_ttl),
+        "token_type": "bearer",
+        "expires_in": settings.access_token_ttl,
+    }
+
+
+def _unauthorized(detail: str) -> HTTPException:
+    return HTTPException(401, detail, headers={"WWW-Authenticate": "Bearer"})
+
+
+def _user_from_header(authorization: str) -> Optional[CurrentUser]:
+    """Verify the bearer token from its signature alone; no database read."""
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    claims = decode_token(token.strip(), "access")
+    if claims is None:
+        return None
+    return CurrentUser(id=claims["sub"], role=claims.get("role", "USER"), is_verified=claims.get("ver", False))
+
+
+async def get_optional_user(authorization: Optional[str] = Header(None)) -> Optional[CurrentUser]:
+    """Anonymous on public endpoints when the token is missing, malformed or expired,
+    so a client still holding a stale access token can keep browsing."""
+    if not authorization:
+        return None
+    return _user_from_header(authorization)
+
+
+async def get_current_user(authorization: Optional[str] = Header(None)) -> CurrentUser:
+    if not authorization:
+        raise _unauthorized("Thiếu access token")
+    user = _user_from_header(authorization)
+    if user is None:
+        raise _unauthorized("Access token không hợp lệ hoặc đã hết hạn")
+    return user
@@ -1,12 +1,24 @@
 from pydantic_settings import BaseSettings
 from pydantic import Field, field_validator
-from typing import List
+from typing import List, Literal
 
 class Settings(BaseSettings):
     mongodb_uri: str = Field("mongodb://localhost:27017", alias="MONGODB_URI")
     mongodb_db: str = Field("roommate", alias="MONGODB_DB")
+    mongodb_max_pool_size: int = Field(100, gt=0, alias="MONGODB_MAX_POOL_SIZE")
+    mongodb_min_pool_size: int = Field(10, ge=0, alias="MONGODB_MIN_POOL_SIZE")
+    mongodb_max_idle_time_ms: int = Field(300000, ge=0, alias="MONGODB_MAX_IDLE_TIME_MS")
+    mongodb_server_selection_timeout_ms: int = Field(5000, gt=0, alias="MONGODB_SERVER_SELECTION_TIMEOUT_MS")
+    mongodb_connect_timeout_ms: int = Field(5000, gt=0, alias="MONGODB_CONNECT_TIMEOUT_MS")
+    mongodb_socket_timeout_ms: int = Field(30000, ge=0, alias="MONGODB_SOCKET_TIMEOUT_MS")
+    # Secondary reads; MongoDB requires maxStalenessSeconds >= 90
+    mongodb_analytics_max_staleness: int = Field(300, ge=90, alias="MONGODB_ANALYTICS_MAX_STALENESS")
+    mongodb_search_max_staleness: int = Field(90, ge=90, alias="MONGODB_SEARCH_MAX_STALENESS")
+    mongodb_compressors: str = Field("zstd", alias="MONGODB_COMPRESSORS")
     app_port: int = Field(8000, alias="APP_PORT")
     app_workers: int = Field(1, alias="APP_WORKERS")
+    migrate_on_startup: bool = Field(False, alias="MIGRATE_ON_STARTUP")
+    migration_lock_ttl: int = Field(600, gt=0, alias="MIGRATION_LOCK_TTL")
     cors_origins: str = Field(
         default="http://localhost:3000,http://localhost:5173",
         alias="CORS_ORIGINS"
@@ -15,6 +27,16 @@ class Settings(BaseSettings):
     cloudinary_cloud_name: str = Field("", alias="CLOUDINARY_CLOUD_NAME")
     cloudinary_api_key: str = Field("", alias="CLOUDINARY_API_KEY")
     cloudinary_api_secret: str = Field("", alias="CLOUDINARY_API_SECRET")
+    upload_workers: int = Field(8, gt=0, alias="UPLOAD_WORKERS")
+    upload_timeout: float = Field(60, gt=0, alias="UPLOAD_TIMEOUT")
+    image_max_dimension: int = Field(1600, gt=0, alias="IMAGE_MAX_DIMENSION")
+    # Decoded size cap, checked from the header before any pixel data is read; fits 48 MP phone photos
+    image_max_pixels: int = Field(50_000_000, gt=0, alias="IMAGE_MAX_PIXELS")
+    thumbnail_size: int = Field(400, gt=0, alias="THUMBNAIL_SIZE")
+    image_quality: int = Field(82, ge=1, le=95, alias="IMAGE_QUALITY")
+    upload_max_bytes: int = Field(10 * 1024 * 1024, gt=0, alias="UPLOAD_MAX_BYTES")
+    # Cloudinary rejects chunks under 5 MB except for the last one
+    upload_chunk_size: int = Field(5 * 1024 * 1024, ge=5 * 1024 * 1024, alias="UPLOAD_CHUNK_SIZE")
     
     sendgrid_api_key: str = Field("", alias="SENDGRID_API_KEY")
     mail_from: str = Field("noreply@example.com", alias="MAIL_FROM")
@@ -22,6 +44,46 @@ class Settings(BaseSettings):
     
     frontend_url: str = Field("http://localhost:5173", alias="FRONTEND_URL")
 
+    auth_secret: str = Field("", alias="AUTH_SECRET")
+    access_token_ttl: int = Field(900, gt=0, alias="ACCESS_TOKEN_TTL")
+    refresh_token_ttl: int = Field(2592000, gt=0, alias="REFRESH_TOKEN_TTL")
+
+    verification_token_ttl: int = Field(86400, gt=0, alias="VERIFICATION_TOKEN_TTL")
+    verification_resend_interval: int = Field(60, ge=0, alias="VERIFICATION_RESEND_INTERVAL")
+
+    rate_limit_backend: Literal["memory", "mongo"] = Field("memory", alias="RATE_LIMIT_BACKEND")
+    rate_limit_window: int = Field(300, gt=0, alias="RATE_LIMIT_WINDOW")
+    login_limit_per_email: int = Field(10, ge=0, alias="LOGIN_LIMIT_PER_EMAIL")
+    login_limit_per_ip: int = Field(50, ge=0, alias="LOGIN_LIMIT_PER_IP")
+    register_limit_per_ip: int = Field(10, ge=0, alias="REGISTER_LIMIT_PER_IP")
+    trust_forwarded_for: bool = Field(False, alias="TRUST_FORWARDED_FOR")
+
+    # Off by default: /metrics exposes route and collection names to whoever can reach it
+    metrics_enabled: bool = Field(False, alias="METRICS_ENABLED")
+    # When set, /metrics requires "Authorization: Bearer <METRICS_TOKEN>"
+    metrics_token: str = Field("", alias="METRICS_TOKEN")
+    loop_lag_interval: float = Field(0.5, gt=0, alias="LOOP_LAG_INTERVAL")
+
+    # Development/canary: report callbacks that hold the event loop longer than the threshold
+    loop_watchdog: bool = Field(False, alias="LOOP_WATCHDOG")
+    loop_watchdog_threshold_ms: float = Field(100, gt=0, alias="LOOP_WATCHDOG_THRESHOLD_MS")
+
+    # On-demand CPU profiler (POST /admin/profile)
+    profiler_interval_ms: float = Field(10, ge=1, alias="PROFILER_INTERVAL_MS")
+    profiler_max_seconds: float = Field(60, gt=0, alias="PROFILER_MAX_SECONDS")
+
+    request_profiling: bool = Field(False, alias="REQUEST_PROFILING")
+    slow_request_ms: float = Field(500, alias="SLOW_REQUEST_MS")
+    slow_request_commands: int = Field(20, alias="SLOW_REQUEST_COMMANDS")
+
+    bcrypt_rounds: int = Field(12, ge=4, le=31, alias="BCRYPT_ROUNDS")
+    password_hash_workers: int = Field(0, ge=0, alias="PASSWORD_HASH_WORKERS")
+
+    analytics_refresh_interval: float = Field(60, alias="ANALYTICS_REFRESH_INTERVAL")
+    analytics_timezone: str = Field("Asia/Ho_Chi_Minh", alias="ANALYTICS_TIMEZONE")
+    daily_rollup_interval: float = Field(3600, alias="DAILY_ROLLUP_INTERVAL")
+    heatmap_snapshot_ttl: float = Field(86400, gt=0, alias="HEATMAP_SNAPSHOT_TTL")
+
     @field_validator("cors_origins", mode="after")
     @classmethod
     def split_origins(cls, v: str) -> list[str]:
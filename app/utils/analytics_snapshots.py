@@ -0,0 +1,125 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+from .leases import hold_lease, process_owner
+
+SnapshotBuilder = Callable[..., Awaitable[Dict[str, Any]]]
+
+
+def snapshot_key(name: str, params: Optional[Dict[str, Any]] = None) -> str:
+    if not params:
+        return name
+    return name + "?" + "&".join(f"{k}={params[k]}" for k in sorted(params))
+
+
+def _is_stale(doc: Dict[str, Any]) -> bool:
+    dirty_at = doc.get("dirty_at")
+    return dirty_at is not None and dirty_at > doc["generated_at"]
+
+
+def _serve(doc: Dict[str, Any]) -> Dict[str, Any]:
+    generated_at = doc.get("generated_at")
+    return {
+        **doc.get("data", {}),
+        "generated_at": generated_at.isoformat() if generated_at else None,
+    }
+
+
+async def refresh_snapshot(db, name: str, builder: SnapshotBuilder, params: Optional[Dict[str, Any]] = None, cell: Optional[str] = None, ttl: Optional[float] = None) -> Dict[str, Any]:
+    """Recompute one snapshot and store it.
+
+    `generated_at` is taken before the builder runs, so a listing write that
+    lands while we aggregate leaves `dirty_at > generated_at` and the snapshot
+    is picked up again on the next refresh. `cell` is the geohash prefix a
+    snapshot covers (see mark_analytics_dirty); `ttl` lets the TTL index on
+    `expires_at` evict it.
+    """
+    key = snapshot_key(name, params)
+    generated_at = datetime.utcnow()
+    data = await builder(db, **(params or {}))
+    doc = {
+        "name": name,
+        "params": params or {},
+        "data": data,
+        "generated_at": generated_at,
+    }
+    if cell is not None:
+        doc["cell"] = cell
+    if ttl:
+        doc["expires_at"] = generated_at + timedelta(seconds=ttl)
+    await db.analytics_snapshots.update_one({"_id": key}, {"$set": doc}, upsert=True)
+    return doc
+
+
+async def get_snapshot(db, name: str, builder: SnapshotBuilder, params: Optional[Dict[str, Any]] = None, lazy: bool = False, primary=None, cell: Optional[str] = None, ttl: Optional[float] = None) -> Dict[str, Any]:
+    """Serve the stored snapshot, building it on first use.
+
+    Lazy snapshots are not known to the background refresher (or no refresher
+    runs); they are rebuilt here on the first read after a listing write instead. Rebuilds go to
+    `primary` when `db` may read a lagging secondary: a snapshot stamped now
+    but built without the latest write would otherwise count as clean.
+    """
+    doc = await db.analytics_snapshots.find_one({"_id": snapshot_key(name, params)})
+    if doc is None or (lazy and _is_stale(doc)):
+        doc = await refresh_snapshot(primary or db, name, builder, params, cell, ttl)
+    return _serve(doc)
+
+
+async def get_fresh_snapshot(db, name: str, builder: SnapshotBuilder, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    return _serve(await refresh_snapshot(db, name, builder, params))
+
+
+async def mark_analytics_dirty(db, geohashes: Optional[Iterable[Optional[str]]] = None) -> None:
+    """Called after listing writes; stale snapshots are rebuilt by the refresher.
+
+    `geohashes` are the written listings' cells (before and after the write).
+    Snapshots without a `cell` are always marked; cell snapshots only when the
+    cell contains one of them. None marks everything.
+    """
+    update = {"$set": {"dirty_at": datetime.utcnow()}}
+    if geohashes is None:
+        await db.analytics_snapshots.update_many({}, update)
+        return
+    prefixes = sorted({gh[:i] for gh in geohashes if gh for i in range(1, len(gh) + 1)})
+    await db.analytics_snapshots.update_many(
+        {"$or": [{"cell": {"$exists": False}}, {"cell": {"$in": prefixes}}]},
+        update,
+    )
+
+
+async def refresh_stale_snapshots(db, builders: Dict[str, SnapshotBuilder]) -> int:
+    refreshed = 0
+    existing = set()
+    cursor = db.analytics_snapshots.find(
+        {},
+        {"name": 1, "params": 1, "generated_at": 1, "dirty_at": 1},
+    )
+    async for doc in cursor:
+        existing.add(doc["_id"])
+        builder = builders.get(doc.get("name"))
+        if builder is None or not _is_stale(doc):
+            continue
+        await refresh_snapshot(db, doc["name"], builder, doc.get("params") or None)
+        refreshed += 1
+
+    for name, builder in builders.items():
+        if snapshot_key(name) not in existing:
+            await refresh_snapshot(db, name, builder)
+            refreshed += 1
+    return refreshed
+
+
+async def run_snapshot_refresher(db, builders: Dict[str, SnapshotBuilder], interval: float) -> None:
+    """Started in every worker; only the holder of the lease refreshes."""
+    owner = process_owner()
+    while True:
+        try:
+            if await hold_lease(db, "analytics-snapshots", owner, ttl=max(3 * interval, 60)):
+                refreshed = await refresh_stale_snapshots(db, builders)
+                if refreshed:
+                    print(f"[analytics] Refreshed {refreshed} snapshot(s)")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[analytics] Snapshot refresh failed: {e}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,195 @@
+import asyncio
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Any, Dict, List, Optional
+from zoneinfo import ZoneInfo
+from bson import ObjectId
+from pymongo import UpdateOne
+from ..settings import settings
+from .leases import hold_lease, process_owner
+
+# Bucket keys are persisted in listing_daily_stats, so these boundaries must stay
+# stable even if the default histogram in the analytics router changes.
+ROLLUP_PRICE_BOUNDARIES = [0, 1000000, 2000000, 3000000, 4000000, 5000000, 10000000, 100000000]
+ROLLUP_CHUNK_DAYS = 31
+DIMENSIONS = ("all", "district", "price_bucket")
+
+DISTRICT_EXPR = {
+    "$let": {
+        "vars": {"parts": {"$split": [{"$ifNull": ["$address", ""]}, ", "]}},
+        "in": {
+            "$cond": {
+                "if": {"$gte": [{"$size": "$$parts"}, 2]},
+                "then": {"$arrayElemAt": ["$$parts", {"$subtract": [{"$size": "$$parts"}, 2]}]},
+                "else": {"$arrayElemAt": ["$$parts", 0]}
+            }
+        }
+    }
+}
+
+PRICE_BUCKET_EXPR = {
+    "$switch": {
+        "branches": [
+            {
+                "case": {"$and": [{"$gte": ["$price", lo]}, {"$lt": ["$price", hi]}]},
+                "then": f"{lo}-{hi}"
+            }
+            for lo, hi in zip(ROLLUP_PRICE_BOUNDARIES, ROLLUP_PRICE_BOUNDARIES[1:])
+        ],
+        "default": "other"
+    }
+}
+
+
+def _tz() -> ZoneInfo:
+    return ZoneInfo(settings.analytics_timezone)
+
+
+def local_today() -> date:
+    return datetime.now(_tz()).date()
+
+
+def local_midnight_utc(d: date) -> datetime:
+    """Naive UTC datetime of local midnight, matching how Mongo hands back dates."""
+    return datetime.combine(d, time(), tzinfo=_tz()).astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def local_day(dt: datetime) -> date:
+    return dt.replace(tzinfo=timezone.utc).astimezone(_tz()).date()
+
+
+def _day_expr(date_expr: Dict[str, Any]) -> Dict[str, Any]:
+    return {"$dateTrunc": {"date": date_expr, "unit": "day", "timezone": settings.analytics_timezone}}
+
+
+def _facet(accumulators: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "$facet": {
+            "all": [{"$group": {"_id": {"day": "$day", "key": "all"}, **accumulators}}],
+            "district": [{"$group": {"_id": {"day": "$day", "key": "$district"}, **accumulators}}],
+            "price_bucket": [{"$group": {"_id": {"day": "$day", "key": "$price_bucket"}, **accumulators}}],
+        }
+    }
+
+
+def _new_listings_pipeline(start: datetime, end: datetime) -> List[Dict[str, Any]]:
+    # _id carries the creation time and is always indexed, so the range match is cheap
+    return [
+        {"$match": {"_id": {"$gte": ObjectId.from_datetime(start), "$lt": ObjectId.from_datetime(end)}}},
+        {"$project": {
+            "price": 1,
+            "day": _day_expr({"$toDate": "$_id"}),
+            "district": DISTRICT_EXPR,
+            "price_bucket": PRICE_BUCKET_EXPR,
+            "price_per_m2": {"$cond": [{"$gt": ["$area", 0]}, {"$divide": ["$price", "$area"]}, None]},
+        }},
+        _facet({
+            "new_listings": {"$sum": 1},
+            "median_price": {"$median": {"input": "$price", "method": "approximate"}},
+            "median_price_per_m2": {"$median": {"input": "$price_per_m2", "method": "approximate"}},
+        }),
+    ]
+
+
+def _verified_listings_pipeline(start: datetime, end: datetime) -> List[Dict[str, Any]]:
+    # verified_at is stored as an ISO string, which sorts chronologically
+    return [
+        {"$match": {
+            "verification_status": "VERIFIED",
+            "verified_at": {"$gte": start.isoformat(), "$lt": end.isoformat()},
+        }},
+        {"$project": {
+            "day": _day_expr({"$dateFromString": {"dateString": "$verified_at"}}),
+            "district": DISTRICT_EXPR,
+            "price_bucket": PRICE_BUCKET_EXPR,
+        }},
+        _facet({"verified_listings": {"$sum": 1}}),
+    ]
+
+
+def _stat_id(day: datetime, dimension: str, key: str) -> str:
+    return f"{local_day(day).isoformat()}|{dimension}|{key}"
+
+
+async def _rollup_range(db, start_day: date, end_day: date) -> None:
+    start, end = local_midnight_utc(start_day), local_midnight_utc(end_day)
+    ops: List[UpdateOne] = []
+
+    # Every processed day gets an "all" row, so the latest one doubles as the watermark
+    d = start_day
+    while d < end_day:
+        day = local_midnight_utc(d)
+        ops.append(UpdateOne(
+            {"_id": _stat_id(day, "all", "all")},
+            {"$setOnInsert": {"day": day, "dimension": "all", "key": "all", "new_listings": 0, "verified_listings": 0,
+                              "median_price": None, "median_price_per_m2": None}},
+            upsert=True,
+        ))
+        d += timedelta(days=1)
+
+    for pipeline in (_new_listings_pipeline(start, end), _verified_listings_pipeline(start, end)):
+        facets = await db.listings.aggregate(pipeline).to_list(length=1)
+        for dimension, rows in (facets[0] if facets else {}).items():
+            for row in rows:
+                day, key = row["_id"]["day"], row["_id"]["key"]
+                if key is None or key == "":
+                    continue
+                fields = {k: v for k, v in row.items() if k != "_id"}
+                ops.append(UpdateOne(
+                    {"_id": _stat_id(day, dimension, key)},
+                    {"$set": {"day": day, "dimension": dimension, "key": key, **fields}},
+                    upsert=True,
+                ))
+
+    await db.listing_daily_stats.bulk_write(ops, ordered=True)
+
+
+async def run_daily_rollup(db) -> int:
+    """Roll up every complete local day not yet in listing_daily_stats. Returns days processed."""
+    last = await db.listing_daily_stats.find_one({"dimension": "all"}, sort=[("day", -1)])
+    if last:
+        start_day = local_day(last["day"]) + timedelta(days=1)
+    else:
+        first_listing = await db.listings.find_one({}, {"_id": 1}, sort=[("_id", 1)])
+        if not first_listing:
+            return 0
+        start_day = local_day(first_listing["_id"].generation_time.replace(tzinfo=None))
+
+    end_day = local_today()
+    processed = 0
+    while start_day < end_day:
+        chunk_end = min(start_day + timedelta(days=ROLLUP_CHUNK_DAYS), end_day)
+        await _rollup_range(db, start_day, chunk_end)
+        processed += (chunk_end - start_day).days
+        start_day = chunk_end
+    return processed
+
+
+async def query_timeseries(db, dimension: str, start_day: date, end_day: date, key: Optional[str] = None) -> List[Dict[str, Any]]:
+    filters: Dict[str, Any] = {
+        "dimension": dimension,
+        "day": {"$gte": local_midnight_utc(start_day), "$lt": local_midnight_utc(end_day + timedelta(days=1))},
+    }
+    if key is not None:
+        filters["key"] = key
+    cursor = db.listing_daily_stats.find(filters, {"_id": 0, "dimension": 0}).sort([("day", 1)])
+    points = []
+    async for doc in cursor:
+        doc["day"] = local_day(doc["day"]).isoformat()
+        points.append(doc)
+    return points
+
+
+async def run_rollup_scheduler(db, interval: float) -> None:
+    """Started in every worker; only the holder of the lease runs the rollup."""
+    owner = process_owner()
+    while True:
+        try:
+            if await hold_lease(db, "daily-rollup", owner, ttl=max(3 * interval, 60)):
+                processed = await run_daily_rollup(db)
+                if processed:
+                    print(f"[analytics] Rolled up {processed} day(s) into listing_daily_stats")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[analytics] Daily rollup failed: {e}")
+        await asyncio.sleep(interval)
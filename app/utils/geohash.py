@@ -0,0 +1,98 @@
+from math import floor
+from typing import List, Tuple
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_DECODE = {c: i for i, c in enumerate(_BASE32)}
+
+# Precision stored on listings (~4.8m x 4.8m cells); heatmaps group by a prefix of it
+STORED_PRECISION = 9
+
+
+def encode(lng: float, lat: float, precision: int = STORED_PRECISION) -> str:
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    chars = []
+    bits, ch, even = 0, 0, True
+    while len(chars) < precision:
+        if even:
+            mid = (lng_lo + lng_hi) / 2
+            if lng >= mid:
+                ch = (ch << 1) | 1
+                lng_lo = mid
+            else:
+                ch <<= 1
+                lng_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                ch = (ch << 1) | 1
+                lat_lo = mid
+            else:
+                ch <<= 1
+                lat_hi = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[ch])
+            bits, ch = 0, 0
+    return "".join(chars)
+
+
+def bounds(cell: str) -> Tuple[float, float, float, float]:
+    """Return (min_lng, min_lat, max_lng, max_lat) of a geohash cell."""
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    even = True
+    for c in cell:
+        v = _DECODE[c]
+        for shift in range(4, -1, -1):
+            bit = (v >> shift) & 1
+            if even:
+                mid = (lng_lo + lng_hi) / 2
+                if bit:
+                    lng_lo = mid
+                else:
+                    lng_hi = mid
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                if bit:
+                    lat_lo = mid
+                else:
+                    lat_hi = mid
+            even = not even
+    return lng_lo, lat_lo, lng_hi, lat_hi
+
+
+def cell_size(precision: int) -> Tuple[float, float]:
+    """Return (width, height) in degrees of cells at `precision`."""
+    total_bits = 5 * precision
+    lng_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 360.0 / (1 << lng_bits), 180.0 / (1 << lat_bits)
+
+
+def cover_count(bbox: Tuple[float, float, float, float], precision: int) -> int:
+    min_lng, min_lat, max_lng, max_lat = bbox
+    width, height = cell_size(precision)
+    cols = floor((max_lng + 180) / width) - floor((min_lng + 180) / width) + 1
+    rows = floor((max_lat + 90) / height) - floor((min_lat + 90) / height) + 1
+    return cols * rows
+
+
+def cover(bbox: Tuple[float, float, float, float], precision: int) -> List[str]:
+    """All cells at `precision` intersecting `bbox`. Check `cover_count` first for large boxes."""
+    min_lng, min_lat, max_lng, max_lat = bbox
+    width, height = cell_size(precision)
+    col0, col1 = floor((min_lng + 180) / width), floor((max_lng + 180) / width)
+    row0, row1 = floor((min_lat + 90) / height), floor((max_lat + 90) / height)
+    max_col, max_row = int(360 / width) - 1, int(180 / height) - 1
+    cells = []
+    for row in range(row0, min(row1, max_row) + 1):
+        for col in range(col0, min(col1, max_col) + 1):
+            cells.append(encode(-180 + (col + 0.5) * width, -90 + (row + 0.5) * height, precision))
+    return cells
+
+
+def intersects(cell: str, bbox: Tuple[float, float, float, float]) -> bool:
+    min_lng, min_lat, max_lng, max_lat = bounds(cell)
+    return min_lng <= bbox[2] and max_lng >= bbox[0] and min_lat <= bbox[3] and max_lat >= bbox[1]
@@ -0,0 +1,78 @@
+import hashlib
+from io import BytesIO
+from tempfile import SpooledTemporaryFile
+from typing import Any, BinaryIO, Dict, Optional
+from PIL import Image, ImageOps
+from pillow_heif import register_heif_opener
+from ..settings import settings
+from .uploads import FileTooLarge
+
+# iPhone photos arrive as HEIC, which Pillow only decodes through pillow-heif
+register_heif_opener()
+
+_HASH_CHUNK = 1024 * 1024
+
+
+class ImageTooLarge(Exception):
+    pass
+
+
+def content_hash(file: BinaryIO, limit: Optional[int] = None) -> str:
+    """sha256 of the whole file, read in chunks.
+
+    Raises FileTooLarge as soon as more than `limit` bytes were read, so an
+    upload whose size the client did not declare is still capped before it is
+    decoded.
+    """
+    file.seek(0)
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in iter(lambda: file.read(_HASH_CHUNK), b""):
+        size += len(chunk)
+        if limit is not None and size > limit:
+            raise FileTooLarge()
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def _to_rgb(img: Image.Image) -> Image.Image:
+    if img.mode in ("RGBA", "LA", "P"):
+        img = img.convert("RGBA")
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel("A"))
+        return background
+    return img.convert("RGB") if img.mode != "RGB" else img
+
+
+def _encode(img: Image.Image, out: BinaryIO) -> BinaryIO:
+    # Saving without exif= drops EXIF (GPS, camera serials) from the output
+    img.save(out, "JPEG", quality=settings.image_quality, optimize=True, progressive=True)
+    out.seek(0)
+    return out
+
+
+def prepare_image(file: BinaryIO) -> Dict[str, Any]:
+    """Decode, orient, downsize and re-encode an upload plus a card-size thumbnail.
+
+    Returns {image, thumbnail, width, height} with both images as rewound JPEG
+    files. Raises ImageTooLarge past IMAGE_MAX_PIXELS decoded pixels. CPU
+    bound; run it off the event loop.
+    """
+    file.seek(0)
+    max_side = settings.image_max_dimension
+    with Image.open(file) as img:
+        # JPEG can decode straight at 1/2, 1/4 or 1/8 scale, which saves most of the work on phone photos
+        img.draft("RGB", (max_side, max_side))
+        # Open only read the header; a small, highly compressed PNG can still decode to hundreds of MB
+        if img.width * img.height > settings.image_max_pixels:
+            raise ImageTooLarge()
+        img = ImageOps.exif_transpose(img)
+        img = _to_rgb(img)
+        img.thumbnail((max_side, max_side), Image.LANCZOS)
+        width, height = img.size
+        image = _encode(img, SpooledTemporaryFile(max_size=_HASH_CHUNK))
+        thumb_side = settings.thumbnail_size
+        img.thumbnail((thumb_side, thumb_side), Image.LANCZOS)
+        thumbnail = _encode(img, BytesIO())
+    return {"image": image, "thumbnail": thumbnail, "width": width, "height": height}
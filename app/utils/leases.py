@@ -0,0 +1,29 @@
+import os
+import socket
+from datetime import datetime, timedelta
+from pymongo.errors import DuplicateKeyError
+
+# Leader leases for background jobs that every worker starts but only one
+# should run: {_id: name, owner, expires_at} in the `leases` collection. The
+# holder renews on every run; when it dies the lease lapses after `ttl` and
+# the next worker to ask takes over.
+
+
+def process_owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+async def hold_lease(db, name: str, owner: str, ttl: float) -> bool:
+    """Take or renew the lease; False while another live process holds it."""
+    now = datetime.utcnow()
+    try:
+        # Matches our own or an expired lease; with no lease the upsert inserts
+        # one, and with someone else's live lease it collides on _id
+        await db.leases.update_one(
+            {"_id": name, "$or": [{"owner": owner}, {"expires_at": {"$lt": now}}]},
+            {"$set": {"owner": owner, "expires_at": now + timedelta(seconds=ttl)}},
+            upsert=True,
+        )
+        return True
+    except DuplicateKeyError:
+        return False
@@ -0,0 +1,116 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+
+# Development/canary aid: the event loop stamps a heartbeat every half
+# threshold; a daemon thread that notices a stale heartbeat grabs the loop
+# thread's Python stack. A coroutine stuck in synchronous code (bcrypt, a
+# blocking SDK call, a slow regex) still has its whole await chain on that
+# stack, down to the endpoint and the line doing the work.
+
+_APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_MAX_FRAMES = 15
+
+
+class WatchdogMiddleware:
+    """Pass-through; its frame on the stack is where a blocked request's scope is found."""
+
+    def __init__(self, app: Callable):
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        await self.app(scope, receive, send)
+
+
+_MIDDLEWARE_CODE = WatchdogMiddleware.__call__.__code__
+
+
+def _request_of(frame) -> str:
+    while frame is not None:
+        if frame.f_code is _MIDDLEWARE_CODE:
+            scope = frame.f_locals.get("scope") or {}
+            route = getattr(scope.get("route"), "path", scope.get("path", ""))
+            return f"{scope.get('method', scope.get('type', ''))} {route}".strip()
+        frame = frame.f_back
+    return "(no request)"
+
+
+def _app_stack(frame) -> List[traceback.FrameSummary]:
+    """The stack from the first application frame past the ASGI middlewares (usually
+    the endpoint) inward; library frames below it show the blocking call."""
+    frames = [f for f, _ in traceback.walk_stack(frame)][::-1]
+    codes = [f.f_code for f in frames]
+    first = codes.index(_MIDDLEWARE_CODE) + 1 if _MIDDLEWARE_CODE in codes else 0
+    stack = traceback.StackSummary.extract((f, f.f_lineno) for f in frames)
+    for i in range(first, len(stack)):
+        entry = stack[i]
+        if entry.filename.startswith(_APP_DIR) and entry.name != "__call__":
+            return stack[i:]
+    return stack[-_MAX_FRAMES:]
+
+
+class LoopWatchdog:
+    def __init__(self, threshold_ms: float):
+        self.threshold = threshold_ms / 1000
+        self.interval = self.threshold / 2
+        self._beat = time.monotonic()
+        self._loop_thread: Optional[int] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stop = threading.Event()
+        # (request, innermost application frame) -> stalls; only written by the watchdog thread
+        self.offenders: Counter = Counter()
+
+    def _heartbeat(self) -> None:
+        self._beat = time.monotonic()
+        if not self._stop.is_set():
+            self._loop.call_later(self.interval, self._heartbeat)
+
+    def start(self) -> None:
+        """Call from the event loop thread."""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._heartbeat()
+        threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.interval):
+            beat = self._beat
+            stalled = time.monotonic() - beat - self.interval
+            if stalled < self.threshold:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            self._report(frame, stalled)
+            # Report each stall once, then how long it lasted
+            while self._beat == beat and not self._stop.wait(self.interval):
+                pass
+            total = time.monotonic() - beat - self.interval
+            print(f"[loop-blocked] loop released after {total * 1000:.0f} ms")
+
+    def _report(self, frame, stalled: float) -> None:
+        request = _request_of(frame)
+        stack = _app_stack(frame)
+        app_frames = [entry for entry in stack if entry.filename.startswith(_APP_DIR)]
+        culprit = app_frames[-1] if app_frames else stack[-1]
+        where = f"{os.path.relpath(culprit.filename, os.path.dirname(_APP_DIR))}:{culprit.lineno} in {culprit.name}"
+        self.offenders[(request, where)] += 1
+        print(
+            f"[loop-blocked] {request} has held the event loop for {stalled * 1000:.0f} ms at {where}\n"
+            + "".join(traceback.format_list(stack)).rstrip()
+        )
+
+    def stats(self, limit: int = 10) -> List[Dict[str, Any]]:
+        return [
+            {"request": request, "where": where, "stalls": count}
+            # dict() copies in one step, so a concurrent report cannot break the iteration
+            for (request, where), count in Counter(dict(self.offenders)).most_common(limit)
+        ]
@@ -0,0 +1,41 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+# media: one document per distinct file per uploader, keyed "<owner_id>:<sha256>"
+# of its original bytes: {_id, owner_id, url, thumbnail_url, width, height, created_at}.
+# Direct uploads never pass through us, so they are keyed "<owner_id>:cloudinary:<public_id>".
+# Dedupe is per uploader: a hash match never hands one user's asset to another.
+
+
+def _media_id(owner_id: str, key: str) -> str:
+    return f"{owner_id}:{key}"
+
+
+async def find_media(db, owner_id: str, key: str) -> Optional[Dict[str, Any]]:
+    return await db.media.find_one({"_id": _media_id(owner_id, key)})
+
+
+async def record_media(db, owner_id: str, key: str, url: str, thumbnail_url: Optional[str], width: Optional[int] = None, height: Optional[int] = None) -> Dict[str, Any]:
+    """Store an uploaded asset; when two uploads of the same file race, the first one wins."""
+    media_id = _media_id(owner_id, key)
+    await db.media.update_one(
+        {"_id": media_id},
+        {"$setOnInsert": {
+            "owner_id": owner_id,
+            "url": url,
+            "thumbnail_url": thumbnail_url,
+            "width": width,
+            "height": height,
+            "created_at": datetime.utcnow(),
+        }},
+        upsert=True,
+    )
+    return await db.media.find_one({"_id": media_id})
+
+
+async def thumbnail_for(db, images: Optional[List[str]]) -> Optional[str]:
+    """Thumbnail of a listing's cover image, when it was uploaded through /upload."""
+    if not images:
+        return None
+    doc = await db.media.find_one({"url": images[0]}, {"thumbnail_url": 1})
+    return doc.get("thumbnail_url") if doc else None
@@ -0,0 +1,210 @@
+import asyncio
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from anyio import to_thread
+from pymongo import monitoring
+from . import passwords, uploads
+
+# Prometheus metrics for this worker process. Every thread writes to its own
+# shard (the event loop, Motor's executor threads, ...), so recording never
+# takes a lock; /metrics sums the shards when it is scraped. With several
+# uvicorn workers each process reports its own numbers.
+
+Labels = Tuple[str, ...]
+
+_HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+_MONGO_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+# name -> (type, help, label names, buckets)
+_METRICS: Dict[str, Tuple[str, str, Labels, Tuple[float, ...]]] = {
+    "http_request_duration_seconds": ("histogram", "HTTP request latency by route template", ("method", "route"), _HTTP_BUCKETS),
+    "http_requests_total": ("counter", "HTTP responses by route template and status code", ("method", "route", "status"), ()),
+    "mongodb_command_duration_seconds": ("histogram", "MongoDB command latency", ("collection", "command"), _MONGO_BUCKETS),
+    "mongodb_command_failures_total": ("counter", "MongoDB commands that returned an error", ("collection", "command"), ()),
+}
+
+
+class _Shard:
+    __slots__ = ("counters", "histograms", "pending")
+
+    def __init__(self):
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        # (name, labels) -> [per-bucket counts (last one is +Inf), sum]
+        self.histograms: Dict[Tuple[str, Labels], List[Any]] = {}
+        self.pending: Dict[Tuple[Any, int], Tuple[str, str]] = {}
+
+
+_local = threading.local()
+_shards: List[_Shard] = []
+
+
+def _shard() -> _Shard:
+    shard = getattr(_local, "shard", None)
+    if shard is None:
+        shard = _local.shard = _Shard()
+        _shards.append(shard)
+    return shard
+
+
+def inc(name: str, labels: Labels, amount: float = 1) -> None:
+    counters = _shard().counters
+    key = (name, labels)
+    counters[key] = counters.get(key, 0) + amount
+
+
+def observe(name: str, labels: Labels, value: float) -> None:
+    histograms = _shard().histograms
+    key = (name, labels)
+    buckets = _METRICS[name][3]
+    entry = histograms.get(key)
+    if entry is None:
+        entry = histograms[key] = [[0] * (len(buckets) + 1), 0.0]
+    entry[0][bisect_left(buckets, value)] += 1
+    entry[1] += value
+
+
+# Only touched from the event loop thread
+_gauges: Dict[str, float] = {"http_requests_in_flight": 0, "event_loop_lag_seconds": 0.0}
+
+
+class MetricsMiddleware:
+    """Counts requests by route template (not raw path, which would explode label cardinality)."""
+
+    def __init__(self, app: Callable):
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message: Dict[str, Any]) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        _gauges["http_requests_in_flight"] += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _gauges["http_requests_in_flight"] -= 1
+            route = getattr(scope.get("route"), "path", "unmatched")
+            method = scope.get("method", "")
+            observe("http_request_duration_seconds", (method, route), time.perf_counter() - started)
+            inc("http_requests_total", (method, route, str(status)))
+
+
+class CommandMetricsListener(monitoring.CommandListener):
+    """pymongo reports a command's start and end on the thread that ran it,
+    so the pending map lives in that thread's shard."""
+
+    def started(self, event) -> None:
+        target = event.command.get(event.command_name)
+        collection = target if isinstance(target, str) else ""
+        _shard().pending[(event.connection_id, event.request_id)] = (collection, event.command_name)
+
+    def _labels(self, event) -> Labels:
+        return _shard().pending.pop((event.connection_id, event.request_id), ("", event.command_name))
+
+    def succeeded(self, event) -> None:
+        observe("mongodb_command_duration_seconds", self._labels(event), event.duration_micros / 1e6)
+
+    def failed(self, event) -> None:
+        labels = self._labels(event)
+        observe("mongodb_command_duration_seconds", labels, event.duration_micros / 1e6)
+        inc("mongodb_command_failures_total", labels)
+
+
+command_metrics = CommandMetricsListener()
+
+
+async def run_loop_lag_monitor(interval: float) -> None:
+    """Sleep `interval` seconds in a loop; whatever it oversleeps is time the loop was busy elsewhere."""
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        _gauges["event_loop_lag_seconds"] = max(0.0, loop.time() - expected)
+
+
+def _threadpools() -> List[Tuple[str, int, int]]:
+    """(pool, busy threads, queued calls) for each pool the app offloads blocking work to."""
+    # run_in_threadpool (email, sync endpoints) goes through anyio's default limiter
+    limiter = to_thread.current_default_thread_limiter().statistics()
+    hashing = passwords.stats()
+    upload = uploads.stats()
+    return [
+        ("anyio", limiter.borrowed_tokens, limiter.tasks_waiting),
+        ("bcrypt", hashing["in_flight"] - hashing["queue_depth"], hashing["queue_depth"]),
+        ("upload", upload["busy"], upload["queue_depth"]),
+    ]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_str(names: Labels, values: Labels, extra: Optional[str] = None) -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format (0.0.4). Call from the event loop."""
+    counters: Dict[Tuple[str, Labels], float] = {}
+    histograms: Dict[Tuple[str, Labels], List[Any]] = {}
+    for shard in list(_shards):
+        for key, value in list(shard.counters.items()):
+            counters[key] = counters.get(key, 0) + value
+        for key, (buckets, total) in list(shard.histograms.items()):
+            merged = histograms.setdefault(key, [[0] * len(buckets), 0.0])
+            merged[0] = [a + b for a, b in zip(merged[0], buckets)]
+            merged[1] += total
+
+    lines: List[str] = []
+    for name, (kind, help_text, label_names, bucket_bounds) in _METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == "counter":
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{_label_str(label_names, labels)} {_format(value)}")
+            continue
+        for (metric, labels), (buckets, total) in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(bucket_bounds + (float("inf"),), buckets):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = _label_str(label_names, labels, f'le="{le}"')
+                lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{name}_sum{_label_str(label_names, labels)} {_format(total)}")
+            lines.append(f"{name}_count{_label_str(label_names, labels)} {cumulative}")
+
+    lines.append("# HELP http_requests_in_flight HTTP requests currently being served")
+    lines.append("# TYPE http_requests_in_flight gauge")
+    lines.append(f"http_requests_in_flight {int(_gauges['http_requests_in_flight'])}")
+    lines.append("# HELP event_loop_lag_seconds How late the last event loop lag probe woke up")
+    lines.append("# TYPE event_loop_lag_seconds gauge")
+    lines.append(f"event_loop_lag_seconds {_format(_gauges['event_loop_lag_seconds'])}")
+    pools = _threadpools()
+    lines.append("# HELP threadpool_active_threads Threads busy running offloaded calls")
+    lines.append("# TYPE threadpool_active_threads gauge")
+    lines.extend(f'threadpool_active_threads{{pool="{pool}"}} {busy}' for pool, busy, _ in pools)
+    lines.append("# HELP threadpool_queue_depth Offloaded calls waiting for a free thread")
+    lines.append("# TYPE threadpool_queue_depth gauge")
+    lines.extend(f'threadpool_queue_depth{{pool="{pool}"}} {queued}' for pool, _, queued in pools)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,156 @@
+import threading
+from collections import Counter
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+from pymongo import monitoring
+
+# pymongo fires these events from Motor's executor threads, hence the lock;
+# each handler only bumps a few counters while holding it.
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """Connection pool counters summed over every server in the topology."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.open = 0
+        self.checked_out = 0
+        self.waiters = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.wait_ms_total = 0.0
+        self.wait_ms_max = 0.0
+        self.pool_clears = 0
+
+    def _waited(self, duration: float) -> None:
+        wait_ms = duration * 1000
+        self.waiters -= 1
+        self.wait_ms_total += wait_ms
+        self.wait_ms_max = max(self.wait_ms_max, wait_ms)
+
+    def connection_check_out_started(self, event) -> None:
+        with self._lock:
+            self.waiters += 1
+
+    def connection_checked_out(self, event) -> None:
+        with self._lock:
+            self._waited(event.duration)
+            self.checked_out += 1
+            self.checkouts += 1
+
+    def connection_check_out_failed(self, event) -> None:
+        with self._lock:
+            self._waited(event.duration)
+            self.checkout_failures += 1
+
+    def connection_checked_in(self, event) -> None:
+        with self._lock:
+            self.checked_out -= 1
+
+    def connection_created(self, event) -> None:
+        with self._lock:
+            self.open += 1
+
+    def connection_closed(self, event) -> None:
+        with self._lock:
+            self.open -= 1
+
+    def pool_cleared(self, event) -> None:
+        with self._lock:
+            self.pool_clears += 1
+
+    def pool_created(self, event) -> None:
+        pass
+
+    def pool_ready(self, event) -> None:
+        pass
+
+    def pool_closed(self, event) -> None:
+        pass
+
+    def connection_ready(self, event) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            completed = self.checkouts + self.checkout_failures
+            return {
+                "open": self.open,
+                "checked_out": self.checked_out,
+                "waiters": self.waiters,
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "wait_ms_avg": round(self.wait_ms_total / (completed or 1), 2),
+                "wait_ms_max": round(self.wait_ms_max, 2),
+                "pool_clears": self.pool_clears,
+            }
+
+
+pool_stats = PoolStatsListener()
+
+
+def command_shape(command_name: str, command: Dict[str, Any]) -> str:
+    """`find listings {owner_id,status}`: collection and filter keys, never values."""
+    target = command.get(command_name)
+    collection = target if isinstance(target, str) else ""
+    if command_name == "aggregate":
+        stages = [next(iter(stage), "?") for stage in command.get("pipeline", [])]
+        return f"aggregate {collection} [{','.join(stages)}]"
+    spec: Any = None
+    if command_name in ("find", "findAndModify", "delete", "update", "count", "distinct"):
+        spec = command.get("filter", command.get("query"))
+        if command_name in ("update", "delete"):
+            ops = command.get("updates" if command_name == "update" else "deletes") or [{}]
+            spec = ops[0].get("q")
+    keys = ",".join(spec.keys()) if isinstance(spec, dict) else ""
+    return f"{command_name} {collection} {{{keys}}}".strip()
+
+
+class RequestCommandStats:
+    """Mongo commands issued while serving one request."""
+
+    __slots__ = ("count", "duration_ms", "shapes", "_pending")
+
+    def __init__(self):
+        self.count = 0
+        self.duration_ms = 0.0
+        self.shapes: Counter = Counter()
+        self._pending: Dict[Tuple[Any, int], str] = {}
+
+    def top_shapes(self, limit: int = 5) -> List[Tuple[str, int]]:
+        return self.shapes.most_common(limit)
+
+
+request_stats: ContextVar[Optional[RequestCommandStats]] = ContextVar("mongo_request_stats", default=None)
+
+
+class RequestCommandListener(monitoring.CommandListener):
+    """Charges each command to the request whose context issued it.
+
+    Motor runs pymongo calls on its executor with a copy of the caller's
+    contextvars, so request_stats resolves to the request here too. Only
+    registered when REQUEST_PROFILING is on.
+    """
+
+    def started(self, event) -> None:
+        stats = request_stats.get()
+        if stats is not None:
+            stats._pending[(event.connection_id, event.request_id)] = command_shape(event.command_name, event.command)
+
+    def _finish(self, event) -> None:
+        stats = request_stats.get()
+        if stats is None:
+            return
+        shape = stats._pending.pop((event.connection_id, event.request_id), event.command_name)
+        stats.count += 1
+        stats.duration_ms += event.duration_micros / 1000
+        stats.shapes[shape] += 1
+
+    def succeeded(self, event) -> None:
+        self._finish(event)
+
+    def failed(self, event) -> None:
+        self._finish(event)
+
+
+command_listener = RequestCommandListener()
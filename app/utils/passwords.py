@@ -0,0 +1,110 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+import bcrypt
+from ..settings import settings
+
+# bcrypt releases the GIL while hashing, so a thread pool sized to the cores
+# runs hashes in parallel without blocking the event loop.
+_executor: Optional[ThreadPoolExecutor] = None
+
+# Only touched from the event loop thread, so no locking is needed
+_stats: Dict[str, float] = {
+    "in_flight": 0,
+    "completed": 0,
+    "hash_ms_total": 0.0,
+    "hash_ms_max": 0.0,
+    "wait_ms_total": 0.0,
+    "wait_ms_max": 0.0,
+}
+
+
+def pool_size() -> int:
+    return settings.password_hash_workers or os.cpu_count() or 1
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=pool_size(), thread_name_prefix="bcrypt")
+    return _executor
+
+
+def _timed(fn: Callable[..., Any], *args: Any) -> Tuple[Any, float, float]:
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, started, time.perf_counter()
+
+
+async def _run(fn: Callable[..., Any], *args: Any) -> Any:
+    loop = asyncio.get_running_loop()
+    submitted = time.perf_counter()
+    _stats["in_flight"] += 1
+    try:
+        result, started, finished = await loop.run_in_executor(_get_executor(), _timed, fn, *args)
+    finally:
+        _stats["in_flight"] -= 1
+    hash_ms = (finished - started) * 1000
+    wait_ms = (started - submitted) * 1000
+    _stats["completed"] += 1
+    _stats["hash_ms_total"] += hash_ms
+    _stats["hash_ms_max"] = max(_stats["hash_ms_max"], hash_ms)
+    _stats["wait_ms_total"] += wait_ms
+    _stats["wait_ms_max"] = max(_stats["wait_ms_max"], wait_ms)
+    return result
+
+
+def _hash_sync(password: str, rounds: int) -> str:
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds)).decode("utf-8")
+
+
+def _check_sync(password: str, password_hash: str) -> bool:
+    return bcrypt.checkpw(password.encode("utf-8"), password_hash.encode("utf-8"))
+
+
+async def hash_password(password: str) -> str:
+    return await _run(_hash_sync, password, settings.bcrypt_rounds)
+
+
+async def verify_password(password: str, password_hash: str) -> bool:
+    try:
+        return await _run(_check_sync, password, password_hash)
+    except ValueError:
+        # Malformed stored hash
+        return False
+
+
+def hash_rounds(password_hash: str) -> Optional[int]:
+    """Cost factor of a `$2b$12$...` hash, or None when it cannot be read."""
+    parts = password_hash.split("$")
+    if len(parts) < 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
+
+def needs_rehash(password_hash: str) -> bool:
+    return hash_rounds(password_hash) != settings.bcrypt_rounds
+
+
+def stats() -> Dict[str, Any]:
+    completed = _stats["completed"] or 1
+    workers = pool_size()
+    return {
+        "workers": workers,
+        "in_flight": int(_stats["in_flight"]),
+        "queue_depth": max(0, int(_stats["in_flight"]) - workers),
+        "completed": int(_stats["completed"]),
+        "hash_ms_avg": round(_stats["hash_ms_total"] / completed, 2),
+        "hash_ms_max": round(_stats["hash_ms_max"], 2),
+        "wait_ms_avg": round(_stats["wait_ms_total"] / completed, 2),
+        "wait_ms_max": round(_stats["wait_ms_max"], 2),
+    }
+
+
+def shutdown() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
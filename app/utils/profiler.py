@@ -0,0 +1,184 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# In-process sampling profiler. A daemon thread wakes every interval, reads
+# every thread's Python stack from sys._current_frames() and counts identical
+# stacks; nothing is instrumented, so the cost is one stack walk per thread
+# per tick and only while a profile is running.
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Innermost frames of a thread that is waiting rather than running
+_IDLE_FILES = ("selectors.py", "threading.py", "queue.py")
+
+Frame = Tuple[str, str, int]
+
+
+class ProfilerMiddleware:
+    """Lets a route-filtered profile tell which request the event loop is running."""
+
+    def __init__(self, app: Callable):
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if _session is None or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            session = _session
+            if session is not None and session.matches(scope):
+                session.request_finished()
+
+
+_MIDDLEWARE_CODE = ProfilerMiddleware.__call__.__code__
+
+
+def _frame_key(code) -> Frame:
+    filename = code.co_filename
+    if filename.startswith(_ROOT):
+        filename = os.path.relpath(filename, _ROOT)
+    else:
+        # Library and stdlib frames: `asyncio/base_events.py` is enough to recognise them
+        filename = os.path.join(*filename.split(os.sep)[-2:])
+    return (code.co_name, filename, code.co_firstlineno)
+
+
+class ProfileSession:
+    def __init__(self, interval: float, route: Optional[str] = None, method: Optional[str] = None, requests: int = 0):
+        self.interval = interval
+        self.route = route
+        self.method = method.upper() if method else None
+        self.requests = requests
+        self.completed = 0
+        self.samples: Counter = Counter()
+        self.started = time.perf_counter()
+        self.duration = 0.0
+        self.done = asyncio.Event()
+        self._loop_thread = threading.get_ident()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def matches(self, scope: Dict[str, Any]) -> bool:
+        route = getattr(scope.get("route"), "path", None)
+        return route == self.route and (self.method is None or scope.get("method") == self.method)
+
+    def request_finished(self) -> None:
+        """Called on the event loop when a matching request completes."""
+        self.completed += 1
+        if self.requests and self.completed >= self.requests:
+            self.done.set()
+
+    def _serving_route(self, frame) -> bool:
+        while frame is not None:
+            if frame.f_code is _MIDDLEWARE_CODE:
+                return self.matches(frame.f_locals.get("scope") or {})
+            frame = frame.f_back
+        return False
+
+    def _sample(self) -> None:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        own = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            if self.route is not None and (ident != self._loop_thread or not self._serving_route(frame)):
+                continue
+            if os.path.basename(frame.f_code.co_filename) in _IDLE_FILES:
+                continue
+            stack: List[Frame] = []
+            while frame is not None:
+                stack.append(_frame_key(frame.f_code))
+                frame = frame.f_back
+            stack.append((names.get(ident, f"thread-{ident}"), "", 0))
+            self.samples[tuple(reversed(stack))] += 1
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self.started
+
+
+_session: Optional[ProfileSession] = None
+
+
+def busy() -> bool:
+    return _session is not None
+
+
+async def profile(interval: float, seconds: float, route: Optional[str] = None, method: Optional[str] = None, requests: int = 0) -> ProfileSession:
+    """Sample for `seconds`, or until `requests` requests to `route` have finished
+    (with `seconds` as the time limit). One profile per process at a time."""
+    global _session
+    session = ProfileSession(interval, route, method, requests)
+    _session = session
+    session.start()
+    try:
+        try:
+            await asyncio.wait_for(session.done.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+    finally:
+        _session = None
+        await asyncio.get_running_loop().run_in_executor(None, session.stop)
+    return session
+
+
+def _label(frame: Frame) -> str:
+    name, filename, line = frame
+    label = f"{name} ({filename}:{line})" if filename else name
+    # ';' separates frames in the collapsed format
+    return label.replace(";", ":")
+
+
+def to_collapsed(session: ProfileSession) -> str:
+    """Brendan Gregg's collapsed stacks, one `frame;frame;... count` line per stack (flamegraph.pl, speedscope)."""
+    lines = [f"{';'.join(_label(f) for f in stack)} {count}" for stack, count in session.samples.most_common()]
+    return "\n".join(lines) + "\n"
+
+
+def to_speedscope(session: ProfileSession, name: str) -> Dict[str, Any]:
+    """The speedscope "sampled" file format; identical stacks are merged into one weighted sample."""
+    frames: List[Dict[str, Any]] = []
+    index: Dict[Frame, int] = {}
+    samples: List[List[int]] = []
+    weights: List[float] = []
+    for stack, count in session.samples.most_common():
+        ids = []
+        for frame in stack:
+            if frame not in index:
+                index[frame] = len(frames)
+                entry: Dict[str, Any] = {"name": frame[0]}
+                if frame[1]:
+                    entry.update(file=frame[1], line=frame[2])
+                frames.append(entry)
+            ids.append(index[frame])
+        samples.append(ids)
+        weights.append(round(count * session.interval, 6))
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": name,
+        "exporter": "roommate-backend",
+        "shared": {"frames": frames},
+        "profiles": [{
+            "type": "sampled",
+            "name": name,
+            "unit": "seconds",
+            "startValue": 0,
+            "endValue": round(sum(weights), 6),
+            "samples": samples,
+            "weights": weights,
+        }],
+    }
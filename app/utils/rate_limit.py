@@ -0,0 +1,102 @@
+import math
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Tuple
+from pymongo import ReturnDocument
+from ..settings import settings
+
+# Sliding-window counter: keep only the counts of the current and previous fixed
+# windows and weight the previous one by how much of it still overlaps the
+# sliding window. Two integers per key, constant work per hit.
+
+
+class MemoryBackend:
+    """Per-process counters; fine for a single worker."""
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        # key -> (window index, previous window count, current window count), least recently hit first
+        self._windows: "OrderedDict[str, Tuple[int, int, int]]" = OrderedDict()
+
+    async def hit(self, key: str, window_index: int, window: int) -> Tuple[int, int]:
+        idx, prev, cur = self._windows.pop(key, (window_index, 0, 0))
+        if idx != window_index:
+            prev = cur if idx == window_index - 1 else 0
+            cur = 0
+        cur += 1
+        self._windows[key] = (window_index, prev, cur)
+        if len(self._windows) > self.max_keys:
+            # Drop the least recently hit half at once so eviction stays amortised O(1)
+            for _ in range(len(self._windows) - self.max_keys // 2):
+                self._windows.popitem(last=False)
+        return prev, cur
+
+
+class MongoBackend:
+    """Counters shared by every worker, one small document per key and window."""
+
+    def __init__(self, db):
+        self.db = db
+
+    async def hit(self, key: str, window_index: int, window: int) -> Tuple[int, int]:
+        doc = await self.db.rate_limits.find_one_and_update(
+            {"_id": f"{key}|{window_index}"},
+            {
+                "$inc": {"count": 1},
+                "$setOnInsert": {"expires_at": datetime.utcnow() + timedelta(seconds=2 * window)},
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        prev = await self.db.rate_limits.find_one({"_id": f"{key}|{window_index - 1}"}, {"count": 1})
+        return (prev or {}).get("count", 0), doc["count"]
+
+
+_memory = MemoryBackend()
+
+
+def _backend(db):
+    if settings.rate_limit_backend == "mongo":
+        return MongoBackend(db)
+    return _memory
+
+
+def client_ip(request) -> str:
+    if settings.trust_forwarded_for:
+        # Only behind a proxy that overwrites the header; otherwise clients pick their own key
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else ""
+
+
+def _retry_after(prev: int, cur: int, limit: int, elapsed: float, window: int) -> int:
+    """Seconds until one more attempt would fit under `limit` again."""
+    room = limit - 1 - cur
+    if room >= 0:
+        # Wait for enough of the previous window to slide out
+        needed = 1 - room / prev
+        return max(1, math.ceil(needed * window - elapsed))
+    # The current window alone is full: wait for it to end, then for it to slide out as the previous one
+    needed = 1 - (limit - 1) / cur
+    return max(1, math.ceil(window - elapsed + needed * window))
+
+
+async def hit(db, scope: str, identity: str, limit: int, window: int) -> int:
+    """Count one attempt for `identity` in `scope`.
+
+    Returns 0 when the attempt is allowed, otherwise the number of seconds to
+    put in Retry-After. Rejected attempts are counted too, so a client that
+    keeps hammering stays blocked. A limit of 0 disables the check.
+    """
+    if limit <= 0 or not identity:
+        return 0
+    now = time.time()
+    window_index = int(now // window)
+    elapsed = now - window_index * window
+    prev, cur = await _backend(db).hit(f"{scope}:{identity}", window_index, window)
+    estimate = prev * (1 - elapsed / window) + cur
+    if estimate <= limit:
+        return 0
+    return _retry_after(prev, cur, limit, elapsed, window)
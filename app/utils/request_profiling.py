@@ -0,0 +1,49 @@
+import time
+from typing import Any, Callable, Dict
+from .mongo_monitoring import RequestCommandStats, request_stats
+from ..settings import settings
+
+
+def _format_shapes(stats: RequestCommandStats) -> str:
+    return "; ".join(f"{count}x {shape}" for shape, count in stats.top_shapes())
+
+
+class RequestProfilingMiddleware:
+    """Adds `Server-Timing: db;dur=..;desc="N cmds", app;dur=..` to every HTTP response
+    and logs requests over SLOW_REQUEST_MS or SLOW_REQUEST_COMMANDS.
+
+    Plain ASGI so the ContextVar set here is the one the endpoint (and Motor's
+    executor) sees. Only installed when REQUEST_PROFILING is on.
+    """
+
+    def __init__(self, app: Callable):
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestCommandStats()
+        token = request_stats.set(stats)
+        started = time.perf_counter()
+
+        async def send_with_timing(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                app_ms = (time.perf_counter() - started) * 1000
+                timing = f'db;dur={stats.duration_ms:.1f};desc="{stats.count} cmds", app;dur={app_ms:.1f}'
+                message["headers"] = list(message.get("headers", [])) + [(b"server-timing", timing.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            request_stats.reset(token)
+            total_ms = (time.perf_counter() - started) * 1000
+            if total_ms >= settings.slow_request_ms or stats.count >= settings.slow_request_commands:
+                route = scope.get("route")
+                path = getattr(route, "path", scope.get("path", ""))
+                print(
+                    f"[slow-request] {scope.get('method')} {path} {total_ms:.0f} ms, "
+                    f"{stats.count} cmds / {stats.duration_ms:.0f} ms db: {_format_shapes(stats)}"
+                )
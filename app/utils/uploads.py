@@ -0,0 +1,172 @@
+import asyncio
+import hmac
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, BinaryIO, Callable, Dict, Optional
+import cloudinary
+import cloudinary.uploader
+import cloudinary.utils
+from ..settings import settings
+
+LISTING_FOLDER = "roommate-listings"
+ALLOWED_FORMATS = "jpg,jpeg,png,webp,heic"
+# Cloudinary refuses signed requests whose timestamp is more than an hour old
+SIGNATURE_TTL = 3600
+
+# The Cloudinary SDK is blocking (urllib3), so uploads run on their own bounded
+# pool; a burst of uploads queues here instead of stalling the event loop.
+_executor: Optional[ThreadPoolExecutor] = None
+# Calls submitted to the pool and not yet finished; only touched from the event loop
+_in_flight = 0
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.upload_workers, thread_name_prefix="upload")
+    return _executor
+
+
+async def _submit(fn: Callable[..., Any], *args: Any) -> Any:
+    global _in_flight
+    loop = asyncio.get_running_loop()
+    _in_flight += 1
+    try:
+        return await loop.run_in_executor(_get_executor(), fn, *args)
+    finally:
+        _in_flight -= 1
+
+
+async def run_blocking(fn: Callable[..., Any], *args: Any) -> Any:
+    """Run hashing/decoding work for an upload on the upload pool."""
+    return await _submit(fn, *args)
+
+
+class FileTooLarge(Exception):
+    pass
+
+
+class _LimitedReader:
+    """Read-only view of a file that fails once more than `limit` bytes were read,
+    or when a non-empty read comes after `deadline` (time.monotonic()).
+
+    Closing it leaves the underlying file open; UploadFile owns that.
+    """
+
+    def __init__(self, raw: BinaryIO, limit: int):
+        self.raw = raw
+        self.limit = limit
+        self.consumed = 0
+        self.deadline: Optional[float] = None
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self.raw.read(size)
+        self.consumed += len(chunk)
+        if self.consumed > self.limit:
+            raise FileTooLarge()
+        # upload_large reads each chunk right before sending it, so this stops an
+        # overdue upload before its next part; the final empty read never fails,
+        # which would throw away an upload that already completed
+        if chunk and self.deadline is not None and time.monotonic() > self.deadline:
+            raise asyncio.TimeoutError()
+        return chunk
+
+    def tell(self) -> int:
+        return self.raw.tell()
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        return self.raw.seek(offset, whence)
+
+    def __enter__(self) -> "_LimitedReader":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        pass
+
+
+def _upload_sync(reader: _LimitedReader, options: Dict[str, Any]) -> Dict[str, Any]:
+    # The deadline starts when a worker picks the job up; time queued behind other uploads does not count
+    reader.deadline = time.monotonic() + options["timeout"]
+    # upload_large sends chunk_size slices, so at most one chunk per upload is in memory
+    return cloudinary.uploader.upload_large(reader, **options)
+
+
+async def upload_image(file: BinaryIO, filename: Optional[str] = None, **options: Any) -> Dict[str, Any]:
+    """Stream one image from `file` off the event loop.
+
+    Raises FileTooLarge past UPLOAD_MAX_BYTES and asyncio.TimeoutError when
+    the upload is still sending parts UPLOAD_TIMEOUT seconds after a worker
+    started it. Each part request is bounded by the SDK's own timeout. There is
+    no outer wait_for: abandoning a running thread would let it finish and
+    leave an asset in Cloudinary that nothing references.
+    """
+    options = {
+        "resource_type": "image",
+        "timeout": settings.upload_timeout,
+        "chunk_size": settings.upload_chunk_size,
+        "filename": filename or "image",
+        **options,
+    }
+    file.seek(0)
+    reader = _LimitedReader(file, settings.upload_max_bytes)
+    return await _submit(_upload_sync, reader, options)
+
+
+def thumbnail_transformation() -> str:
+    side = settings.thumbnail_size
+    return f"c_limit,w_{side},h_{side}"
+
+
+def sign_upload(public_id: str, timestamp: Optional[int] = None) -> Dict[str, Any]:
+    """Parameters for a direct browser-to-Cloudinary upload of exactly `public_id`.
+
+    Pure computation over the configured credentials; no network call.
+    """
+    timestamp = timestamp or int(time.time())
+    params = {
+        "timestamp": timestamp,
+        "public_id": public_id,
+        "allowed_formats": ALLOWED_FORMATS,
+        # Cloudinary builds the card thumbnail at upload time
+        "eager": thumbnail_transformation(),
+    }
+    return {
+        **params,
+        "signature": cloudinary.utils.api_sign_request(params, settings.cloudinary_api_secret),
+        "api_key": settings.cloudinary_api_key,
+        "upload_url": f"https://api.cloudinary.com/v1_1/{settings.cloudinary_cloud_name}/image/upload",
+        "expires_at": timestamp + SIGNATURE_TTL,
+    }
+
+
+def verify_upload_response(public_id: str, version: int, signature: str) -> bool:
+    """Check the signature Cloudinary puts on upload responses (public_id + version)."""
+    expected = cloudinary.utils.api_sign_request({"public_id": public_id, "version": version}, settings.cloudinary_api_secret)
+    return hmac.compare_digest(expected, signature)
+
+
+def delivery_url(public_id: str, version: int, transformation: Optional[str] = None) -> str:
+    url, _ = cloudinary.utils.cloudinary_url(
+        public_id,
+        version=version,
+        secure=True,
+        raw_transformation=transformation,
+        cloud_name=settings.cloudinary_cloud_name,
+    )
+    return url
+
+
+def stats() -> Dict[str, int]:
+    workers = settings.upload_workers
+    return {
+        "workers": workers,
+        "busy": min(_in_flight, workers),
+        "queue_depth": max(0, _in_flight - workers),
+    }
+
+
+def shutdown() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
@@ -0,0 +1,74 @@
+import hashlib
+import math
+import secrets
+from datetime import datetime, timedelta
+from typing import Optional
+from bson import ObjectId
+from pymongo.errors import OperationFailure
+from ..settings import settings
+
+# Only the sha256 of a token is stored, so a leaked collection cannot verify anyone.
+# Documents: {user_id, token_hash, created_at}; the TTL index on created_at removes them.
+
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+async def ensure_indexes(db) -> None:
+    ttl = settings.verification_token_ttl
+    await db.verification_tokens.create_index([("token_hash", 1)], unique=True)
+    await db.verification_tokens.create_index([("user_id", 1)])
+    try:
+        await db.verification_tokens.create_index([("created_at", 1)], expireAfterSeconds=ttl)
+    except OperationFailure:
+        await sync_ttl(db)
+
+
+async def sync_ttl(db) -> bool:
+    """Apply VERIFICATION_TOKEN_TTL to the existing TTL index; True if it had to change.
+
+    The index is built once by a migration, so a later TTL change is only picked
+    up here (called at startup).
+    """
+    ttl = settings.verification_token_ttl
+    for spec in (await db.verification_tokens.index_information()).values():
+        if spec.get("key") == [("created_at", 1)] and "expireAfterSeconds" in spec:
+            if spec["expireAfterSeconds"] == ttl:
+                return False
+            await db.command("collMod", "verification_tokens", index={"keyPattern": {"created_at": 1}, "expireAfterSeconds": ttl})
+            print(f"[auth] Verification token TTL changed {spec['expireAfterSeconds']} -> {ttl}s")
+            return True
+    return False
+
+
+async def seconds_until_resend(db, user_id: ObjectId) -> int:
+    """0 when a new email may be sent, else how long the user still has to wait."""
+    latest = await db.verification_tokens.find_one({"user_id": user_id}, {"created_at": 1})
+    if not latest:
+        return 0
+    wait = settings.verification_resend_interval - (datetime.utcnow() - latest["created_at"]).total_seconds()
+    return max(0, math.ceil(wait))
+
+
+async def issue_verification_token(db, user_id: ObjectId) -> str:
+    """Replace the user's outstanding token with a new one and return it in clear."""
+    token = secrets.token_urlsafe(32)
+    await db.verification_tokens.delete_many({"user_id": user_id})
+    await db.verification_tokens.insert_one({
+        "user_id": user_id,
+        "token_hash": hash_token(token),
+        "created_at": datetime.utcnow(),
+    })
+    return token
+
+
+async def consume_verification_token(db, token: str) -> Optional[ObjectId]:
+    """Delete the token and return its user id, or None if unknown or expired."""
+    doc = await db.verification_tokens.find_one_and_delete({"token_hash": hash_token(token)})
+    if not doc:
+        return None
+    # The TTL monitor only runs once a minute, so check expiry ourselves as well
+    if doc["created_at"] < datetime.utcnow() - timedelta(seconds=settings.verification_token_ttl):
+        return None
+    return doc["user_id"]
@@ -0,0 +1,240 @@
+"""Time the read paths of the main routers in-process, one case per endpoint.
+
+    python -m benchmarks.api --requests 200 > api.json
+    python -m benchmarks.api --mongomock                      # no mongod (pip install mongomock-motor)
+    python -m benchmarks.api --baseline api.json              # exit 1 on regressions
+
+Requests go through httpx's ASGI transport straight into the app, against a
+dedicated database (`<MONGODB_DB>_bench` unless --db is given) that is wiped
+and seeded with the benchmarks.datagen data set for --seed. Per case it reports p50/p99
+latency of sequential requests, throughput at --concurrency, and MongoDB
+commands per request (mongod only; mongomock issues no driver commands).
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional
+import httpx
+from app.settings import settings
+from . import datagen
+
+
+async def _seed(db, seed: int, users: int, listings: int) -> Dict[str, Any]:
+    """Wipe the bench collections and load the datagen data set for `seed` (same generator, in-process)."""
+    from app.migrations import backfill_favorite_counts
+    for name in ("users", "profiles", "listings", "favorites", "connections", "notifications", "reviews", "analytics_snapshots"):
+        await db[name].delete_many({})
+    counts = {"users": users, "listings": listings, "favorites_per_user": 8, "connections_per_user": 2}
+    data: Dict[str, List[Dict[str, Any]]] = {}
+    for name, chunk in datagen.tasks(counts):
+        for collection, docs in datagen.generate(name, chunk, seed, counts, password_hash="").items():
+            data.setdefault(collection, []).extend(docs)
+    for collection, docs in data.items():
+        if docs:
+            await db[collection].insert_many(docs, ordered=False)
+    await backfill_favorite_counts(db)
+    return data
+
+
+def _cases(data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """(router, name, method, url, params, json, user) for every benchmarked request."""
+    from app.security import issue_tokens
+    users = data["users"]
+    listing = next(l for l in data["listings"] if l["status"] == "ACTIVE" and l["verification_status"] == "VERIFIED")
+    owner = next(u for u in users if u["_id"] == listing["owner_id"])
+    # matching needs a profile with a budget and a location
+    with_profile = {p["user_id"] for p in data["profiles"]}
+    user = next(u for u in users[1:] if u["_id"] != owner["_id"] and u["_id"] in with_profile)
+    lng, lat = listing["location"]["coordinates"]
+
+    def case(router, name, url, params=None, user_doc=None, method="GET", body=None, server_only=False):
+        headers = {"Authorization": f"Bearer {issue_tokens(user_doc)['access_token']}"} if user_doc else {}
+        return {"router": router, "name": name, "method": method, "url": url, "params": params or {}, "json": body, "headers": headers, "server_only": server_only}
+
+    listing_id = str(listing["_id"])
+    # one page of search results, as a listing grid would check them
+    page_ids = [str(l["_id"]) for l in data["listings"][:20]]
+    return [
+        case("listings", "search", "/listings", {"limit": 20}),
+        case("listings", "search_filters", "/listings", {"min_price": 2_000_000, "max_price": 5_000_000, "amenities": "wifi,ac", "pet": True}),
+        case("listings", "search_province", "/listings", {"province": "Thành phố Hà Nội"}),
+        case("listings", "search_text", "/listings", {"q": "Nguyễn Trãi"}, server_only=True),
+        case("listings", "search_near", "/listings", {"lng": lng, "lat": lat, "radius_km": 3}, server_only=True),
+        case("listings", "detail", f"/listings/{listing_id}"),
+        case("listings", "my", "/listings/my", user_doc=owner),
+        case("listings", "user_state", "/listings/user-state", user_doc=user, method="POST", body={"listing_ids": page_ids}),
+        case("matching", "rooms", "/matching/rooms", {"top_k": 10}, user_doc=user),
+        case("analytics", "overview", "/analytics/overview"),
+        case("analytics", "by_location", "/analytics/by-location"),
+        case("analytics", "by_price_range", "/analytics/by-price-range"),
+        case("analytics", "amenities_stats", "/analytics/amenities-stats"),
+        case("analytics", "heatmap", "/analytics/heatmap", {"bbox": f"{lng - 0.1},{lat - 0.1},{lng + 0.1},{lat + 0.1}", "precision": 6}, server_only=True),
+        case("connections", "outgoing", "/connections/outgoing", user_doc=user),
+        case("connections", "incoming", "/connections/incoming", user_doc=owner),
+        case("connections", "check", f"/connections/check/{listing_id}", user_doc=user),
+        case("connections", "by_listing", f"/connections/listing/{listing_id}", user_doc=owner),
+        case("favorites", "list", "/favorites", user_doc=user),
+        case("favorites", "add", "/favorites", user_doc=user, method="POST", body={"listing_id": listing_id}),
+        case("favorites", "check", "/favorites/check", user_doc=user, method="POST", body={"listing_ids": page_ids}),
+        case("notifications", "list", "/notifications", user_doc=owner),
+        case("notifications", "unread_count", "/notifications/unread-count", user_doc=owner),
+    ]
+
+
+def _summary(samples_ms: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples_ms)
+    return {
+        "p50_ms": round(statistics.median(ordered), 3),
+        "p99_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))], 3),
+        "mean_ms": round(statistics.fmean(ordered), 3),
+    }
+
+
+async def _run_case(client: httpx.AsyncClient, case: Dict[str, Any], requests: int, concurrency: int, count_commands: bool) -> Dict[str, Any]:
+    from app.utils.mongo_monitoring import RequestCommandStats, request_stats
+
+    errors: Dict[str, int] = {}
+    commands: List[int] = []
+
+    async def send() -> float:
+        stats = RequestCommandStats()
+        token = request_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            resp = await client.request(case["method"], case["url"], params=case["params"], json=case["json"], headers=case["headers"])
+        finally:
+            request_stats.reset(token)
+        elapsed = (time.perf_counter() - started) * 1000
+        if resp.status_code >= 400:
+            errors[str(resp.status_code)] = errors.get(str(resp.status_code), 0) + 1
+        commands.append(stats.count)
+        return elapsed
+
+    for _ in range(min(5, requests)):
+        await send()
+    commands.clear()
+    errors.clear()
+    latencies = [await send() for _ in range(requests)]
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited() -> float:
+        async with semaphore:
+            return await send()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(limited() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+
+    result = {
+        "router": case["router"],
+        **_summary(latencies),
+        "throughput_rps": round(requests / elapsed, 1),
+        "commands_per_request": round(statistics.fmean(commands), 2) if count_commands else None,
+    }
+    if errors:
+        result["errors"] = errors
+    return result
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def _connect(args: argparse.Namespace) -> Callable[[], Any]:
+    """Point app.db at the bench database; returns the close function."""
+    from app import db as app_db
+    settings.mongodb_db = args.db or f"{settings.mongodb_db}_bench"
+    if args.mongomock:
+        from mongomock_motor import AsyncMongoMockClient
+        app_db._client = AsyncMongoMockClient()
+        app_db._db = app_db._client[settings.mongodb_db]
+        return app_db.close_db
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from app.migrations import migrate
+    from app.utils.mongo_monitoring import command_listener
+    # Counts commands into the RequestCommandStats that _run_case sets around each request
+    options = app_db._client_options()
+    if command_listener not in options["event_listeners"]:
+        options["event_listeners"].append(command_listener)
+    app_db._client = AsyncIOMotorClient(settings.mongodb_uri, **options)
+    app_db._db = app_db._client[settings.mongodb_db]
+    await migrate(app_db._db, wait=60)
+    return app_db.close_db
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    close = await _connect(args)
+    from app import db as app_db
+    from app.main import app
+    try:
+        data = await _seed(await app_db.get_db(), args.seed, args.users, args.listings)
+        results: Dict[str, Any] = {}
+        # Unhandled exceptions become 500s in the results instead of aborting the run
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            for case in _cases(data):
+                if args.only and case["router"] not in args.only:
+                    continue
+                if case["server_only"] and args.mongomock:
+                    continue
+                results[f"{case['router']}.{case['name']}"] = await _run_case(client, case, args.requests, args.concurrency, not args.mongomock)
+    finally:
+        await close()
+    return {
+        "commit": _git_commit(),
+        "backend": "mongomock" if args.mongomock else "mongod",
+        "seed": args.seed,
+        "users": args.users,
+        "listings": args.listings,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "cases": results,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Cases whose p50 grew by more than `tolerance` or that issue more Mongo commands than the baseline."""
+    regressions = []
+    for name, now in current["cases"].items():
+        before = baseline.get("cases", {}).get(name)
+        if not before:
+            continue
+        if now["p50_ms"] > before["p50_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p50 {before['p50_ms']} -> {now['p50_ms']} ms")
+        if None not in (now["commands_per_request"], before["commands_per_request"]) and now["commands_per_request"] > before["commands_per_request"]:
+            regressions.append(f"{name}: commands/request {before['commands_per_request']} -> {now['commands_per_request']}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=100, help="timed requests per case (after 5 warm-up requests)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--listings", type=int, default=5000)
+    parser.add_argument("--db", help="database to wipe and seed (default: <MONGODB_DB>_bench)")
+    parser.add_argument("--mongomock", action="store_true", help="run against mongomock-motor instead of MONGODB_URI")
+    parser.add_argument("--only", nargs="*", help="routers to run, e.g. listings favorites")
+    parser.add_argument("--baseline", help="earlier JSON output to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative p50 growth against --baseline")
+    args = parser.parse_args()
+    # The app logs with print(); keep stdout for the JSON result
+    with contextlib.redirect_stdout(sys.stderr):
+        result = asyncio.run(run(args))
+    print(json.dumps(result, indent=2))
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"[bench] regression {line}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,493 @@
+"""Generate a large, reproducible synthetic data set and bulk-load it.
+
+    python -m benchmarks.datagen --listings 1000000 --users 500000
+    python -m benchmarks.datagen --db roommate_perf --drop --workers 8 --seed 7
+
+Data goes to `<MONGODB_DB>_bench` unless --db is given, never to the app's own
+database by default; --drop is only accepted together with an explicit --db.
+
+Every document is a pure function of (seed, collection, index): ids, owners
+and timestamps are derived from the index, so any worker can generate any
+chunk and cross-references (owner_id, listing_id, ...) line up without
+coordination. The same seed and counts always produce the same data,
+whatever --workers and --batch are.
+
+Shape of the data:
+- users sign up at a growing rate over two years; ~85% verified; user 0 is ADMIN.
+  Every user's password is --password, random and printed when not given.
+- listings cluster around district centres of five cities (weighted towards
+  Ho Chi Minh City and Hanoi) with Vietnamese addresses ("<no> <street>,
+  <ward>, <district>, <city>"); area and price are log-normal and right
+  skewed, price follows city, district and a hidden quality score, and that
+  score also drives which amenities appear together.
+- a fifth of the users are landlords and a few of them own most listings;
+  favorites, connections and reviews pick listings with a power-law
+  popularity. Every connection notifies the owner; answered ones notify the
+  requester too.
+"""
+import argparse
+import asyncio
+import math
+import os
+import random
+import secrets
+import struct
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Tuple
+from bson import ObjectId
+from app.utils import geohash
+
+CHUNK = 10_000
+START = datetime(2023, 1, 1)
+SPAN = timedelta(days=730)
+
+# Leading byte of the generated ObjectIds, after the 4-byte timestamp
+_KIND_IDS = {"users": 1, "profiles": 2, "listings": 3, "favorites": 4, "connections": 5, "notifications": 6, "reviews": 7}
+
+# city: (weight, full name used in addresses, price per m2 in VND, {district: (lng, lat, price factor)}, wards)
+CITIES: Dict[str, Tuple[float, str, float, Dict[str, Tuple[float, float, float]], List[str]]] = {
+    "hcm": (0.45, "Thành phố Hồ Chí Minh", 130_000, {
+        "Quận 1": (106.7019, 10.7756, 1.6),
+        "Quận 3": (106.6844, 10.7843, 1.4),
+        "Quận 5": (106.6634, 10.7540, 1.15),
+        "Quận 7": (106.7218, 10.7340, 1.2),
+        "Quận 10": (106.6676, 10.7730, 1.2),
+        "Bình Thạnh": (106.7091, 10.8106, 1.1),
+        "Phú Nhuận": (106.6803, 10.7992, 1.15),
+        "Gò Vấp": (106.6653, 10.8387, 0.9),
+        "Tân Bình": (106.6526, 10.8015, 1.0),
+        "Thủ Đức": (106.7537, 10.8494, 0.85),
+    }, [f"Phường {n}" for n in range(1, 16)]),
+    "hn": (0.35, "Thành phố Hà Nội", 120_000, {
+        "Ba Đình": (105.8140, 21.0340, 1.35),
+        "Hoàn Kiếm": (105.8542, 21.0285, 1.6),
+        "Đống Đa": (105.8290, 21.0181, 1.2),
+        "Hai Bà Trưng": (105.8575, 21.0059, 1.15),
+        "Cầu Giấy": (105.7906, 21.0362, 1.1),
+        "Thanh Xuân": (105.8094, 20.9938, 1.0),
+        "Hoàng Mai": (105.8636, 20.9746, 0.85),
+        "Nam Từ Liêm": (105.7621, 21.0124, 0.9),
+    }, ["Dịch Vọng", "Láng Hạ", "Kim Mã", "Trung Hòa", "Bách Khoa", "Khương Trung", "Mai Dịch", "Văn Chương"]),
+    "dn": (0.10, "Thành phố Đà Nẵng", 90_000, {
+        "Hải Châu": (108.2199, 16.0472, 1.2),
+        "Thanh Khê": (108.1872, 16.0640, 1.0),
+        "Sơn Trà": (108.2415, 16.0860, 1.05),
+        "Ngũ Hành Sơn": (108.2507, 16.0003, 1.0),
+        "Liên Chiểu": (108.1500, 16.0717, 0.8),
+    }, ["Hòa Cường Bắc", "Thạc Gián", "An Hải Bắc", "Mỹ An", "Hòa Khánh Bắc", "Chính Gián"]),
+    "ct": (0.05, "Thành phố Cần Thơ", 70_000, {
+        "Ninh Kiều": (105.7720, 10.0340, 1.1),
+        "Cái Răng": (105.7800, 10.0000, 0.9),
+        "Bình Thủy": (105.7450, 10.0700, 0.9),
+    }, ["An Khánh", "Xuân Khánh", "Hưng Lợi", "An Bình"]),
+    "hp": (0.05, "Thành phố Hải Phòng", 75_000, {
+        "Lê Chân": (106.6881, 20.8449, 1.05),
+        "Ngô Quyền": (106.6992, 20.8561, 1.1),
+        "Hồng Bàng": (106.6780, 20.8600, 1.0),
+    }, ["Cát Dài", "Lạch Tray", "Máy Chai", "Hoàng Văn Thụ"]),
+}
+_CITY_KEYS = list(CITIES)
+_CITY_WEIGHTS = [CITIES[key][0] for key in _CITY_KEYS]
+
+STREETS = [
+    "Nguyễn Trãi", "Lê Lợi", "Trần Hưng Đạo", "Hai Bà Trưng", "Điện Biên Phủ", "Cách Mạng Tháng 8", "Nguyễn Văn Cừ",
+    "Lý Thường Kiệt", "Phan Đình Phùng", "Võ Văn Tần", "Nguyễn Thị Minh Khai", "Lê Văn Sỹ", "Xuân Thủy", "Hoàng Quốc Việt",
+    "Trường Chinh", "Quang Trung", "Phạm Văn Đồng", "Nguyễn Huệ", "Bạch Đằng", "Tôn Đức Thắng", "Hùng Vương", "Lạc Long Quân",
+]
+FAMILY_NAMES = ["Nguyễn", "Trần", "Lê", "Phạm", "Hoàng", "Huỳnh", "Phan", "Vũ", "Võ", "Đặng", "Bùi", "Đỗ", "Hồ", "Ngô", "Dương", "Lý"]
+FAMILY_WEIGHTS = [38, 11, 9.5, 7, 5, 4, 4.5, 3.9, 3.5, 2.1, 2, 1.4, 1.3, 1.3, 1, 0.5]
+MIDDLE_NAMES = ["Văn", "Thị", "Minh", "Ngọc", "Thanh", "Đức", "Hoàng", "Thu", "Quốc", "Gia", "Bảo", "Khánh"]
+GIVEN_NAMES = [
+    "An", "Anh", "Bình", "Châu", "Dũng", "Duy", "Giang", "Hà", "Hải", "Hạnh", "Hiếu", "Hoa", "Huy", "Hương", "Khánh",
+    "Linh", "Long", "Mai", "Minh", "Nam", "Ngân", "Nhung", "Phong", "Phúc", "Quân", "Quỳnh", "Sơn", "Tâm", "Thảo",
+    "Trang", "Tuấn", "Vy", "Yến",
+]
+PHONE_PREFIXES = ["90", "91", "93", "94", "96", "97", "98", "32", "33", "34", "35", "36", "37", "38", "39", "70", "76", "77", "78", "79", "81", "82", "83", "84", "85", "86", "88", "89"]
+
+# amenity: (probability for the plainest room, extra probability for the best one, price premium)
+AMENITIES = {
+    "wifi": (0.70, 0.25, 0.01),
+    "parking": (0.55, 0.30, 0.01),
+    "water_heater": (0.35, 0.55, 0.03),
+    "ac": (0.20, 0.70, 0.08),
+    "kitchen": (0.30, 0.45, 0.04),
+    "private_room": (0.40, 0.45, 0.05),
+    "security": (0.15, 0.55, 0.04),
+    "washing_machine": (0.10, 0.55, 0.04),
+    "fridge": (0.10, 0.50, 0.03),
+    "balcony": (0.05, 0.40, 0.05),
+}
+TITLE_KINDS = ["Phòng trọ", "Phòng trọ giá rẻ", "Căn hộ mini", "Phòng có gác lửng", "Ký túc xá", "Studio", "Phòng ở ghép"]
+DESC_PARTS = [
+    "Phòng sạch sẽ, thoáng mát", "gần chợ và trường học", "giờ giấc tự do", "không chung chủ", "có camera an ninh",
+    "điện nước giá nhà nước", "cách trung tâm 10 phút", "khu dân cư yên tĩnh", "hẻm xe hơi", "miễn phí dọn vệ sinh hàng tuần",
+]
+BIO_PARTS = [
+    "Sinh viên năm cuối", "Nhân viên văn phòng", "Làm việc tự do", "Thích nấu ăn", "Ngủ sớm dậy sớm",
+    "Gọn gàng, sạch sẽ", "Cần tìm bạn ở ghép hòa đồng", "Đi làm cả ngày, tối mới về",
+]
+
+_MASK = (1 << 64) - 1
+
+
+def _mix(x: int) -> int:
+    """splitmix64: a cheap, well-spread hash of an integer."""
+    x = (x + 0x9E3779B97F4A7C15) & _MASK
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK
+    return x ^ (x >> 31)
+
+
+def _unit(seed: int, kind: str, index: int) -> float:
+    return _mix(seed * 1_000_003 + _KIND_IDS[kind] * 0x1_0000_0000_0000 + index) / 2 ** 64
+
+
+def object_id(kind: str, index: int, created: datetime) -> ObjectId:
+    """Deterministic id: creation second, collection byte, 7-byte index."""
+    seconds = int((created - datetime(1970, 1, 1)).total_seconds())
+    return ObjectId(struct.pack(">I", seconds) + bytes([_KIND_IDS[kind]]) + index.to_bytes(7, "big"))
+
+
+def created_at(index: int, total: int) -> datetime:
+    # sqrt: sign-ups per day grow linearly over the span
+    return START + SPAN * math.sqrt((index + 0.5) / max(total, 1))
+
+
+def user_id(index: int, users: int) -> ObjectId:
+    return object_id("users", index, created_at(index, users))
+
+
+def listing_id(index: int, listings: int) -> ObjectId:
+    return object_id("listings", index, created_at(index, listings))
+
+
+def owner_index(seed: int, listing: int, users: int) -> int:
+    """A fifth of the users are landlords; squaring the draw gives a few of them most listings."""
+    landlords = max(1, users // 5)
+    rank = int(landlords * _unit(seed, "listings", listing) ** 2)
+    return 1 + (rank * 2654435761) % max(users - 1, 1) if users > 1 else 0
+
+
+def _popular(rng: random.Random, total: int) -> int:
+    # Power-law popularity, scattered so popular listings are not all the oldest
+    return (int(total * rng.random() ** 2.5) * 2654435761) % total
+
+
+def _chunk_rng(seed: int, kind: str, chunk: int) -> random.Random:
+    return random.Random(f"{seed}:{kind}:{chunk}")
+
+
+def _point(rng: random.Random, lng: float, lat: float, km: float) -> Dict[str, Any]:
+    # ~111 km per degree of latitude; longitude degrees shrink with cos(lat)
+    return {"type": "Point", "coordinates": [
+        round(lng + rng.gauss(0, km / (111 * math.cos(math.radians(lat)))), 6),
+        round(lat + rng.gauss(0, km / 111), 6),
+    ]}
+
+
+def _pick_place(rng: random.Random) -> Tuple[str, str]:
+    city = rng.choices(_CITY_KEYS, _CITY_WEIGHTS)[0]
+    return city, rng.choice(list(CITIES[city][3]))
+
+
+def gen_users(seed: int, chunk: int, counts: Dict[str, int], password_hash: str) -> Dict[str, List[Dict[str, Any]]]:
+    rng = _chunk_rng(seed, "users", chunk)
+    total = counts["users"]
+    users, profiles = [], []
+    for i in range(chunk * CHUNK, min(total, (chunk + 1) * CHUNK)):
+        created = created_at(i, total)
+        name = f"{rng.choices(FAMILY_NAMES, FAMILY_WEIGHTS)[0]} {rng.choice(MIDDLE_NAMES)} {rng.choice(GIVEN_NAMES)}"
+        users.append({
+            "_id": object_id("users", i, created),
+            "email": f"user{i}@example.vn",
+            "name": name,
+            "phone": f"0{rng.choice(PHONE_PREFIXES)}{rng.randrange(10 ** 7):07d}",
+            "role": "ADMIN" if i == 0 else "USER",
+            "password_hash": password_hash,
+            "is_verified": i == 0 or rng.random() < 0.85,
+            "token_version": 0,
+            "created_at": created,
+        })
+        if rng.random() >= 0.7:
+            continue
+        city, district = _pick_place(rng)
+        _, _, per_m2, districts, _ = CITIES[city]
+        lng, lat, factor = districts[district]
+        budget = per_m2 * factor * 22 * rng.lognormvariate(0, 0.3)
+        profiles.append({
+            "_id": object_id("profiles", i, created),
+            "user_id": users[-1]["_id"],
+            "bio": ". ".join(rng.sample(BIO_PARTS, rng.randrange(1, 4))),
+            "budget": float(round(budget, -5)),
+            "desiredAreas": rng.sample(list(districts), min(len(districts), rng.randrange(1, 4))),
+            "habits": {
+                "smoke": rng.random() < 0.15,
+                "pet": rng.random() < 0.25,
+                "cook": rng.random() < 0.7,
+                "sleepTime": rng.choice(["early", "late"]),
+            },
+            "gender": rng.choice(["male", "female"]),
+            "age": int(min(40, max(18, rng.gauss(23, 3.5)))),
+            "constraints": {},
+            "location": _point(rng, lng, lat, 2.5),
+            "avatar": None,
+        })
+    return {"users": users, "profiles": profiles}
+
+
+def gen_listings(seed: int, chunk: int, counts: Dict[str, int]) -> Dict[str, List[Dict[str, Any]]]:
+    rng = _chunk_rng(seed, "listings", chunk)
+    total, users = counts["listings"], counts["users"]
+    admin = user_id(0, users)
+    now = START + SPAN
+    listings, reviews = [], []
+    for i in range(chunk * CHUNK, min(total, (chunk + 1) * CHUNK)):
+        created = created_at(i, total)
+        city, district = _pick_place(rng)
+        _, city_name, per_m2, districts, wards = CITIES[city]
+        lng, lat, factor = districts[district]
+        # Hidden quality score: drives both price and which amenities show up together
+        quality = rng.betavariate(0.9, 1.4)
+        amenities = [name for name, (base, lift, _) in AMENITIES.items() if rng.random() < base + lift * quality]
+        premium = 1 + sum(AMENITIES[name][2] for name in amenities)
+        area = min(150.0, max(10.0, round(rng.lognormvariate(math.log(22), 0.35))))
+        price = per_m2 * factor * area * premium * rng.lognormvariate(0, 0.2)
+        price = float(max(500_000, round(price, -5)))
+        street = rng.choice(STREETS)
+        number = f"{rng.randrange(1, 300)}/{rng.randrange(1, 60)}" if rng.random() < 0.4 else str(rng.randrange(1, 600))
+        location = _point(rng, lng, lat, 1.5)
+
+        age_days = (now - created).days
+        roll = rng.random()
+        if roll < 0.03:
+            verification = "REJECTED"
+        elif roll < (0.9 if age_days > 14 else 0.5):
+            verification = "VERIFIED"
+        else:
+            verification = "PENDING"
+        verified_at = created + timedelta(hours=rng.uniform(1, 72)) if verification != "PENDING" else None
+        status = rng.choices(["ACTIVE", "RENTED", "HIDDEN"], [0.7, 0.25 if age_days > 60 else 0.08, 0.05])[0]
+
+        listings.append({
+            "_id": object_id("listings", i, created),
+            "title": f"{rng.choice(TITLE_KINDS)} {area:.0f}m² đường {street}, {district}",
+            "desc": ", ".join(rng.sample(DESC_PARTS, rng.randrange(2, 5))),
+            "price": price,
+            "area": float(area),
+            "amenities": amenities,
+            "rules": {
+                "pet": rng.random() < 0.3,
+                "smoke": rng.random() < 0.2,
+                "cook": rng.random() < 0.3 + 0.6 * ("kitchen" in amenities),
+                "visitor": rng.random() < 0.75,
+            },
+            "images": [],
+            "video": None,
+            "status": status,
+            "location": location,
+            "address": f"{number} {street}, {rng.choice(wards)}, {district}, {city_name}",
+            "geohash": geohash.encode(*location["coordinates"]),
+            "verification_status": verification,
+            "verified_by": admin if verified_at else None,
+            "verified_at": verified_at.isoformat() if verified_at else None,
+            "owner_id": user_id(owner_index(seed, i, users), users),
+            "thumbnail": None,
+            "created_at": created,
+            "updated_at": verified_at or created,
+        })
+
+        for j in range(min(15, int(rng.paretovariate(1.5)) - 1)):
+            written = created + (now - created) * rng.random()
+            stars = max(1, min(5, round(rng.gauss(3 + 2 * quality, 0.8))))
+            reviews.append({
+                "_id": object_id("reviews", (i << 4) | j, written),
+                "listing_id": listings[-1]["_id"],
+                "author_id": user_id(rng.randrange(users), users),
+                "scores": {key: float(max(1, min(5, stars + rng.choice([-1, 0, 0, 1])))) for key in ("clean", "location", "price", "landlord")},
+                "content": rng.choice(["Phòng đẹp, chủ nhà thân thiện", "Giá hợp lý", "Hơi ồn vào buổi tối", "Đúng như mô tả", "Khu vực an ninh tốt"]),
+                "created_at": written,
+            })
+    return {"listings": listings, "reviews": reviews}
+
+
+def gen_activity(seed: int, chunk: int, counts: Dict[str, int]) -> Dict[str, List[Dict[str, Any]]]:
+    """Favorites, connections and their notifications, generated per user."""
+    rng = _chunk_rng(seed, "favorites", chunk)
+    users, total = counts["users"], counts["listings"]
+    now = START + SPAN
+    favorites, connections, notifications = [], [], []
+    if not total:
+        return {"favorites": favorites, "connections": connections, "notifications": notifications}
+    for u in range(chunk * CHUNK, min(users, (chunk + 1) * CHUNK)):
+        uid = user_id(u, users)
+        joined = created_at(u, users)
+        for j in range(min(255, int(rng.expovariate(1 / counts["favorites_per_user"])))):
+            listing = _popular(rng, total)
+            when = max(joined, created_at(listing, total)) + timedelta(hours=rng.uniform(0, 24 * 30))
+            favorites.append({
+                "_id": object_id("favorites", (u << 8) | j, min(when, now)),
+                "user_id": uid,
+                "listing_id": listing_id(listing, total),
+            })
+        for j in range(min(63, int(rng.expovariate(1 / counts["connections_per_user"])))):
+            listing = _popular(rng, total)
+            owner = owner_index(seed, listing, users)
+            if owner == u:
+                continue
+            when = min(now, max(joined, created_at(listing, total)) + timedelta(hours=rng.uniform(0, 24 * 14)))
+            status = rng.choices(["PENDING", "ACCEPTED", "REJECTED"], [0.3, 0.5, 0.2])[0]
+            answered = when + timedelta(hours=rng.uniform(1, 48)) if status != "PENDING" else when
+            lid = listing_id(listing, total)
+            owner_id = user_id(owner, users)
+            connection = {
+                "_id": object_id("connections", (u << 6) | j, when),
+                "from_user_id": uid,
+                "to_user_id": owner_id,
+                "listing_id": lid,
+                "message": rng.choice(["", "Phòng còn trống không ạ?", "Cho mình hỏi giá điện nước", "Mình muốn xem phòng cuối tuần"]),
+                "status": status,
+                "created_at": when,
+                "updated_at": answered,
+            }
+            connections.append(connection)
+            notifications.append({
+                "_id": object_id("notifications", (u << 7) | (j << 1), when),
+                "user_id": owner_id,
+                "type": "CONNECTION_REQUEST",
+                "title": "Yêu cầu kết nối mới",
+                "content": "Có người muốn liên hệ về phòng trọ của bạn",
+                "metadata": {"connection_id": str(connection["_id"]), "listing_id": str(lid), "from_user_id": str(uid)},
+                "read": status != "PENDING" or rng.random() < 0.3,
+                "created_at": when,
+            })
+            if status != "PENDING":
+                notifications.append({
+                    "_id": object_id("notifications", (u << 7) | (j << 1) | 1, answered),
+                    "user_id": uid,
+                    "type": f"CONNECTION_{status}",
+                    "title": "Yêu cầu kết nối được chấp nhận" if status == "ACCEPTED" else "Yêu cầu kết nối bị từ chối",
+                    "content": "Chủ phòng đã phản hồi yêu cầu kết nối của bạn",
+                    "metadata": {"connection_id": str(connection["_id"]), "listing_id": str(lid)},
+                    "read": rng.random() < 0.6,
+                    "created_at": answered,
+                })
+    return {"favorites": favorites, "connections": connections, "notifications": notifications}
+
+
+def tasks(counts: Dict[str, int]) -> Iterator[Tuple[str, int]]:
+    """(generator, chunk) pairs covering the whole data set."""
+    for name, total in (("users", counts["users"]), ("listings", counts["listings"]), ("activity", counts["users"])):
+        for chunk in range(math.ceil(total / CHUNK)):
+            yield name, chunk
+
+
+def generate(name: str, chunk: int, seed: int, counts: Dict[str, int], password_hash: str) -> Dict[str, List[Dict[str, Any]]]:
+    if name == "users":
+        return gen_users(seed, chunk, counts, password_hash)
+    if name == "listings":
+        return gen_listings(seed, chunk, counts)
+    return gen_activity(seed, chunk, counts)
+
+
+def _insert(collection, docs: List[Dict[str, Any]], batch: int) -> Tuple[int, int]:
+    """Unordered batches: one bad document does not stop the rest. Returns (inserted, duplicates)."""
+    from pymongo.errors import BulkWriteError
+    inserted = duplicates = 0
+    for start in range(0, len(docs), batch):
+        part = docs[start:start + batch]
+        try:
+            inserted += len(collection.insert_many(part, ordered=False).inserted_ids)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            others = [err for err in errors if err.get("code") != 11000]
+            if others:
+                raise
+            duplicates += len(errors)
+            inserted += e.details.get("nInserted", 0)
+    return inserted, duplicates
+
+
+_worker_db = None
+
+
+def _init_worker(uri: str, db_name: str) -> None:
+    global _worker_db
+    from pymongo import MongoClient
+    _worker_db = MongoClient(uri)[db_name]
+
+
+def _load(name: str, chunk: int, seed: int, counts: Dict[str, int], password_hash: str, batch: int) -> Dict[str, Tuple[int, int]]:
+    generated = generate(name, chunk, seed, counts, password_hash)
+    return {collection: _insert(_worker_db[collection], docs, batch) for collection, docs in generated.items() if docs}
+
+
+async def _prepare(db, drop: bool) -> None:
+    from app.migrations import migrate
+    if drop:
+        for collection in _KIND_IDS:
+            await db[collection].drop()
+        await db.analytics_snapshots.drop()
+    # Indexes first: the unique ones turn repeated favorites/connections into skipped duplicates
+    await migrate(db, wait=60)
+
+
+def main(args: argparse.Namespace) -> None:
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from app.migrations import backfill_favorite_counts
+    from app.settings import settings
+    from app.utils.passwords import _hash_sync
+
+    db_name = args.db or f"{settings.mongodb_db}_bench"
+    if args.password is None:
+        args.password = secrets.token_urlsafe(12)
+        print(f"[datagen] password of every generated user: {args.password}", file=sys.stderr)
+    client = AsyncIOMotorClient(settings.mongodb_uri)
+    asyncio.run(_prepare(client[db_name], args.drop))
+    client.close()
+
+    counts = {
+        "users": args.users,
+        "listings": args.listings,
+        "favorites_per_user": args.favorites_per_user,
+        "connections_per_user": args.connections_per_user,
+    }
+    password_hash = _hash_sync(args.password, settings.bcrypt_rounds)
+    totals: Dict[str, List[int]] = {}
+    jobs = list(tasks(counts))
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker, initargs=(settings.mongodb_uri, db_name)) as pool:
+        futures = [pool.submit(_load, name, chunk, args.seed, counts, password_hash, args.batch) for name, chunk in jobs]
+        for done, future in enumerate(as_completed(futures), 1):
+            for collection, (inserted, duplicates) in future.result().items():
+                total = totals.setdefault(collection, [0, 0])
+                total[0] += inserted
+                total[1] += duplicates
+            if done % 10 == 0 or done == len(futures):
+                print(f"[datagen] {done}/{len(futures)} chunks, {time.perf_counter() - started:.0f}s", file=sys.stderr)
+    for collection, (inserted, duplicates) in sorted(totals.items()):
+        print(f"[datagen] {collection}: {inserted} inserted, {duplicates} duplicates skipped")
+    # Favorites were inserted directly, so listings.favorite_count still needs counting
+    client = AsyncIOMotorClient(settings.mongodb_uri)
+    asyncio.run(backfill_favorite_counts(client[db_name]))
+    client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=500_000)
+    parser.add_argument("--listings", type=int, default=1_000_000)
+    parser.add_argument("--favorites-per-user", type=float, default=8)
+    parser.add_argument("--connections-per-user", type=float, default=2)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db", help="target database (default: <MONGODB_DB>_bench)")
+    parser.add_argument("--drop", action="store_true", help="drop the generated collections first; requires --db")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="generator/loader processes")
+    parser.add_argument("--batch", type=int, default=1000, help="documents per insert_many")
+    parser.add_argument("--password", help="password of every generated user (default: random, printed)")
+    args = parser.parse_args()
+    if args.drop and not args.db:
+        parser.error("--drop needs an explicit --db")
+    main(args)
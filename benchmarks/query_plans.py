@@ -0,0 +1,258 @@
+"""Explain every Mongo query the main routes issue and fail on unindexed plans.
+
+    python -m benchmarks.query_plans                 # exit 1 on violations
+    python -m benchmarks.query_plans --ratio-budget 5 > plans.json
+
+Each benchmarks.api case (plus a few routes the timing benchmark skips) is
+requested once against a seeded database (`<MONGODB_DB>_plans` unless --db
+is given). A command listener records the find / aggregate / findAndModify /
+update / delete / count / distinct commands issued while serving it, and each
+distinct query shape is re-run as `explain` with executionStats verbosity.
+A shape violates when its winning plan contains COLLSCAN or an in-memory
+SORT, or when it examines more than --ratio-budget documents per document
+returned. Pipelines that group ($group, $count, ...) return far fewer documents
+than they read by design and are only checked for COLLSCAN and SORT.
+
+Deliberate exceptions live in ALLOWED below, each with its reason; an entry
+whose issues no longer occur is reported as stale so the list only shrinks.
+Needs mongod (explain is not emulated by mongomock).
+"""
+import argparse
+import asyncio
+import contextlib
+import fnmatch
+import json
+import sys
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+import httpx
+from pymongo import monitoring
+from app.settings import settings
+from app.utils.mongo_monitoring import command_shape
+from . import api
+
+EXPLAINABLE = ("find", "aggregate", "findAndModify", "update", "delete", "count", "distinct")
+GROUPING_STAGES = ("$group", "$count", "$bucket", "$bucketAuto", "$facet", "$sortByCount")
+# Session, cluster and write concern fields are rejected inside an explained command
+DROPPED_FIELDS = ("lsid", "txnNumber", "readConcern", "writeConcern", "autocommit", "startTransaction")
+
+# (case, shape glob) -> (issues tolerated, why). Issues: COLLSCAN, SORT, ratio.
+ALLOWED: Dict[Tuple[str, str], Tuple[Set[str], str]] = {
+    ("listings.search_province", "*"): (
+        {"COLLSCAN", "ratio"},
+        "unanchored case-insensitive regex on address; no index can serve it until province is stored as a field",
+    ),
+    ("listings.search_filters", "*"): (
+        {"SORT", "ratio"},
+        "ad-hoc price/amenity/rule combinations; the compound index only serves the status + verification prefix",
+    ),
+    ("profiles.search_bio", "*"): (
+        {"COLLSCAN", "ratio"},
+        "unanchored case-insensitive regex on bio; low-traffic search page",
+    ),
+    ("analytics.*", "aggregate listings *"): (
+        {"COLLSCAN"},
+        "snapshot rebuilds read every listing by design; requests are served from analytics_snapshots",
+    ),
+    ("analytics.*", "find listings *"): (
+        {"COLLSCAN"},
+        "snapshot rebuilds read every listing by design; requests are served from analytics_snapshots",
+    ),
+}
+
+current_case: ContextVar[Optional[str]] = ContextVar("query_plans_case", default=None)
+
+
+class _Recorder(monitoring.CommandListener):
+    """Keeps the first command of each shape per case."""
+
+    def __init__(self):
+        self.commands: Dict[Tuple[str, str], Dict[str, Any]] = {}
+
+    def started(self, event) -> None:
+        case = current_case.get()
+        if case is None or event.command_name not in EXPLAINABLE:
+            return
+        shape = command_shape(event.command_name, event.command)
+        command = {k: v for k, v in event.command.items() if not k.startswith("$") and k not in DROPPED_FIELDS}
+        self.commands.setdefault((case, shape), command)
+
+    def succeeded(self, event) -> None:
+        pass
+
+    def failed(self, event) -> None:
+        pass
+
+
+def _plan_stages(node: Any) -> List[str]:
+    """Every `stage` name in a winning plan tree (classic and SBE `queryPlan` layouts)."""
+    stages = []
+    if isinstance(node, dict):
+        if isinstance(node.get("stage"), str):
+            stages.append(node["stage"])
+        for key, value in node.items():
+            if key != "rejectedPlans":
+                stages.extend(_plan_stages(value))
+    elif isinstance(node, list):
+        for item in node:
+            stages.extend(_plan_stages(item))
+    return stages
+
+
+def _collect(node: Any, key: str) -> List[Dict[str, Any]]:
+    """All dicts stored under `key` anywhere in an explain document."""
+    found = []
+    if isinstance(node, dict):
+        for k, value in node.items():
+            if k == key and isinstance(value, dict):
+                found.append(value)
+            else:
+                found.extend(_collect(value, key))
+    elif isinstance(node, list):
+        for item in node:
+            found.extend(_collect(item, key))
+    return found
+
+
+def analyze(command_name: str, command: Dict[str, Any], explain: Dict[str, Any], ratio_budget: float) -> Dict[str, Any]:
+    """Stages, docs examined/returned and the violated checks for one explain result."""
+    stages = [stage for plan in _collect(explain, "winningPlan") for stage in _plan_stages(plan)]
+    stats = _collect(explain, "executionStats")
+    examined = sum(s.get("totalDocsExamined", 0) for s in stats)
+    returned = sum(s.get("nReturned", 0) for s in stats)
+    issues = []
+    if "COLLSCAN" in stages:
+        issues.append("COLLSCAN")
+    if "SORT" in stages:
+        issues.append("SORT")
+    grouping = command_name in ("count", "distinct") or any(
+        next(iter(stage), None) in GROUPING_STAGES for stage in command.get("pipeline", [])
+    )
+    if not grouping and examined > ratio_budget * max(returned, 1):
+        issues.append("ratio")
+    return {
+        "stages": sorted(set(stages)),
+        "docs_examined": examined,
+        "returned": returned,
+        "issues": issues,
+    }
+
+
+def allowed_for(case: str, shape: str) -> Tuple[Set[str], List[Tuple[str, str]]]:
+    """Issues ALLOWED tolerates for this case and shape, and the entries granting them."""
+    issues: Set[str] = set()
+    keys = []
+    for key, (tolerated, _) in ALLOWED.items():
+        if fnmatch.fnmatchcase(case, key[0]) and fnmatch.fnmatchcase(shape, key[1]):
+            issues |= tolerated
+            keys.append(key)
+    return issues, keys
+
+
+async def _seed_extras(db, data: Dict[str, Any]) -> Dict[str, Any]:
+    """Reports and a verification token, which datagen does not produce."""
+    from app.utils.verification import issue_verification_token
+    await db.reports.delete_many({})
+    await db.verification_tokens.delete_many({})
+    users, listings = data["users"], data["listings"]
+    reports = [{
+        "listing_id": listing["_id"],
+        "reporter_id": users[(i * 7 + 1) % len(users)]["_id"],
+        "reason": "Tin không đúng sự thật",
+        "status": ("OPEN", "RESOLVED", "DISMISSED")[i % 3],
+        "created_at": datetime.utcnow(),
+    } for i, listing in enumerate(listings[:300])]
+    await db.reports.insert_many(reports)
+    token = await issue_verification_token(db, users[1]["_id"])
+    return {"admin": users[0], "token": token}
+
+
+def _extra_cases(extras: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Routes outside the timing benchmark whose queries still need an index."""
+    from app.security import issue_tokens
+    admin = {"Authorization": f"Bearer {issue_tokens(extras['admin'])['access_token']}"}
+
+    def case(router, name, url, params=None, headers=None):
+        return {"router": router, "name": name, "method": "GET", "url": url, "params": params or {}, "json": None, "headers": headers or {}}
+
+    return [
+        case("profiles", "search_budget", "/profiles/search", {"min_budget": 2_000_000, "max_budget": 4_000_000}),
+        case("profiles", "search_bio", "/profiles/search", {"q": "sinh viên"}),
+        case("reports", "list_open", "/reports", {"status": "OPEN"}, admin),
+        case("auth", "verify", "/auth/verify", {"token": extras["token"]}),
+    ]
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from app import db as app_db
+    from app.migrations import migrate
+    recorder = _Recorder()
+    settings.mongodb_db = args.db or f"{settings.mongodb_db}_plans"
+    options = app_db._client_options()
+    options["event_listeners"].append(recorder)
+    app_db._client = AsyncIOMotorClient(settings.mongodb_uri, **options)
+    app_db._db = app_db._client[settings.mongodb_db]
+    await migrate(app_db._db, wait=60)
+    from app.main import app
+
+    db = app_db._db
+    results: Dict[str, Any] = {}
+    violations: List[str] = []
+    used: Set[Tuple[str, str]] = set()
+    try:
+        data = await api._seed(db, args.seed, args.users, args.listings)
+        extras = await _seed_extras(db, data)
+        cases = api._cases(data) + _extra_cases(extras)
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://plans", timeout=60) as client:
+            for case in cases:
+                name = f"{case['router']}.{case['name']}"
+                token = current_case.set(name)
+                try:
+                    resp = await client.request(case["method"], case["url"], params=case["params"], json=case["json"], headers=case["headers"])
+                finally:
+                    current_case.reset(token)
+                if resp.status_code >= 500:
+                    violations.append(f"{name}: HTTP {resp.status_code}")
+
+        for (name, shape), command in recorder.commands.items():
+            command_name = next(iter(command))
+            explain = await db.command({"explain": command, "verbosity": "executionStats"})
+            result = analyze(command_name, command, explain, args.ratio_budget)
+            tolerated, keys = allowed_for(name, shape)
+            used.update(key for key in keys if tolerated & set(result["issues"]))
+            result["allowed"] = sorted(set(result["issues"]) & tolerated)
+            results.setdefault(name, {})[shape] = result
+            for issue in result["issues"]:
+                if issue not in tolerated:
+                    violations.append(f"{name}: {shape}: {issue} ({', '.join(result['stages'])}; {result['docs_examined']} examined / {result['returned']} returned)")
+    finally:
+        await app_db.close_db()
+    return {
+        "commit": api._git_commit(),
+        "ratio_budget": args.ratio_budget,
+        "cases": results,
+        "violations": violations,
+        "stale_allowances": [f"{case} {shape}" for case, shape in ALLOWED if (case, shape) not in used],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--listings", type=int, default=5000)
+    parser.add_argument("--db", help="database to wipe and seed (default: <MONGODB_DB>_plans)")
+    parser.add_argument("--ratio-budget", type=float, default=10, help="max documents examined per document returned")
+    args = parser.parse_args()
+    # The app logs with print(); keep stdout for the JSON result
+    with contextlib.redirect_stdout(sys.stderr):
+        result = asyncio.run(run(args))
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    for line in result["violations"]:
+        print(f"[plans] violation {line}", file=sys.stderr)
+    for line in result["stale_allowances"]:
+        print(f"[plans] stale allowance {line}", file=sys.stderr)
+    sys.exit(1 if result["violations"] else 0)